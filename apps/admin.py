@@ -1,6 +1,8 @@
 from django.contrib import admin
 
-from apps.models import Category, Product, SiteSettings, Order, Payment
+from apps import ledger
+from apps.forms import OrderAdminForm
+from apps.models import Category, Product, SiteSettings, Order, Payment, BalanceTransaction
 
 
 # Register your models here.
@@ -18,15 +20,30 @@ class SiteSettingsAdmin(admin.ModelAdmin):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    pass
+    # checks the stock under a lock on the product row, in the transaction the admin saves in
+    form = OrderAdminForm
 
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
     list_display = 'card_number', 'user', 'amount',  'status', 'receipt'
 
     def save_model(self, request, obj, form, change):
+        obj.save()
         if obj.status == Payment.PaymentStatus.CANCEL:
-            user = obj.user
-            user.balance += obj.amount
-            user.save()
-        obj.save()
\ No newline at end of file
+            ledger.refund_payment(obj)
+
+
+@admin.register(BalanceTransaction)
+class BalanceTransactionAdmin(admin.ModelAdmin):
+    list_display = 'user', 'kind', 'amount', 'order', 'payment', 'created_at'
+    list_filter = 'kind',
+    readonly_fields = 'user', 'kind', 'amount', 'order', 'payment', 'idempotency_key', 'created_at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
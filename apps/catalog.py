@@ -0,0 +1,58 @@
+import csv
+import json
+import sys
+from contextlib import contextmanager
+
+from apps.models import Category, Product
+
+FIELDS = {
+    'category': ('slug', 'name', 'icon'),
+    'product': ('slug', 'title', 'category', 'price', 'seller_price', 'quantity', 'image', 'description'),
+}
+MODELS = {
+    'category': Category,
+    'product': Product,
+}
+
+
+def guess_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+@contextmanager
+def open_stream(path, mode):
+    if path == '-':
+        yield sys.stdin if mode == 'r' else sys.stdout
+        return
+    with open(path, mode, newline='', encoding='utf-8') as stream:
+        yield stream
+
+
+def read_rows(stream, fmt):
+    """Yields ``(line, row)`` pairs without loading the whole file."""
+    if fmt == 'jsonl':
+        for line, text in enumerate(stream, 1):
+            if text.strip():
+                yield line, json.loads(text)
+    else:
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+
+
+class RowWriter:
+    def __init__(self, stream, fmt, fields):
+        self.fmt = fmt
+        self.stream = stream
+        self.fields = fields
+        if fmt == 'csv':
+            self.writer = csv.DictWriter(stream, fields)
+            self.writer.writeheader()
+
+    def write(self, row):
+        if self.fmt == 'csv':
+            self.writer.writerow(row)
+        else:
+            self.stream.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
@@ -0,0 +1,62 @@
+from collections import namedtuple
+from uuid import uuid4
+
+from django.core.cache import cache
+
+from apps.models import Category
+
+VERSION_KEY = 'categories:version'
+
+
+class CategoryEntry(namedtuple('CategoryEntry', 'id name slug icon')):
+    @property
+    def pk(self):
+        return self.id
+
+    def __str__(self):
+        return self.name
+
+
+class CategoryList(tuple):
+    def __new__(cls, version, categories):
+        instance = super().__new__(cls, categories)
+        instance.version = version
+        return instance
+
+    def __reduce__(self):
+        return CategoryList, (self.version, tuple(self))
+
+
+def build(version):
+    return CategoryList(version, [CategoryEntry(*row) for row in
+                                  Category.objects.order_by('pk').values_list('pk', 'name', 'slug', 'icon')])
+
+
+_local = None
+
+
+def get_categories():
+    """
+    Every category, kept per process and in the shared cache under a version
+    key that changes whenever a Category does.
+    """
+    global _local
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    if _local is not None and _local.version == version:
+        return _local
+    key = f'categories:{version}'
+    categories = cache.get(key)
+    if categories is None:
+        categories = build(version)
+        cache.set(key, categories, None)
+    _local = categories
+    return categories
+
+
+def invalidate():
+    global _local
+    _local = None
+    cache.set(VERSION_KEY, uuid4().hex, None)
@@ -0,0 +1,51 @@
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from apps import page_cache
+from apps.models import Product, Thread, SiteSettings
+
+Checkout = namedtuple('Checkout', 'product thread site')
+
+
+def cached_product(slug):
+    # keyed by the catalog version, which moves whenever a product is saved or deleted
+    key = f'checkout:{page_cache.catalog_version()}:{slug}'
+    product = cache.get(key)
+    if product is None:
+        product = Product.objects.filter(slug=slug).first()
+        if product is not None:
+            cache.set(key, product, page_cache.TIMEOUT)
+    return product
+
+
+def resolve(slug, thread_id=None):
+    """
+    Everything an order for ``slug`` needs, in at most one query: the thread
+    together with its product when a thread is given, otherwise the product,
+    which usually comes from the cache. A thread selling another product is
+    ignored.
+    """
+    thread = None
+    if thread_id and str(thread_id).isdigit():
+        thread = Thread.objects.select_related('product').filter(pk=thread_id, product__slug=slug).first()
+    product = thread.product if thread is not None else cached_product(slug)
+    return Checkout(product, thread, SiteSettings.load())
+
+
+aresolve = sync_to_async(resolve)
+
+
+def order_total(checkout, quantity=1):
+    price = checkout.thread.discount_price if checkout.thread else checkout.product.price
+    return price * quantity + checkout.site.delivery_price
+
+
+def place_order(order):
+    """Inserts the order; Order.save() runs it and its rollup updates in one transaction."""
+    order.save()
+    return order
+
+
+aplace_order = sync_to_async(place_order)
@@ -0,0 +1,20 @@
+from django.utils.functional import SimpleLazyObject
+
+from apps import page_cache
+from apps.models import SiteSettings
+
+
+def site_settings(request):
+    return {'site': SimpleLazyObject(SiteSettings.load)}
+
+
+def wishlist(request):
+    def load():
+        if not request.user.is_authenticated:
+            return frozenset()
+        return request.user.wishlist_products()
+    return {'wishlist_ids': SimpleLazyObject(load)}
+
+
+def catalog(request):
+    return {'catalog_version': SimpleLazyObject(page_cache.catalog_version)}
@@ -1,18 +1,24 @@
 import datetime
 import re
 
-from django.contrib.auth.hashers import check_password
 from django.core.exceptions import ValidationError
+from django.db import transaction, IntegrityError
 from django.forms import Form, ModelForm
 from django.forms.fields import CharField
 
-from apps.models import User, Order, Thread, SiteSettings, Payment
+from apps import throttle, inventory
+from apps.checkout import Checkout, order_total
+from apps.models import User, Order, Thread, SiteSettings, Payment, Product
 
 
 class AuthForm(Form):
     phone_number = CharField(max_length=255)
     password = CharField(max_length=8)
 
+    def __init__(self, *args, request=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ip = throttle.client_ip(request) if request is not None else ''
+
     def clean_phone_number(self):
         phone_number = self.cleaned_data.get("phone_number")
         return re.sub("/D", "", phone_number)
@@ -21,24 +27,35 @@ class AuthForm(Form):
         data = self.cleaned_data
         password = data.get("password")
         phone_number = data.get("phone_number")
-        query = User.objects.filter(phone_number=phone_number)
-        if query.exists():
-            user = query.first()
-            if check_password(password, user.password):
-                self.user = user
-            else:
-                raise ValidationError("Wrong Password!")
-        else:
-            user = self.save()
+        if not phone_number or not password:
+            return data
+        # refuse before hashing anything, so guessing costs the attacker and not us
+        if throttle.phone_throttle.is_blocked(phone_number) or throttle.ip_throttle.is_blocked(self.ip):
+            raise ValidationError("Urinishlar soni ko'payib ketdi, birozdan keyin qayta urinib ko'ring!")
+        user = User.objects.filter(phone_number=phone_number).first()
+        if user is None:
+            self.user = self.save()
+            if self.user is not None:
+                # every signup counts against the IP, so it cannot create accounts without limit
+                throttle.ip_throttle.fail(self.ip)
+                return data
+            # lost a signup race; the password has to match the account that won it
+            user = User.objects.filter(phone_number=phone_number).first()
+        if user is not None and user.check_password(password):
+            throttle.phone_throttle.reset(phone_number)
             self.user = user
-        return data
+            return data
+        throttle.phone_throttle.fail(phone_number)
+        throttle.ip_throttle.fail(self.ip)
+        raise ValidationError("Wrong Password!")
 
     def save(self):
         data = self.cleaned_data
-        user = User.objects.create(phone_number=data.get('phone_number'))
-        user.set_password(data.get('password'))
-        user.save()
-        return user
+        try:
+            with transaction.atomic():
+                return User.objects.create_user(data.get('phone_number'), data.get('password'))
+        except IntegrityError:
+            return None
 
 
 class ProfileModelForm(ModelForm):
@@ -76,10 +93,16 @@ class ChangePasswordForm(Form):
 
 class OrderModelForm(ModelForm):
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, checkout=None, **kwargs):
         super().__init__(*args, **kwargs)
+        self.checkout = checkout
         self.fields['total'].required = False
         self.fields['thread'].required = False
+        if checkout is not None:
+            # product and thread were resolved by the view; don't look them up again
+            del self.fields['product'], self.fields['thread']
+            self.instance.product = checkout.product
+            self.instance.thread = checkout.thread
 
     class Meta:
         model = Order
@@ -89,15 +112,39 @@ class OrderModelForm(ModelForm):
         phone_number = self.cleaned_data.get('phone_number')
         return re.sub('/D', "", phone_number)
 
-    def clean_total(self):
-        product = self.cleaned_data.get("product")
-        thread_id = self.data.get("thread", -1)
-        site = SiteSettings.objects.first()
-        total_price = product.price + site.delivery_price
-        thread = Thread.objects.filter(pk=thread_id).first()
-        if thread:
-            total_price -= thread.discount
-        return total_price
+    def clean(self):
+        data = super().clean()
+        checkout = self.checkout
+        if checkout is None:
+            product = data.get("product")
+            if product is None:
+                return data
+            thread = data.get("thread")
+            if thread is not None and thread.product_id != product.pk:
+                thread = data['thread'] = None
+            checkout = Checkout(product, thread, SiteSettings.load())
+        data['total'] = order_total(checkout)
+        return data
+
+
+class OrderAdminForm(ModelForm):
+    class Meta:
+        model = Order
+        fields = '__all__'
+
+    def clean(self):
+        data = super().clean()
+        product, quantity = data.get('product'), data.get('quantity')
+        if product is None or not quantity or not inventory.takes_stock(
+                self.instance, data.get('status'), quantity, product.pk):
+            return data
+        products = Product.objects.filter(pk=product.pk)
+        if transaction.get_connection().in_atomic_block:
+            # the admin validates and saves in one transaction, so no other order takes the units in between
+            products = products.select_for_update()
+        if inventory.available_for(self.instance, products.get()) < quantity:
+            raise ValidationError("Product soni yetarli emas!")
+        return data
 
 
 class ThreadModelForm(ModelForm):
@@ -172,8 +219,8 @@ class OrderUpdateModelForm(ModelForm):
         quantity = self.cleaned_data.get('quantity')
         if not quantity:
             quantity = order.quantity
-        site = SiteSettings.objects.first()
-        if order.product.quantity < quantity:
+        site = SiteSettings.load()
+        if inventory.available_for(order, order.product) < quantity:
             raise ValidationError("Product soni yetarli emas!")
 
         if order.thread:
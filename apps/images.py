@@ -0,0 +1,109 @@
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+from apps import page_cache
+from apps.models import Product, Payment, SiteSettings
+
+logger = logging.getLogger(__name__)
+
+config = getattr(settings, 'IMAGE_VARIANTS', {})
+WIDTHS = config.get('WIDTHS', (320, 640, 1024))
+QUALITY = config.get('QUALITY', 80)
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+# model -> (image field, JSON field holding its variants)
+FIELDS = {
+    Product: ('image', 'image_variants'),
+    Payment: ('receipt', 'receipt_variants'),
+    SiteSettings: ('competition_thumbnail', 'competition_thumbnail_variants'),
+}
+
+executor = ThreadPoolExecutor(max_workers=config.get('WORKERS', 2), thread_name_prefix='image-variants')
+
+
+def needs_variants(instance):
+    image_field, variants_field = FIELDS[type(instance)]
+    name = getattr(instance, image_field).name
+    variants = getattr(instance, variants_field) or {}
+    # an unset ImageField with a default like 'site/' names a directory
+    return bool(name) and not name.endswith('/') and variants.get('source') != name
+
+
+def render(image, width, fmt):
+    if image.width > width:
+        image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+    if fmt == 'JPEG' and image.mode != 'RGB':
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, fmt, quality=QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def generate_variants(name, storage=default_storage):
+    """
+    Resized WebP and JPEG copies of ``name`` stored as
+    ``variants/<hash>-<width>.<ext>``; a file already generated for the
+    same content is reused.
+    """
+    with storage.open(name, 'rb') as source:
+        data = source.read()
+    digest = hashlib.blake2b(data, digest_size=10).hexdigest()
+    image = ImageOps.exif_transpose(Image.open(BytesIO(data)))
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    widths = sorted({min(width, image.width) for width in WIDTHS})
+    variants = {'source': name, 'width': image.width, 'height': image.height}
+    for ext, fmt in FORMATS.items():
+        variants[ext] = {}
+        for width in widths:
+            path = f'variants/{digest[:2]}/{digest}-{width}.{ext}'
+            if not storage.exists(path):
+                path = storage.save(path, ContentFile(render(image, width, fmt)))
+            variants[ext][str(width)] = path
+    return variants
+
+
+def update_variants(model, pk, force=False):
+    image_field, variants_field = FIELDS[model]
+    instance = model.objects.filter(pk=pk).only(image_field, variants_field).first()
+    if instance is None or not (force or needs_variants(instance)):
+        return None
+    name = getattr(instance, image_field).name
+    if not default_storage.exists(name):
+        # e.g. generated data pointing at sample files; pages keep showing the original
+        logger.warning("Image %s of %s %s is missing, no variants generated", name, model.__name__, pk)
+        return None
+    variants = generate_variants(name)
+    # skip the write if another image was uploaded in the meantime
+    model.objects.filter(pk=pk, **{image_field: name}).update(**{variants_field: variants})
+    if model is SiteSettings:
+        SiteSettings.invalidate()
+    elif model is Product:
+        page_cache.invalidate()
+    return variants
+
+
+def run(model, pk):
+    try:
+        update_variants(model, pk)
+    except Exception:
+        logger.exception("Generating image variants for %s %s failed", model.__name__, pk)
+    finally:
+        close_old_connections()
+
+
+def schedule(instance):
+    """Queues variant generation for ``instance`` once the current transaction commits."""
+    if needs_variants(instance):
+        model, pk = type(instance), instance.pk
+        transaction.on_commit(lambda: executor.submit(run, model, pk))
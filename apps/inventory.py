@@ -0,0 +1,124 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from apps.models import Order, Product, StockReservation
+
+HOLD = timedelta(hours=getattr(settings, 'STOCK_RESERVATION_HOURS', 7 * 24))
+# statuses in which an order keeps its stock reserved
+HOLDING = Order.StatusType.READY_TO_DELIVERY, Order.StatusType.DELIVERING
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+def take(product_id, units, **changes):
+    """Conditional ``UPDATE``: applies ``changes`` only while ``units`` units are still unreserved."""
+    updated = Product.objects.filter(pk=product_id, quantity__gte=F('reserved') + units).update(**changes)
+    if not updated:
+        raise InsufficientStock
+
+
+def reserve(order):
+    """
+    Hold ``order.quantity`` units of its product. An existing hold for a
+    different product or amount is replaced; a matching one is kept.
+    """
+    with transaction.atomic():
+        current = StockReservation.objects.filter(order_id=order.pk).first()
+        if current is not None:
+            if (current.product_id, current.quantity) == (order.product_id, order.quantity):
+                return current
+            release(order)
+        try:
+            with transaction.atomic():
+                reservation = StockReservation.objects.create(
+                    order_id=order.pk, product_id=order.product_id, quantity=order.quantity,
+                    expires_at=timezone.now() + HOLD)
+        except IntegrityError:
+            # reserved by a concurrent save of the same order
+            return StockReservation.objects.get(order_id=order.pk)
+        take(order.product_id, order.quantity, reserved=F('reserved') + order.quantity)
+        return reservation
+
+
+def release(order):
+    reservation = StockReservation.objects.filter(order_id=order.pk).first()
+    # whoever deletes the row gives the stock back, so a hold is never released twice
+    if reservation is None or not StockReservation.objects.filter(pk=reservation.pk).delete()[0]:
+        return False
+    Product.objects.filter(pk=reservation.product_id).update(reserved=F('reserved') - reservation.quantity)
+    return True
+
+
+def commit(order):
+    """Turn the hold of a delivered order into a stock decrement."""
+    with transaction.atomic():
+        reservation = StockReservation.objects.filter(order_id=order.pk).first()
+        if reservation is not None and (reservation.product_id, reservation.quantity) == (
+                order.product_id, order.quantity):
+            if StockReservation.objects.filter(pk=reservation.pk).delete()[0]:
+                Product.objects.filter(pk=order.product_id).update(
+                    quantity=F('quantity') - order.quantity, reserved=F('reserved') - order.quantity)
+                return
+        release(order)
+        # delivered without (a matching) hold: take the units straight from free stock
+        take(order.product_id, order.quantity, quantity=F('quantity') - order.quantity)
+
+
+def remember_order(order):
+    """Called before an order is saved; keeps what its hold was based on."""
+    order._stock_key = order.loaded_value('status'), order.loaded_value('quantity'), order.loaded_value('product_id')
+
+
+def order_saved(order):
+    status = order.status
+    previous = getattr(order, '_stock_key', (None, None, None))
+    if previous == (status, order.quantity, order.product_id):
+        return
+    if order.product_id is None:
+        release(order)
+    elif status in HOLDING:
+        reserve(order)
+    elif status == Order.StatusType.DELIVERED:
+        if previous[0] != Order.StatusType.DELIVERED:
+            commit(order)
+    elif previous[0] in HOLDING:
+        release(order)
+
+
+def takes_stock(order, status, quantity, product_id):
+    """Whether saving ``order`` with these values needs free stock, i.e. order_saved may raise InsufficientStock."""
+    previous = (order.loaded_value('status'), order.loaded_value('quantity'), order.loaded_value('product_id'))
+    if product_id is None or previous == (status, quantity, product_id):
+        return False
+    if status in HOLDING:
+        return True
+    return status == Order.StatusType.DELIVERED and previous[0] != Order.StatusType.DELIVERED
+
+
+def available_for(order, product):
+    """Units ``order`` may use: the free stock plus what it already holds itself."""
+    held = StockReservation.objects.filter(order_id=order.pk, product_id=product.pk).values_list(
+        'quantity', flat=True).first() if order.pk else None
+    return product.quantity - product.reserved + (held or 0)
+
+
+def expire(now=None, batch_size=1000):
+    """Release holds past their ``expires_at``; returns how many were released."""
+    now = now or timezone.now()
+    released = 0
+    while True:
+        expired = list(StockReservation.objects.filter(expires_at__lt=now).order_by('expires_at')[:batch_size])
+        if not expired:
+            return released
+        for reservation in expired:
+            with transaction.atomic():
+                if StockReservation.objects.filter(pk=reservation.pk, expires_at__lt=now).delete()[0]:
+                    Product.objects.filter(pk=reservation.product_id).update(
+                        reserved=F('reserved') - reservation.quantity)
+                    released += 1
@@ -0,0 +1,135 @@
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import transaction, IntegrityError
+from django.db.models import F, Count, Q
+from django.utils import timezone
+
+from apps.models import Order, CompetitionScore, SiteSettings, Thread, User
+
+CACHE_KEY = 'competition:leaderboard'
+
+
+class Leaderboard:
+    """
+    Sellers sorted by delivered orders (desc), then user id.
+
+    ``keys`` mirrors the ordering as ``-count`` so ``bisect`` finds a rank in
+    O(log n); ties share the same rank.
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.keys = [-entry['order_count'] for entry in entries]
+        self.counts = {entry['user_id']: entry['order_count'] for entry in entries}
+
+    def top(self, n=None):
+        return self.entries[:n] if n else self.entries
+
+    def rank(self, user_id):
+        count = self.counts.get(user_id)
+        if count is None:
+            return None
+        return bisect_left(self.keys, -count) + 1
+
+    def count(self, user_id):
+        return self.counts.get(user_id, 0)
+
+
+def get_leaderboard():
+    board = cache.get(CACHE_KEY)
+    if board is None:
+        rows = CompetitionScore.objects.filter(delivered_count__gt=0).order_by('-delivered_count', 'user_id').values(
+            'user_id', 'user__first_name', 'user__last_name', order_count=F('delivered_count'))
+        board = Leaderboard([{
+            'user_id': row['user_id'],
+            'first_name': row['user__first_name'],
+            'last_name': row['user__last_name'],
+            'order_count': row['order_count'],
+        } for row in rows])
+        cache.set(CACHE_KEY, board, None)
+    return board
+
+
+def invalidate():
+    cache.delete(CACHE_KEY)
+
+
+def competition_window():
+    site = SiteSettings.load()
+    if site is None:
+        return None, None
+    return site.competition_start, site.competition_finish
+
+
+def in_window(moment, window=None):
+    if moment is None:
+        return False
+    start, finish = window or competition_window()
+    day = timezone.localdate(moment)
+    return (start is None or start <= day) and (finish is None or day <= finish)
+
+
+def bump(thread_id, delta):
+    owner_id = Thread.objects.filter(pk=thread_id).values_list('owner_id', flat=True).first()
+    if owner_id is None:
+        return
+    query = CompetitionScore.objects.filter(user_id=owner_id)
+    if not query.update(delivered_count=F('delivered_count') + delta) and delta > 0:
+        try:
+            with transaction.atomic():
+                CompetitionScore.objects.create(user_id=owner_id, delivered_count=delta)
+        except IntegrityError:
+            query.update(delivered_count=F('delivered_count') + delta)
+    invalidate()
+
+
+def remember_order(order):
+    """
+    Called before an order is saved or deleted: stamps ``delivered_at`` on the
+    transition into DELIVERED and keeps the thread the order is counted for.
+    """
+    was_delivered = order.loaded_value('status') == Order.StatusType.DELIVERED
+    if order.status == Order.StatusType.DELIVERED and not was_delivered:
+        order.delivered_at = timezone.now()
+    elif order.status != Order.StatusType.DELIVERED:
+        order.delivered_at = None
+    counted = was_delivered and in_window(order.loaded_value('delivered_at'))
+    order._leaderboard_thread_id = order.loaded_value('thread_id') if counted else None
+
+
+def order_saved(order):
+    old_thread_id = getattr(order, '_leaderboard_thread_id', None)
+    new_thread_id = None
+    if order.status == Order.StatusType.DELIVERED and in_window(order.delivered_at):
+        new_thread_id = order.thread_id
+    if old_thread_id != new_thread_id:
+        if old_thread_id:
+            bump(old_thread_id, -1)
+        if new_thread_id:
+            bump(new_thread_id, 1)
+
+
+def order_deleted(order):
+    thread_id = getattr(order, '_leaderboard_thread_id', None)
+    if thread_id:
+        bump(thread_id, -1)
+
+
+def rebuild(batch_size=1000, window=None):
+    """``window`` is (start, finish); by default the one of the cached site settings."""
+    start, finish = window or competition_window()
+    delivered = Q(threads__orders__status=Order.StatusType.DELIVERED, threads__orders__delivered_at__isnull=False)
+    if start:
+        delivered &= Q(threads__orders__delivered_at__date__gte=start)
+    if finish:
+        delivered &= Q(threads__orders__delivered_at__date__lte=finish)
+    rows = User.objects.annotate(delivered_count=Count('threads__orders', filter=delivered)).filter(
+        delivered_count__gt=0).values_list('pk', 'delivered_count')
+    with transaction.atomic():
+        CompetitionScore.objects.all().delete()
+        CompetitionScore.objects.bulk_create(
+            [CompetitionScore(user_id=user_id, delivered_count=count) for user_id, count in rows],
+            batch_size=batch_size)
+    invalidate()
+    return CompetitionScore.objects.count()
@@ -0,0 +1,59 @@
+from django.db import transaction, IntegrityError
+from django.db.models import F
+
+from apps.models import BalanceTransaction, User
+
+
+class InsufficientBalance(Exception):
+    pass
+
+
+def post(user_id, amount, kind, key, order=None, payment=None, require_funds=False):
+    """
+    Append a ledger entry and apply it to ``User.balance`` in one transaction.
+
+    ``key`` is unique across the ledger: posting the same key twice is a no-op
+    and returns ``None``; any other integrity error is raised. The balance is changed with a single conditional
+    ``UPDATE ... SET balance = balance + amount`` so concurrent posts cannot
+    overwrite each other.
+    """
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                entry = BalanceTransaction.objects.create(
+                    user_id=user_id, amount=amount, kind=kind, idempotency_key=key, order=order, payment=payment)
+        except IntegrityError:
+            if BalanceTransaction.objects.filter(idempotency_key=key).exists():
+                return None
+            raise
+        query = User.objects.filter(pk=user_id)
+        if require_funds:
+            query = query.filter(balance__gte=-amount)
+        if not query.update(balance=F('balance') + amount):
+            raise InsufficientBalance
+        return entry
+
+
+def credit_delivered_order(order):
+    thread = order.thread
+    amount = (thread.product.seller_price - thread.discount) * order.quantity
+    return post(thread.owner_id, amount, BalanceTransaction.Kind.ORDER_DELIVERED, f'order:{order.pk}:delivered',
+                order=order)
+
+
+def debit_payment(payment):
+    return post(payment.user_id, -payment.amount, BalanceTransaction.Kind.PAYMENT, f'payment:{payment.pk}',
+                payment=payment, require_funds=True)
+
+
+def refund_payment(payment):
+    """
+    Give back what ``debit_payment`` took for ``payment``: nothing if it was
+    never debited, otherwise exactly the debited amount to the debited user.
+    """
+    debit = BalanceTransaction.objects.filter(idempotency_key=f'payment:{payment.pk}',
+                                              kind=BalanceTransaction.Kind.PAYMENT).first()
+    if debit is None:
+        return None
+    return post(debit.user_id, -debit.amount, BalanceTransaction.Kind.PAYMENT_REFUND,
+                f'payment:{payment.pk}:refund', payment=payment)
@@ -0,0 +1,151 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from time import perf_counter
+from urllib.parse import urlsplit
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+
+DEFAULT_PATHS = [
+    '/district_list?region_id=1',
+    '/api/regions/',
+    '/api/region-orders/',
+]
+
+
+def percentile(latencies, fraction):
+    return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000
+
+
+def wsgi_request(handler, path):
+    url = urlsplit(path)
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'SCRIPT_NAME': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'localhost',
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.input': BytesIO(),
+        'wsgi.errors': BytesIO(),
+        'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    status = []
+    start = perf_counter()
+    response = handler(environ, lambda code, headers, exc_info=None: status.append(code))
+    try:
+        for _ in response:
+            pass
+    finally:
+        response.close()
+    return perf_counter() - start, int(status[0].split()[0])
+
+
+async def asgi_request(handler, path):
+    url = urlsplit(path)
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': url.path,
+        'raw_path': url.path.encode(),
+        'query_string': url.query.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'localhost')],
+        'client': ('127.0.0.1', 50000),
+        'server': ('localhost', 80),
+    }
+    done = asyncio.Event()
+    messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+    status = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif not message.get('more_body'):
+            done.set()
+
+    start = perf_counter()
+    await handler(scope, receive, send)
+    done.set()
+    return perf_counter() - start, status[0]
+
+
+class Command(BaseCommand):
+    help = "Compare in-process WSGI and ASGI throughput and latency at several concurrency levels"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', dest='paths', help="Path to request (repeatable)")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per path and concurrency level")
+        parser.add_argument('--concurrency', default='1,8,32', help="Comma separated concurrency levels")
+        parser.add_argument('--output', help="Also write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or DEFAULT_PATHS
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        total = options['requests']
+        wsgi, asgi = WSGIHandler(), ASGIHandler()
+        results = []
+        self.stdout.write(f"{'path':32} {'server':6} {'conc':>5} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6}")
+        for path in paths:
+            for level in levels:
+                for server, run in (('wsgi', self.run_wsgi), ('asgi', self.run_asgi)):
+                    elapsed, timings = run(wsgi if server == 'wsgi' else asgi, path, total, level)
+                    latencies = sorted(latency for latency, _ in timings)
+                    row = {
+                        'path': path,
+                        'server': server,
+                        'concurrency': level,
+                        'requests_per_second': round(total / elapsed, 1),
+                        'p50_ms': round(percentile(latencies, 0.50), 2),
+                        'p99_ms': round(percentile(latencies, 0.99), 2),
+                        'errors': sum(status >= 400 for _, status in timings),
+                    }
+                    results.append(row)
+                    self.stdout.write(
+                        f"{path[:32]:32} {server:6} {level:>5} {row['requests_per_second']:>9} "
+                        f"{row['p50_ms']:>8} {row['p99_ms']:>8} {row['errors']:>6}")
+        if options['output']:
+            with open(options['output'], 'w') as stream:
+                json.dump(results, stream, indent=2)
+
+    def run_wsgi(self, handler, path, total, level):
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            timings = list(pool.map(lambda _: wsgi_request(handler, path), range(total)))
+        return perf_counter() - start, timings
+
+    def run_asgi(self, handler, path, total, level):
+        async def main():
+            queue = list(range(total))
+            timings = []
+
+            async def worker():
+                while queue:
+                    queue.pop()
+                    timings.append(await asgi_request(handler, path))
+
+            await asyncio.gather(*(worker() for _ in range(level)))
+            return timings
+
+        start = perf_counter()
+        timings = asyncio.run(main())
+        return perf_counter() - start, timings
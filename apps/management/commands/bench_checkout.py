@@ -0,0 +1,125 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, AsyncClient, override_settings
+from django.urls import reverse
+
+from apps.models import Order, Product, Thread
+from apps.submissions import issue_token
+
+PHONE = '9000'  # prefix of the benchmark's phone numbers, so its orders can be removed afterwards
+
+
+def percentile(latencies, fraction):
+    return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000
+
+
+def split(total, parts):
+    return [total // parts + (i < total % parts) for i in range(parts)]
+
+
+class Command(BaseCommand):
+    help = "Measure orders/s of the checkout endpoint under concurrent submission (WSGI threads and ASGI tasks)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=200, help="Orders per server and concurrency level")
+        parser.add_argument('--concurrency', default='1,8,32', help="Comma separated concurrency levels")
+        parser.add_argument('--product', help="Slug of the product to order (default: the newest one)")
+        parser.add_argument('--thread', type=int, help="Order through this thread")
+        parser.add_argument('--keep', action='store_true', help="Keep the created orders")
+        parser.add_argument('--output', help="Also write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        # AsyncClient always sends "Host: testserver"; every order is a distinct buyer, so no limits apply
+        submissions = {**settings.ORDER_SUBMISSIONS, 'PHONE': (10 ** 9, 60), 'IP': (10 ** 9, 60)}
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], ORDER_SUBMISSIONS=submissions):
+            self.bench(options)
+
+    def bench(self, options):
+        thread = Thread.objects.select_related('product').filter(pk=options['thread']).first() \
+            if options['thread'] else None
+        product = thread.product if thread else Product.objects.filter(
+            **({'slug': options['product']} if options['product'] else {})).order_by('-pk').first()
+        if product is None:
+            raise CommandError("No product to order")
+        path = reverse('order-submit', args=[product.slug])
+        data = {'fullname': 'Benchmark', 'product': product.pk}
+        if thread:
+            data['thread'] = thread.pk
+        self.product = product
+        self.sequence = count()
+        first_pk = (Order.objects.order_by('-pk').values_list('pk', flat=True).first() or 0)
+
+        results = []
+        total = options['orders']
+        self.stdout.write(f"{'server':6} {'conc':>5} {'orders/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6}")
+        try:
+            for level in [int(level) for level in options['concurrency'].split(',')]:
+                for server, run in (('wsgi', self.run_wsgi), ('asgi', self.run_asgi)):
+                    elapsed, timings = run(path, data, total, level)
+                    latencies = sorted(latency for latency, _ in timings)
+                    row = {
+                        'server': server,
+                        'concurrency': level,
+                        'orders_per_second': round(total / elapsed, 1),
+                        'p50_ms': round(percentile(latencies, 0.50), 2),
+                        'p99_ms': round(percentile(latencies, 0.99), 2),
+                        'errors': sum(status != 200 for _, status in timings),
+                    }
+                    results.append(row)
+                    self.stdout.write(f"{server:6} {level:>5} {row['orders_per_second']:>9} {row['p50_ms']:>8} "
+                                      f"{row['p99_ms']:>8} {row['errors']:>6}")
+        finally:
+            if not options['keep']:
+                # one by one, so the order signals take them out of the rollups again
+                for order in Order.objects.filter(pk__gt=first_pk, phone_number__startswith=PHONE).iterator():
+                    order.delete()
+        if options['output']:
+            with open(options['output'], 'w') as stream:
+                json.dump(results, stream, indent=2)
+
+    def form(self, data):
+        # what a freshly rendered form would post
+        return {**data, 'phone_number': f'{PHONE}{next(self.sequence):05}', 'token': issue_token(self.product)}
+
+    def run_wsgi(self, path, data, total, level):
+        def worker(orders):
+            client = Client(raise_request_exception=False)
+            timings = []
+            try:
+                for _ in range(orders):
+                    start = perf_counter()
+                    response = client.post(path, self.form(data))
+                    timings.append((perf_counter() - start, response.status_code))
+            finally:
+                connections.close_all()
+            return timings
+
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            timings = [timing for part in pool.map(worker, split(total, level)) for timing in part]
+        return perf_counter() - start, timings
+
+    def run_asgi(self, path, data, total, level):
+        async def worker(orders):
+            client = AsyncClient(raise_request_exception=False)
+            timings = []
+            for _ in range(orders):
+                start = perf_counter()
+                response = await client.post(path, self.form(data))
+                timings.append((perf_counter() - start, response.status_code))
+            return timings
+
+        async def main():
+            parts = await asyncio.gather(*(worker(orders) for orders in split(total, level)))
+            return [timing for part in parts for timing in part]
+
+        start = perf_counter()
+        timings = asyncio.run(main())
+        return perf_counter() - start, timings
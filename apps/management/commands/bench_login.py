@@ -0,0 +1,78 @@
+from time import perf_counter
+
+from django.contrib.auth.hashers import check_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from apps import throttle
+from apps.forms import AuthForm
+from apps.models import User
+
+
+def legacy_login(phone_number, password, request):
+    # the auth path before the redesign: exists() + first(), create() + set_password() + save()
+    query = User.objects.filter(phone_number=phone_number)
+    if query.exists():
+        user = query.first()
+        if not check_password(password, user.password):
+            raise ValidationError("Wrong Password!")
+        return user
+    user = User.objects.create(phone_number=phone_number)
+    user.set_password(password)
+    user.save()
+    return user
+
+
+def current_login(phone_number, password, request):
+    form = AuthForm({'phone_number': phone_number, 'password': password}, request=request)
+    if not form.is_valid():
+        raise ValidationError(form.errors)
+    return form.user
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Measure login, signup and brute-force throughput of the old and the current auth path"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attempts', type=int, default=50, help="Attempts per scenario")
+
+    def handle(self, *args, **options):
+        attempts = options['attempts']
+        self.stdout.write(f"{'path':8} {'scenario':12} {'attempts/s':>10} {'queries':>8} {'refused':>8}")
+        for name, login in (('before', legacy_login), ('after', current_login)):
+            try:
+                with transaction.atomic():
+                    self.run(name, login, attempts)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def run(self, name, login, attempts):
+        request = RequestFactory().post('/auth', REMOTE_ADDR=f'198.51.100.{1 if name == "before" else 2}')
+        User.objects.create_user('bench-user', 'secret')
+        scenarios = {
+            'login': lambda i: ('bench-user', 'secret'),
+            'signup': lambda i: (f'bench-new-{i}', 'secret'),
+            'brute-force': lambda i: ('bench-user', f'guess{i}'),
+        }
+        for scenario, credentials in scenarios.items():
+            refused = 0
+            with CaptureQueriesContext(connection) as queries:
+                start = perf_counter()
+                for i in range(attempts):
+                    try:
+                        login(*credentials(i), request)
+                    except ValidationError:
+                        refused += 1
+                elapsed = perf_counter() - start
+            self.stdout.write(f"{name:8} {scenario:12} {attempts / elapsed:>10.1f} "
+                              f"{len(queries) / attempts:>8.1f} {refused:>8}")
+        throttle.phone_throttle.reset('bench-user')
+        throttle.ip_throttle.reset(throttle.client_ip(request))
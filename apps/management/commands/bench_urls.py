@@ -0,0 +1,161 @@
+import json
+import subprocess
+from statistics import mean
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from apps import urls
+from apps.models import User, Product, Thread, Order, Payment, Category
+
+# (label, url name, kwargs factory, query string, who is logged in)
+CASES = [
+    ('home (anonymous)', 'home', None, '', 'anonymous'),
+    ('home', 'home', None, '', 'user'),
+    ('product-list', 'product-list', None, 'category_slug={category}', 'anonymous'),
+    ('district-list', 'district-list', None, 'region_id=1', 'anonymous'),
+    ('region-tree', 'region-tree', None, '', 'anonymous'),
+    ('search', 'search', None, 'search=telefon', 'anonymous'),
+    ('auth', 'auth', None, '', 'anonymous'),
+    ('profile', 'profile', None, '', 'user'),
+    ('change-password', 'change-password', None, '', 'user'),
+    ('order-list', 'order-list', None, '', 'user'),
+    ('order-form', 'order-form', lambda data: {'slug': data['product'].slug}, '', 'user'),
+    ('wishlist', 'wish', None, '', 'user'),
+    ('market-list', 'market-list', None, '', 'user'),
+    ('thread-form', 'thread-form', None, '', 'user'),
+    ('thread-list', 'thread-list', None, '', 'user'),
+    ('thread', 'thread', lambda data: {'pk': data['thread'].pk}, '', 'anonymous'),
+    ('statistics', 'thread-statistic', None, 'period=monthly', 'user'),
+    ('competition', 'thread-competition', None, '', 'user'),
+    ('pay-form', 'pay-form', None, '', 'user'),
+    ('operator queue', 'operator-orders', None, 'status=new', 'operator'),
+    ('operator queue (delivered)', 'operator-orders', None, 'status=delivered', 'operator'),
+    ('order-detail', 'order-detail', lambda data: {'pk': data['order'].pk}, '', 'operator'),
+    ('diagram', 'diagram', None, '', 'user'),
+    ('region-orders-data', 'region-orders-data', None, '', 'user'),
+    ('page-cache-stats', 'page-cache-stats', None, '', 'staff'),
+    ('metrics', 'metrics', None, '', 'staff'),
+]
+# endpoints that change data; they are not timed
+SKIPPED = {'logout', 'order-submit', 'wishlist', 'operator-claim'}
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def load_data():
+    """The rows the pages in CASES are requested for."""
+    return {
+        'user': User.objects.filter(role=User.RoleType.USER, threads__isnull=False).first(),
+        'operator': User.objects.filter(role=User.RoleType.OPERATOR).first(),
+        'staff': User.objects.filter(is_staff=True).first(),
+        'product': Product.objects.order_by('-pk').first(),
+        'thread': Thread.objects.order_by('-pk').first(),
+        'order': Order.objects.order_by('-pk').first(),
+        'category': Category.objects.order_by('pk').first(),
+    }
+
+
+def case_path(name, kwargs, query, data):
+    path = reverse(name, kwargs=kwargs(data) if kwargs else None)
+    if query:
+        path += '?' + query.format(category=data['category'].slug if data['category'] else '')
+    return path
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Time every page in apps/urls.py against the current database and write the results as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20, help="Timed requests per page, after one warm-up")
+        parser.add_argument('--only', action='append', help="Only pages whose label contains this (repeatable)")
+        parser.add_argument('--output', help="Write the results as JSON to this file")
+        parser.add_argument('--compare', help="A previous --output file to compare against")
+
+    def handle(self, *args, **options):
+        data = load_data()
+        uncovered = {pattern.name for pattern in urls.urlpatterns} - {case[1] for case in CASES} - SKIPPED
+        if uncovered:
+            self.stderr.write(f"Not benchmarked: {', '.join(sorted(uncovered))}")
+
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+        clients = {}
+        results = []
+        self.stdout.write(f"{'page':28} {'status':>6} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8} {'queries':>8} {'KB':>7}")
+        for label, name, kwargs, query, who in CASES:
+            if options['only'] and not any(part in label for part in options['only']):
+                continue
+            if who != 'anonymous' and data[who] is None:
+                self.stderr.write(f"{label}: skipped, no {who} in the database")
+                continue
+            if kwargs and None in [data[key] for key in ('product', 'thread', 'order')]:
+                self.stderr.write(f"{label}: skipped, generate some data first")
+                continue
+            if who not in clients:
+                clients[who] = Client(HTTP_HOST=host, raise_request_exception=False)
+                if who != 'anonymous':
+                    clients[who].force_login(data[who])
+            results.append(self.time(clients[who], label, case_path(name, kwargs, query, data), options['requests']))
+
+        baseline = {}
+        if options['compare']:
+            try:
+                with open(options['compare']) as stream:
+                    baseline = {row['label']: row for row in json.load(stream)['results']}
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f"Cannot read {options['compare']}: {exc}")
+        for row in results:
+            line = (f"{row['label'][:28]:28} {row['status']:>6} {row['p50_ms']:>8} {row['p95_ms']:>8} "
+                    f"{row['mean_ms']:>8} {row['queries']:>8} {row['bytes'] / 1024:>7.1f}")
+            before = baseline.get(row['label'])
+            if before and before['p50_ms']:
+                line += f"  p50 {(row['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100:+.0f}%"
+                line += f", queries {row['queries'] - before['queries']:+d}"
+            self.stdout.write(line)
+
+        if options['output']:
+            report = {
+                'commit': git_commit(),
+                'created_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'rows': {model.__name__: model.objects.count() for model in (User, Product, Thread, Order, Payment)},
+                'results': results,
+            }
+            with open(options['output'], 'w') as stream:
+                json.dump(report, stream, indent=2)
+
+    def time(self, client, label, path, total):
+        client.get(path)
+        timings = []
+        for _ in range(total):
+            with CaptureQueriesContext(connection) as queries:
+                start = perf_counter()
+                response = client.get(path)
+                timings.append((perf_counter() - start) * 1000)
+        timings.sort()
+        return {
+            'label': label,
+            'path': path,
+            'status': response.status_code,
+            'p50_ms': round(percentile(timings, 0.50), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'mean_ms': round(mean(timings), 2),
+            'queries': len(queries),
+            'bytes': len(response.content),
+        }
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps import inventory
+
+
+class Command(BaseCommand):
+    help = "Release stock reservations that are past their expiry (run it from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        released = inventory.expire(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired reservations"))
@@ -0,0 +1,97 @@
+import re
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps import order_queue
+from apps.checkout import resolve
+from apps.management.commands.bench_urls import CASES, load_data, case_path
+from apps.models import Order, Payment, Thread, Category, Region, District, SiteSettings, CompetitionScore
+
+# statements behind endpoints that change data, so they are not requested
+QUERIES = [
+    ('order claim queue', lambda data: list(
+        Order.objects.filter(status=Order.StatusType.NEW).filter(order_queue.claimable(timezone.now())).order_by(
+            'created_at', 'id').values_list('pk', flat=True)[:5])),
+    ('checkout', lambda data: resolve(data['thread'].product.slug, data['thread'].pk)),
+    ('payments of a user', lambda data: list(Payment.objects.filter(user=data['user']))),
+    ('threads of a user', lambda data: list(Thread.objects.filter(owner=data['user']))),
+    ('delivered orders of a thread', lambda data: Order.objects.filter(
+        thread=data['thread'], status=Order.StatusType.DELIVERED).count()),
+]
+# read whole on purpose: a few hundred rows at most
+SMALL_TABLES = {'socialaccount_socialapp'} | {
+    model._meta.db_table for model in (Category, Region, District, SiteSettings, CompetitionScore)}
+
+SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the queries behind each page and the hot write paths, and flag full table scans"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', action='append', help="Only cases whose label contains this (repeatable)")
+        parser.add_argument('--plans', action='store_true', help="Print the full plan of every statement")
+        parser.add_argument('--strict', action='store_true', help="Fail when a full scan is found")
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f"EXPLAIN parsing is not implemented for {connection.vendor}")
+        data = load_data()
+        if None in [data[key] for key in ('user', 'product', 'thread', 'order')]:
+            raise CommandError("Generate some data first (generate_data)")
+
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+        clients = {}
+        cases = []
+        for label, name, kwargs, query, who in CASES:
+            if data.get(who, True) is None:
+                self.stderr.write(f"{label}: skipped, no {who} in the database")
+                continue
+            if who not in clients:
+                clients[who] = Client(HTTP_HOST=host, raise_request_exception=False)
+                if who != 'anonymous':
+                    clients[who].force_login(data[who])
+            path = case_path(name, kwargs, query, data)
+            cases.append((label, lambda data, client=clients[who], path=path: client.get(path)))
+        cases += QUERIES
+
+        flagged = 0
+        for label, run in cases:
+            if options['only'] and not any(part in label for part in options['only']):
+                continue
+            run(data)  # warm caches, so only the steady-state queries are explained
+            with CaptureQueriesContext(connection) as queries:
+                run(data)
+            statements = list(dict.fromkeys(query['sql'] for query in queries if query['sql'].lstrip().upper().startswith(
+                ('SELECT', 'UPDATE', 'DELETE'))))
+            scans = []
+            for sql in statements:
+                plan = self.explain(sql)
+                tables = [table for table in self.full_scans(plan) if table not in SMALL_TABLES]
+                if tables:
+                    scans.append((tables, sql))
+                if options['plans']:
+                    self.stdout.write(f"  {sql}\n" + "\n".join(f"    {line}" for line in plan))
+            flagged += len(scans)
+            style = self.style.WARNING if scans else self.style.SUCCESS
+            self.stdout.write(style(f"{label:32} {len(statements):>3} statements, {len(scans)} full scans"))
+            for tables, sql in scans:
+                self.stdout.write(f"  FULL SCAN {', '.join(tables)}: {sql[:200]}")
+        if flagged and options['strict']:
+            raise CommandError(f"{flagged} statements scan a whole table")
+
+    def explain(self, sql):
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def full_scans(self, plan):
+        pattern = SQLITE_SCAN if connection.vendor == 'sqlite' else POSTGRES_SCAN
+        return [match.group(1) for match in map(pattern.search, plan) if match and match.group(1) != 'CONSTANT']
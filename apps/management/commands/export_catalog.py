@@ -0,0 +1,36 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from apps.catalog import FIELDS, MODELS, RowWriter, guess_format, open_stream
+
+
+class Command(BaseCommand):
+    help = "Export categories or products to a CSV or JSONL file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(MODELS))
+        parser.add_argument('path', nargs='?', default='-', help="File to write, or - for stdout")
+        parser.add_argument('--format', choices=['csv', 'jsonl'])
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        model_name = options['model']
+        fields = FIELDS[model_name]
+        query = MODELS[model_name].objects.order_by('pk')
+        columns = list(fields)
+        if 'category' in fields:
+            columns[fields.index('category')] = 'category__slug'
+        start = perf_counter()
+        total = 0
+        with open_stream(options['path'], 'w') as stream:
+            writer = RowWriter(stream, guess_format(options['path'], options['format']), fields)
+            for values in query.values_list(*columns).iterator(chunk_size=options['chunk_size']):
+                row = dict(zip(fields, values))
+                if row.get('image'):
+                    row['image'] = row['image'].rsplit('/', 1)[-1]
+                writer.write(row)
+                total += 1
+        if options['path'] != '-':
+            self.stdout.write(self.style.SUCCESS(
+                f"Exported {total} {model_name} rows in {perf_counter() - start:.2f}s"))
@@ -0,0 +1,305 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from time import perf_counter
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from apps import page_cache, regions, inventory, categories
+from apps.models import Region, District, User, Category, Product, Thread, Order, Payment, SiteSettings, \
+    SlugCounters, StockReservation
+
+REGIONS = {
+    'Toshkent shahri': ['Chilonzor', 'Yunusobod', 'Mirzo Ulugʻbek', 'Yakkasaroy', 'Sergeli', 'Olmazor', 'Shayxontohur'],
+    'Toshkent viloyati': ['Zangiota', 'Qibray', 'Chirchiq', 'Bekobod', 'Yangiyoʻl', 'Parkent'],
+    'Andijon': ['Asaka', 'Xonobod', 'Shahrixon', 'Baliqchi', 'Paxtaobod'],
+    'Buxoro': ['Gʻijduvon', 'Kogon', 'Vobkent', 'Qorakoʻl', 'Romitan'],
+    'Fargʻona': ['Margʻilon', 'Qoʻqon', 'Quva', 'Rishton', 'Oltiariq'],
+    'Jizzax': ['Zomin', 'Gʻallaorol', 'Forish', 'Paxtakor'],
+    'Xorazm': ['Urganch', 'Xiva', 'Gurlan', 'Hazorasp', 'Shovot'],
+    'Namangan': ['Chust', 'Kosonsoy', 'Pop', 'Toʻraqoʻrgʻon', 'Uchqoʻrgʻon'],
+    'Navoiy': ['Zarafshon', 'Karmana', 'Nurota', 'Qiziltepa'],
+    'Qashqadaryo': ['Qarshi', 'Shahrisabz', 'Kitob', 'Gʻuzor', 'Koson'],
+    'Qoraqalpogʻiston': ['Nukus', 'Xoʻjayli', 'Beruniy', 'Toʻrtkoʻl', 'Qoʻngʻirot'],
+    'Samarqand': ['Urgut', 'Kattaqoʻrgʻon', 'Ishtixon', 'Pastdargʻom', 'Bulungʻur'],
+    'Sirdaryo': ['Guliston', 'Yangiyer', 'Boyovut', 'Sirdaryo'],
+    'Surxondaryo': ['Termiz', 'Denov', 'Sherobod', 'Sariosiyo', 'Boysun'],
+}
+CATEGORIES = {
+    'Telefonlar': ['Samsung Galaxy', 'iPhone', 'Redmi Note', 'Honor', 'Realme', 'Tecno Spark'],
+    'Maishiy texnika': ['Changyutgich', 'Blender', 'Choynak', 'Dazmol', 'Mikrotoʻlqinli pech', 'Fen'],
+    'Kompyuterlar': ['Noutbuk', 'Monitor', 'Klaviatura', 'Sichqoncha', 'Quloqchin', 'Planshet'],
+    'Kiyimlar': ['Koʻylak', 'Shim', 'Kurtka', 'Krossovka', 'Futbolka', 'Sviter'],
+    'Uy va bogʻ': ['Gilam', 'Parda', 'Yostiq', 'Choyshab', 'Idish toʻplami', 'Lampa'],
+    'Goʻzallik': ['Atir', 'Krem', 'Shampun', 'Soch quritgich', 'Pomada', 'Maska'],
+    'Bolalar uchun': ['Oʻyinchoq', 'Konstruktor', 'Kolyaska', 'Velosiped', 'Qoʻgʻirchoq', 'Kitob'],
+    'Sport': ['Gantel', 'Yugurish yoʻlagi', 'Toʻp', 'Sport sumka', 'Trenajor', 'Velosiped'],
+}
+VARIANTS = ['', 'Pro', 'Max', 'Lite', 'Plus', 'Mini', '2024', 'Original', 'Premium']
+COLORS = ['qora', 'oq', 'koʻk', 'qizil', 'kulrang', 'yashil', 'oltin rang']
+FIRST_NAMES = ['Aziz', 'Dilshod', 'Jasur', 'Sardor', 'Bekzod', 'Malika', 'Dilnoza', 'Gulnora', 'Nodira', 'Shahzoda',
+               'Otabek', 'Sherzod', 'Umida', 'Kamola', 'Rustam', 'Feruza', 'Sanjar', 'Zarina', 'Akmal', 'Laylo']
+LAST_NAMES = ['Karimov', 'Rahimov', 'Yusupov', 'Aliyev', 'Toshmatov', 'Ergashev', 'Nazarov', 'Qodirov', 'Usmonov',
+              'Saidov', 'Mirzayev', 'Xolmatov', 'Abdullayev', 'Jurayev', 'Sobirov']
+# rough share of orders per status
+STATUS_WEIGHTS = {
+    Order.StatusType.NEW: 10,
+    Order.StatusType.READY_TO_DELIVERY: 8,
+    Order.StatusType.DELIVERING: 7,
+    Order.StatusType.DELIVERED: 45,
+    Order.StatusType.NOT_CALL: 8,
+    Order.StatusType.CANCELED: 12,
+    Order.StatusType.ARCHIVED: 10,
+}
+ROLE_WEIGHTS = {
+    User.RoleType.USER: 97,
+    User.RoleType.OPERATOR: 2,
+    User.RoleType.DELIVER: 0.9,
+    User.RoleType.ADMIN: 0.1,
+}
+PHONE_PREFIX = '99800'  # no real operator code, so generated users never clash with real ones
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Lets bulk_create keep the created_at / updated_at values set on the objects."""
+    fields = [field for model in models for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = "Fill the database with realistic volumes of users, products, threads, orders and payments"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--products', type=int, default=50_000)
+        parser.add_argument('--threads', type=int, default=20_000)
+        parser.add_argument('--orders', type=int, default=1_000_000)
+        parser.add_argument('--payments', type=int, default=20_000)
+        parser.add_argument('--days', type=int, default=365, help="Spread orders over this many past days")
+        parser.add_argument('--scale', type=float, default=1.0, help="Multiply every volume, e.g. 0.01 for a quick run")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.days = options['days']
+        scale = options['scale']
+        count = {name: max(1, int(options[name] * scale))
+                 for name in ('users', 'products', 'threads', 'orders', 'payments')}
+        start = perf_counter()
+
+        self.step("regions", self.create_regions)
+        self.step("site settings", self.create_site_settings)
+        self.step("users", self.create_users, count['users'])
+        self.step("products", self.create_products, count['products'])
+        self.step("threads", self.create_threads, count['threads'])
+        self.step("orders", self.create_orders, count['orders'])
+        self.step("payments", self.create_payments, count['payments'])
+        self.step("stock reservations", self.create_reservations)
+
+        # bulk_create skips the signals that keep derived tables in step
+        for command in ('rebuild_search_index', 'rebuild_order_stats', 'rebuild_leaderboard'):
+            self.step(command, call_command, command, stdout=self.stdout)
+        regions.invalidate()
+        SiteSettings.invalidate()
+        page_cache.invalidate()
+        categories.invalidate()
+        self.stdout.write(self.style.SUCCESS(f"Done in {perf_counter() - start:.1f}s"))
+
+    def step(self, name, function, *args, **kwargs):
+        start = perf_counter()
+        result = function(*args, **kwargs)
+        rows = f"{result} rows, " if isinstance(result, int) else ""
+        self.stdout.write(f"{name}: {rows}{perf_counter() - start:.1f}s")
+
+    def bulk_create(self, model, objects):
+        total, batch = 0, []
+        with explicit_timestamps(model):
+            for obj in objects:
+                batch.append(obj)
+                if len(batch) >= self.batch_size:
+                    total += self.flush(model, batch)
+                    batch = []
+            return total + self.flush(model, batch)
+
+    def flush(self, model, batch):
+        with transaction.atomic():
+            model.objects.bulk_create(batch, batch_size=self.batch_size)
+        return len(batch)
+
+    def moment(self):
+        return self.now - timedelta(seconds=self.random.randrange(self.days * 86400))
+
+    def phone(self):
+        return f'99890{self.random.randrange(10_000_000):07d}'
+
+    def fullname(self):
+        return f'{self.random.choice(FIRST_NAMES)} {self.random.choice(LAST_NAMES)}'
+
+    def create_regions(self):
+        if Region.objects.exists():
+            return 0
+        created = 0
+        for name, districts in REGIONS.items():
+            region = Region.objects.create(name=name)
+            District.objects.bulk_create([District(name=district, region=region) for district in districts])
+            created += 1 + len(districts)
+        return created
+
+    def create_site_settings(self):
+        if SiteSettings.objects.exists():
+            return 0
+        today = timezone.localdate()
+        SiteSettings.objects.create(delivery_price=25000, competition_start=today - timedelta(days=30),
+                                    competition_finish=today + timedelta(days=30),
+                                    competition_description='<p>Eng koʻp sotgan sotuvchilar mukofotlanadi</p>')
+        return 1
+
+    def create_users(self, total):
+        # one hash for everybody: hashing 100k passwords would take hours
+        password = make_password('parol123')
+        offset = User.objects.filter(phone_number__startswith=PHONE_PREFIX).count()
+        districts = list(District.objects.values_list('pk', flat=True))
+        roles, weights = zip(*ROLE_WEIGHTS.items())
+        users = (User(
+            phone_number=f'{PHONE_PREFIX}{offset + i:07d}',
+            password=password,
+            first_name=self.random.choice(FIRST_NAMES),
+            last_name=self.random.choice(LAST_NAMES),
+            role=self.random.choices(roles, weights)[0],
+            district_id=self.random.choice(districts),
+            address=f'{self.random.randint(1, 120)}-uy',
+            date_joined=self.moment(),
+        ) for i in range(total))
+        return self.bulk_create(User, users)
+
+    def create_products(self, total):
+        by_name = {}
+        for name in CATEGORIES:
+            by_name[name] = Category.objects.filter(name=name).first() or Category.objects.create(
+                name=name, icon='https://cdn-icons-png.flaticon.com/512/3081/3081559.png')
+        counters = SlugCounters()
+
+        def products():
+            for _ in range(total):
+                category = self.random.choice(list(CATEGORIES))
+                title = ' '.join(filter(None, [self.random.choice(CATEGORIES[category]),
+                                               self.random.choice(VARIANTS), self.random.choice(COLORS)]))
+                price = Decimal(self.random.randrange(20, 3000) * 1000)  # order totals are capped at 10M
+                created_at = self.moment()
+                yield Product(
+                    title=title, category=by_name[category], price=price,
+                    seller_price=(price * Decimal('0.1')).quantize(Decimal(1)),
+                    quantity=self.random.randint(0, 500), image='products/sample.jpg',
+                    description=f'<p>{title}. Sifatli mahsulot, 1 yil kafolat.</p>',
+                    created_at=created_at, updated_at=created_at,
+                )
+
+        total_created, batch = 0, []
+        with explicit_timestamps(Product):
+            for product in products():
+                batch.append(product)
+                if len(batch) >= self.batch_size:
+                    Product.assign_slugs(batch, counters)
+                    total_created += self.flush(Product, batch)
+                    batch = []
+            Product.assign_slugs(batch, counters)
+            return total_created + self.flush(Product, batch)
+
+    def create_threads(self, total):
+        owners = list(User.objects.filter(role=User.RoleType.USER, phone_number__startswith=PHONE_PREFIX)
+                      .values_list('pk', flat=True)[:max(1, total // 4)])
+        products = list(Product.objects.values_list('pk', 'price'))
+        threads = []
+        for _ in range(total):
+            product_id, price = self.random.choice(products)
+            threads.append(Thread(
+                owner_id=self.random.choice(owners), product_id=product_id,
+                discount=(price * Decimal(self.random.choice(['0', '0', '0.02', '0.05']))).quantize(Decimal(1)),
+                name=f'{self.random.choice(["Telegram", "Instagram", "Facebook", "YouTube"])} '
+                     f'{self.random.randint(1, 999)}',
+                visit_count=self.random.randint(0, 5000), created_at=self.moment(),
+            ))
+        return self.bulk_create(Thread, threads)
+
+    def create_orders(self, total):
+        roles = dict.fromkeys(User.RoleType.values)
+        for role in roles:
+            roles[role] = list(User.objects.filter(role=role).values_list('pk', flat=True)) or [None]
+        products = list(Product.objects.values_list('pk', 'price'))
+        prices = dict(products)
+        threads = list(Thread.objects.values_list('pk', 'product_id', 'discount'))
+        districts = list(District.objects.values_list('pk', flat=True))
+        statuses, weights = zip(*STATUS_WEIGHTS.items())
+        done = {Order.StatusType.DELIVERED, Order.StatusType.ARCHIVED}
+
+        def orders():
+            for _ in range(total):
+                status = self.random.choices(statuses, weights)[0]
+                created_at = self.moment()
+                updated_at = min(self.now, created_at + timedelta(hours=self.random.randint(0, 96)))
+                thread_id = None
+                if threads and self.random.random() < 0.6:
+                    thread_id, product_id, discount = self.random.choice(threads)
+                    price = prices[product_id] - discount
+                else:
+                    product_id, price = self.random.choice(products)
+                quantity = self.random.choice([1, 1, 1, 2, 3])
+                handled = status != Order.StatusType.NEW
+                yield Order(
+                    customer_id=self.random.choice(roles[User.RoleType.USER]) if self.random.random() < 0.7 else None,
+                    product_id=product_id, thread_id=thread_id, quantity=quantity, total=price * quantity,
+                    fullname=self.fullname(), phone_number=self.phone(), status=status,
+                    district_id=self.random.choice(districts) if handled else None,
+                    operator_id=self.random.choice(roles[User.RoleType.OPERATOR]) if handled else None,
+                    deliver_id=self.random.choice(roles[User.RoleType.DELIVER])
+                    if status in done or status == Order.StatusType.DELIVERING else None,
+                    delivery_date=(updated_at + timedelta(days=1)).date() if handled else None,
+                    delivered_at=updated_at if status in done else None,
+                    created_at=created_at, updated_at=updated_at,
+                )
+
+        return self.bulk_create(Order, orders())
+
+    def create_payments(self, total):
+        users = list(User.objects.filter(role=User.RoleType.USER, phone_number__startswith=PHONE_PREFIX)
+                     .values_list('pk', flat=True)[:max(1, total)])
+        statuses = [Payment.PaymentStatus.COMPLETED] * 7 + [Payment.PaymentStatus.REVIEW] * 2 + [
+            Payment.PaymentStatus.CANCEL]
+        payments = (Payment(
+            user_id=self.random.choice(users), amount=Decimal(self.random.randrange(50, 5000) * 1000),
+            status=self.random.choice(statuses), pay_at=self.moment(),
+            card_number=f'8600{self.random.randrange(10 ** 12):012d}',
+        ) for _ in range(total))
+        return self.bulk_create(Payment, payments)
+
+    def create_reservations(self):
+        # orders on their way to the customer hold their stock, as they would after the status change
+        expires_at = self.now + inventory.HOLD
+        held = Order.objects.filter(status__in=inventory.HOLDING, product__isnull=False, reservation__isnull=True)
+        created = self.bulk_create(StockReservation, (
+            StockReservation(order_id=pk, product_id=product_id, quantity=quantity, expires_at=expires_at)
+            for pk, product_id, quantity in held.values_list('pk', 'product_id', 'quantity').iterator()))
+        totals = StockReservation.objects.values('product_id').annotate(total=Sum('quantity')).order_by()
+        with transaction.atomic():
+            for product_id, total in totals.values_list('product_id', 'total'):
+                Product.objects.filter(pk=product_id).update(reserved=total, quantity=Greatest(F('quantity'), total))
+        return created
@@ -0,0 +1,42 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from apps.images import FIELDS, update_variants
+
+
+class Command(BaseCommand):
+    help = "Generate resized WebP/JPEG variants for existing product, receipt and site images"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=[model._meta.model_name for model in FIELDS])
+        parser.add_argument('--workers', type=int, default=4, help="1 generates in the current thread")
+        parser.add_argument('--force', action='store_true', help="Regenerate variants that are already up to date")
+
+    def handle(self, *args, **options):
+        start = perf_counter()
+        total = 0
+        pool = ThreadPoolExecutor(max_workers=options['workers']) if options['workers'] > 1 else None
+        for model, (image_field, _) in FIELDS.items():
+            if options['model'] not in (None, model._meta.model_name):
+                continue
+            pks = list(model.objects.exclude(**{image_field: ''}).exclude(**{f'{image_field}__isnull': True})
+                       .values_list('pk', flat=True))
+            generate = lambda pk: self.generate(model, pk, options['force'])
+            results = pool.map(generate, pks) if pool else map(generate, pks)
+            total += sum(result is not None for result in results)
+        if pool:
+            pool.shutdown()
+        self.stdout.write(self.style.SUCCESS(f"Generated variants for {total} images in {perf_counter() - start:.2f}s"))
+
+    def generate(self, model, pk, force):
+        try:
+            return update_variants(model, pk, force)
+        except Exception as exc:
+            self.stderr.write(f"{model.__name__} {pk}: {exc}")
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                close_old_connections()
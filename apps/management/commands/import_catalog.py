@@ -0,0 +1,164 @@
+import csv
+import json
+import os
+import resource
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from time import perf_counter
+
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.text import slugify
+
+from apps import page_cache, categories
+from apps.catalog import FIELDS, MODELS, guess_format, open_stream, read_rows
+from apps.models import Category, Product, SlugCounters, take_slug
+from apps.search import index_products
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = "Import categories or products from a CSV or JSONL file in chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(MODELS))
+        parser.add_argument('path', help="File to read, or - for stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'])
+        parser.add_argument('--images-dir', help="Directory with the files named in the image column")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Validate every row without writing")
+
+    def handle(self, *args, **options):
+        self.model_name = options['model']
+        self.model = MODELS[self.model_name]
+        self.images_dir = options['images_dir']
+        self.dry_run = options['dry_run']
+        self.errors = 0
+        self.categories = {}
+        if self.model is Product:
+            for category in Category.objects.all():
+                self.categories[category.slug] = category
+                self.categories[category.name.lower()] = category
+        self.counters = SlugCounters()
+        self.fields = [self.model._meta.get_field(name) for name in FIELDS[self.model_name] if name != 'slug']
+
+        start = perf_counter()
+        created = updated = rows_read = 0
+        with open_stream(options['path'], 'r') as stream:
+            rows = read_rows(stream, guess_format(options['path'], options['format']))
+            try:
+                for number, chunk in enumerate(chunked(rows, options['chunk_size']), 1):
+                    chunk_start = perf_counter()
+                    new, changed = self.import_chunk(chunk)
+                    created += new
+                    updated += changed
+                    rows_read += len(chunk)
+                    elapsed = perf_counter() - chunk_start
+                    self.stdout.write(
+                        f"chunk {number}: {len(chunk)} rows, {len(chunk) / elapsed:.0f} rows/s, "
+                        f"max rss {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+            except (json.JSONDecodeError, csv.Error) as exc:
+                raise CommandError(f"Malformed input: {exc}")
+
+        if not self.dry_run:
+            page_cache.invalidate()
+            categories.invalidate()
+        elapsed = perf_counter() - start
+        verb = "Validated" if self.dry_run else "Imported"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {rows_read} {self.model_name} rows ({created} new, {updated} updated, {self.errors} errors) "
+            f"in {elapsed:.2f}s, {rows_read / elapsed if elapsed else 0:.0f} rows/s"))
+
+    def import_chunk(self, chunk):
+        existing = self.model.objects.in_bulk([row['slug'] for _, row in chunk if row.get('slug')], field_name='slug')
+        new, changed, changed_fields = [], [], set()
+        for line, row in chunk:
+            obj = existing.get(row.get('slug')) or self.model(slug=row.get('slug') or None)
+            before = [field.value_from_object(obj) for field in self.fields]
+            try:
+                self.fill(obj, row)
+                obj.full_clean(exclude=['slug', 'image', 'category'], validate_unique=False,
+                               validate_constraints=False)
+            except ValidationError as exc:
+                self.errors += 1
+                self.stderr.write(f"line {line}: {'; '.join(exc.messages)}")
+                continue
+            if obj.pk is None:
+                new.append(obj)
+                continue
+            # rows that come back unchanged (e.g. re-importing an export) are not written
+            diff = {field.name for field, value in zip(self.fields, before) if field.value_from_object(obj) != value}
+            if diff:
+                changed.append(obj)
+                changed_fields |= diff
+
+        # keep slugs from the file (e.g. an export of another site) unless they are taken
+        unassigned = []
+        self.model.slug_counters({obj.slug for obj in new if obj.slug}, self.counters)
+        for obj in new:
+            if obj.slug and obj.slug not in self.counters and slugify(obj.slug) == obj.slug:
+                take_slug(self.counters, obj.slug)
+            else:
+                unassigned.append(obj)
+        self.model.assign_slugs(unassigned, self.counters)
+        if self.dry_run:
+            return len(new), len(changed)
+        with transaction.atomic():
+            self.model.objects.bulk_create(new)
+            if changed:
+                self.model.objects.bulk_update(changed, changed_fields, batch_size=100)
+            if self.model is Product:
+                index_products(new + changed)
+            else:
+                for category in new:
+                    self.categories[category.slug] = category
+                    self.categories[category.name.lower()] = category
+        return len(new), len(changed)
+
+    def fill(self, obj, row):
+        if self.model is Category:
+            obj.name = row.get('name') or obj.name
+            obj.icon = row.get('icon') or obj.icon
+            return
+        obj.title = row.get('title') or obj.title
+        obj.description = row.get('description') or obj.description or ''
+        category = str(row.get('category') or '')
+        if category:
+            found = self.categories.get(category) or self.categories.get(category.lower())
+            if found is None:
+                raise ValidationError(f"Unknown category {category!r}")
+            obj.category = found
+        elif obj.category_id is None:
+            raise ValidationError("Category is required")
+        for name in ('price', 'seller_price', 'quantity'):
+            value = row.get(name)
+            if value in (None, ''):
+                continue
+            try:
+                setattr(obj, name, int(value) if name == 'quantity' else Decimal(str(value)))
+            except (ValueError, InvalidOperation):
+                raise ValidationError(f"Invalid {name} {value!r}")
+        if row.get('image'):
+            obj.image = self.store_image(row['image'])
+
+    def store_image(self, filename):
+        name = f"products/{os.path.basename(filename)}"
+        if self.images_dir is None:
+            if not default_storage.exists(name):
+                raise ValidationError(f"Image {filename!r} not found, pass --images-dir")
+            return name
+        path = os.path.join(self.images_dir, filename)
+        if not os.path.isfile(path):
+            raise ValidationError(f"Image {path!r} not found")
+        if self.dry_run or default_storage.exists(name):
+            return name
+        with open(path, 'rb') as source:
+            return default_storage.save(name, File(source))
@@ -0,0 +1,74 @@
+import glob
+import json
+import os
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps import metrics
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Command(BaseCommand):
+    help = "Show the slowest views and the most repeated SQL from the metrics snapshots of running processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help=f"Snapshot files (default: {metrics.SNAPSHOT_DIR}/*.json)")
+        parser.add_argument('--limit', type=int, default=10)
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or glob.glob(os.path.join(metrics.SNAPSHOT_DIR, '*.json'))
+        records = []
+        for path in paths:
+            try:
+                with open(path) as stream:
+                    records.extend(json.load(stream))
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Cannot read {path}: {exc}")
+        if not records:
+            raise CommandError("No requests recorded yet")
+        limit = options['limit']
+        self.slowest_views(records, limit)
+        self.repeated_sql(records, limit)
+
+    def slowest_views(self, records, limit):
+        views = defaultdict(list)
+        for record in records:
+            views[record['view']].append(record)
+        rows = []
+        for view, items in views.items():
+            durations = sorted(item['duration'] * 1000 for item in items)
+            lookups = sum(item['cache_hits'] + item['cache_misses'] for item in items)
+            rows.append((percentile(durations, 0.95), view, len(items), percentile(durations, 0.5), durations[-1],
+                         sum(item['queries'] for item in items) / len(items),
+                         sum(item['db_time'] for item in items) * 1000 / len(items),
+                         sum(item['template_time'] for item in items) * 1000 / len(items),
+                         sum(item['cache_hits'] for item in items) / lookups * 100 if lookups else 0))
+        rows.sort(reverse=True)
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Slowest views ({len(records)} requests)"))
+        self.stdout.write(f"{'view':32} {'reqs':>6} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} "
+                          f"{'queries':>8} {'db ms':>8} {'tmpl ms':>8} {'cache %':>8}")
+        for p95, view, count, p50, slowest, queries, db, template, hit_rate in rows[:limit]:
+            self.stdout.write(f"{view[:32]:32} {count:>6} {p50:>8.1f} {p95:>8.1f} {slowest:>8.1f} "
+                              f"{queries:>8.1f} {db:>8.1f} {template:>8.1f} {hit_rate:>8.0f}")
+
+    def repeated_sql(self, records, limit):
+        executions, seconds, worst = Counter(), Counter(), Counter()
+        views = defaultdict(set)
+        for record in records:
+            per_request = Counter()
+            for sql, elapsed in record['statements']:
+                per_request[sql] += 1
+                seconds[sql] += elapsed
+                views[sql].add(record['view'])
+            executions.update(per_request)
+            for sql, count in per_request.items():
+                worst[sql] = max(worst[sql], count)
+        self.stdout.write(self.style.MIGRATE_HEADING("\nMost repeated SQL"))
+        self.stdout.write(f"{'runs':>6} {'max/req':>8} {'total ms':>9}  statement")
+        for sql, count in executions.most_common(limit):
+            self.stdout.write(f"{count:>6} {worst[sql]:>8} {seconds[sql] * 1000:>9.1f}  {sql[:160]}")
+            self.stdout.write(f"{'':26}views: {', '.join(sorted(views[sql]))}")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from apps import leaderboard
+
+
+class Command(BaseCommand):
+    help = "Recount delivered orders per seller for the current competition window"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        sellers = leaderboard.rebuild(batch_size=options['batch_size'])
+        start, finish = leaderboard.competition_window()
+        self.stdout.write(self.style.SUCCESS(f"Leaderboard rebuilt for {start} - {finish}: {sellers} sellers"))
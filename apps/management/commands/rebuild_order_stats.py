@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps import stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-thread and per-region daily order status rollups from the Order table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rows = stats.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} thread/day/status and region/day/status rows"))
@@ -0,0 +1,33 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.models import Product
+from apps.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index from scratch"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        backend = get_backend()
+        start = perf_counter()
+        total = 0
+        with transaction.atomic():
+            backend.create_index()
+            backend.clear()
+            batch = []
+            for product in Product.objects.select_related('category').order_by('pk').iterator(chunk_size=batch_size):
+                batch.append(product)
+                if len(batch) >= batch_size:
+                    backend.index(batch)
+                    total += len(batch)
+                    batch = []
+            backend.index(batch)
+            total += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} products in {perf_counter() - start:.2f}s"))
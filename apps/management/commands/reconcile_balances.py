@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum, OuterRef, Subquery, Value, DecimalField
+from django.db.models.functions import Coalesce
+
+from apps.models import BalanceTransaction, User
+
+
+class Command(BaseCommand):
+    help = "Recompute User.balance from the balance ledger and report (or fix) mismatches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Write the ledger balance back to users")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        ledger = dict(BalanceTransaction.objects.values('user_id').annotate(total=Sum('amount')).values_list(
+            'user_id', 'total').order_by())
+        mismatched = []
+        for user in User.objects.only('pk', 'balance', 'phone_number').iterator(chunk_size=batch_size):
+            expected = ledger.get(user.pk) or 0
+            if user.balance != expected:
+                self.stdout.write(f"{user.phone_number}: balance {user.balance}, ledger {expected}")
+                mismatched.append(user)
+
+        if options['fix'] and mismatched:
+            # recompute inside the UPDATE so entries posted since the scan are included
+            ledger_total = BalanceTransaction.objects.filter(user=OuterRef('pk')).order_by().values(
+                'user').annotate(total=Sum('amount')).values('total')
+            balance = Coalesce(Subquery(ledger_total), Value(0), output_field=DecimalField())
+            with transaction.atomic():
+                for start in range(0, len(mismatched), batch_size):
+                    user_ids = [user.pk for user in mismatched[start:start + batch_size]]
+                    User.objects.filter(pk__in=user_ids).update(balance=balance)
+            self.stdout.write(self.style.SUCCESS(f"Fixed {len(mismatched)} balances"))
+        else:
+            self.stdout.write(f"{len(mismatched)} mismatched balances")
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum, OuterRef, Subquery, Value, IntegerField
+from django.db.models.functions import Coalesce
+
+from apps.models import Product, StockReservation
+
+
+class Command(BaseCommand):
+    help = "Compare Product.reserved with the reservation table and report (or fix) mismatches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Write the reservation totals back to products")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        held = dict(StockReservation.objects.values('product_id').annotate(total=Sum('quantity')).values_list(
+            'product_id', 'total').order_by())
+        mismatched = []
+        oversold = 0
+        for product in Product.objects.only('pk', 'slug', 'quantity', 'reserved').iterator(chunk_size=batch_size):
+            expected = held.get(product.pk, 0)
+            if product.reserved != expected:
+                self.stdout.write(f"{product.slug}: reserved {product.reserved}, reservations {expected}")
+                mismatched.append(product)
+            if expected > product.quantity:
+                self.stdout.write(f"{product.slug}: {expected} reserved but only {product.quantity} in stock")
+                oversold += 1
+
+        if options['fix'] and mismatched:
+            # recompute inside the UPDATE so holds taken since the scan are included
+            reservation_total = StockReservation.objects.filter(product=OuterRef('pk')).order_by().values(
+                'product').annotate(total=Sum('quantity')).values('total')
+            reserved = Coalesce(Subquery(reservation_total), Value(0), output_field=IntegerField())
+            with transaction.atomic():
+                for start in range(0, len(mismatched), batch_size):
+                    product_ids = [product.pk for product in mismatched[start:start + batch_size]]
+                    Product.objects.filter(pk__in=product_ids).update(reserved=reserved)
+            self.stdout.write(self.style.SUCCESS(f"Fixed {len(mismatched)} products"))
+        else:
+            self.stdout.write(f"{len(mismatched)} mismatched products")
+        self.stdout.write(f"{oversold} products with more reserved than in stock")
@@ -0,0 +1,36 @@
+import sqlite3
+import time
+from contextlib import closing
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from apps.replicas import replica_alias
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database into the replica file, to try out replica routing locally"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help="Keep copying every this many seconds, like a replica lagging behind")
+
+    def handle(self, *args, **options):
+        alias = replica_alias()
+        if alias is None:
+            raise CommandError("No replica database is configured (set DB_REPLICA_NAME)")
+        primary, replica = connections[DEFAULT_DB_ALIAS].settings_dict, connections[alias].settings_dict
+        if connections[alias].vendor != 'sqlite':
+            raise CommandError("Only SQLite replicas are copied; a server replica is kept up to date by the server")
+        if str(primary['NAME']) == str(replica['NAME']):
+            raise CommandError("The replica is the primary database file")
+        while True:
+            start = time.perf_counter()
+            source, target = sqlite3.connect(primary['NAME']), sqlite3.connect(replica['NAME'])
+            with closing(source), closing(target):
+                # a consistent snapshot, even while the primary is being written to
+                source.backup(target)
+            self.stdout.write(f"Copied {primary['NAME']} to {replica['NAME']} in {time.perf_counter() - start:.2f}s")
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,290 @@
+import atexit
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates, Template
+
+config = getattr(settings, 'METRICS', {})
+BUCKETS = config.get('BUCKETS', (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+SNAPSHOT_DIR = config.get('SNAPSHOT_DIR') or os.path.join(tempfile.gettempdir(), 'alijahon-metrics')
+SNAPSHOT_INTERVAL = config.get('SNAPSHOT_INTERVAL', 60)
+
+# the last requests with their SQL, for the report command; deque appends are atomic
+recent = deque(maxlen=config.get('RING_SIZE', 1000))
+current = ContextVar('metrics_request', default=None)
+
+MISSING = object()
+IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+SPACES = re.compile(r'\s+')
+
+
+class RequestRecord:
+    __slots__ = 'queries', 'db_time', 'template_time', 'cache_hits', 'cache_misses', 'statements'
+
+    def __init__(self):
+        self.queries = self.cache_hits = self.cache_misses = 0
+        self.db_time = self.template_time = 0.0
+        self.statements = []
+
+
+class ViewStats:
+    __slots__ = 'count', 'duration', 'buckets', 'queries', 'db_time', 'template_time', 'cache_hits', 'cache_misses'
+
+    def __init__(self):
+        self.count = self.queries = self.cache_hits = self.cache_misses = 0
+        self.duration = self.db_time = self.template_time = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+
+# Every thread adds to its own shard, so recording takes no lock; /metrics sums the shards.
+shards = []
+_local = threading.local()
+
+
+def shard():
+    try:
+        return _local.shard
+    except AttributeError:
+        _local.shard = {}
+        shards.append(_local.shard)
+        return _local.shard
+
+
+def normalize(sql):
+    return SPACES.sub(' ', IN_LIST.sub('(%s, ...)', sql)).strip()
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    record = current.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        record.queries += 1
+        record.db_time += elapsed
+        record.statements.append((normalize(sql), elapsed))
+
+
+def instrument(connection, **kwargs):
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+connection_created.connect(instrument)
+
+
+def save(view, method, status, duration, record):
+    key = (view, method, status)
+    stats = shard().get(key)
+    if stats is None:
+        stats = shard()[key] = ViewStats()
+    stats.count += 1
+    stats.duration += duration
+    for i, bound in enumerate(BUCKETS):
+        if duration <= bound:
+            stats.buckets[i] += 1
+            break
+    stats.queries += record.queries
+    stats.db_time += record.db_time
+    stats.template_time += record.template_time
+    stats.cache_hits += record.cache_hits
+    stats.cache_misses += record.cache_misses
+    recent.append({
+        'view': view,
+        'method': method,
+        'status': status,
+        'duration': duration,
+        'queries': record.queries,
+        'db_time': record.db_time,
+        'template_time': record.template_time,
+        'cache_hits': record.cache_hits,
+        'cache_misses': record.cache_misses,
+        'statements': record.statements,
+    })
+    maybe_snapshot()
+
+
+def totals():
+    merged = {}
+    for part in list(shards):
+        for key, stats in list(part.items()):
+            total = merged.setdefault(key, ViewStats())
+            total.count += stats.count
+            total.duration += stats.duration
+            total.buckets = [a + b for a, b in zip(total.buckets, stats.buckets)]
+            total.queries += stats.queries
+            total.db_time += stats.db_time
+            total.template_time += stats.template_time
+            total.cache_hits += stats.cache_hits
+            total.cache_misses += stats.cache_misses
+    return merged
+
+
+def label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus():
+    """The per-view totals of this process in the Prometheus text format."""
+    merged = sorted(totals().items())
+    lines = [
+        '# HELP django_view_duration_seconds Time spent handling a request, by URL name.',
+        '# TYPE django_view_duration_seconds histogram',
+    ]
+    for (view, method, status), stats in merged:
+        labels = f'view="{label(view)}",method="{method}",status="{status}"'
+        cumulative = 0
+        for bound, count in zip(BUCKETS, stats.buckets):
+            cumulative += count
+            lines.append(f'django_view_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'django_view_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+        lines.append(f'django_view_duration_seconds_sum{{{labels}}} {stats.duration:.6f}')
+        lines.append(f'django_view_duration_seconds_count{{{labels}}} {stats.count}')
+    counters = [
+        ('django_view_db_queries_total', 'SQL queries run by the view.', 'queries', '{}'),
+        ('django_view_db_seconds_total', 'Time spent in SQL queries.', 'db_time', '{:.6f}'),
+        ('django_view_template_seconds_total', 'Time spent rendering templates.', 'template_time', '{:.6f}'),
+        ('django_view_cache_hits_total', 'Cache lookups that found a value.', 'cache_hits', '{}'),
+        ('django_view_cache_misses_total', 'Cache lookups that found nothing.', 'cache_misses', '{}'),
+    ]
+    for name, help_text, attr, fmt in counters:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for (view, method, status), stats in merged:
+            labels = f'view="{label(view)}",method="{method}",status="{status}"'
+            lines.append(f'{name}{{{labels}}} {fmt.format(getattr(stats, attr))}')
+    return '\n'.join(lines) + '\n'
+
+
+_snapshot_lock = threading.Lock()
+_last_snapshot = time.monotonic()
+
+
+def snapshot():
+    """Writes the ring buffer to ``SNAPSHOT_DIR/<pid>.json`` for the ``metrics_report`` command."""
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = os.path.join(SNAPSHOT_DIR, f'{os.getpid()}.json')
+    with tempfile.NamedTemporaryFile('w', dir=SNAPSHOT_DIR, suffix='.tmp', delete=False) as stream:
+        json.dump(list(recent), stream)
+    os.replace(stream.name, path)
+    return path
+
+
+@atexit.register
+def final_snapshot():
+    if recent:
+        try:
+            snapshot()
+        except OSError:
+            pass
+
+
+def maybe_snapshot():
+    global _last_snapshot
+    if not SNAPSHOT_INTERVAL or time.monotonic() - _last_snapshot < SNAPSHOT_INTERVAL:
+        return
+    # whoever gets the lock writes; everyone else carries on
+    if _snapshot_lock.acquire(blocking=False):
+        try:
+            _last_snapshot = time.monotonic()
+            snapshot()
+        except OSError:
+            pass
+        finally:
+            _snapshot_lock.release()
+
+
+class MetricsMiddleware:
+    """Records latency, SQL, template and cache activity of every request under its URL name."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        for alias in connections.all(initialized_only=True):
+            instrument(alias)
+        record = RequestRecord()
+        token = current.set(record)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        self.finish(request, response, time.perf_counter() - start, record)
+        return response
+
+    async def __acall__(self, request):
+        record = RequestRecord()
+        token = current.set(record)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        self.finish(request, response, time.perf_counter() - start, record)
+        return response
+
+    def finish(self, request, response, duration, record):
+        match = request.resolver_match
+        view = match.view_name if match and match.view_name else '<unresolved>'
+        save(view, request.method, response.status_code, duration, record)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        record = current.get()
+        if record is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            record.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing every top-level render for the metrics middleware."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+class CacheMetricsMixin:
+    """Counts hits and misses of ``get`` (and of ``get_many`` on backends built on it)."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, MISSING, version)
+        record = current.get()
+        if record is not None:
+            if value is MISSING:
+                record.cache_misses += 1
+            else:
+                record.cache_hits += 1
+        return default if value is MISSING else value
+
+
+class TimedLocMemCache(CacheMetricsMixin, LocMemCache):
+    pass
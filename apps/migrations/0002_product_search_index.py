@@ -0,0 +1,53 @@
+import re
+
+from django.db import migrations
+from django.utils.html import strip_tags
+
+# the index as apps.search built it when this migration was written; kept here so later
+# changes to that module cannot change what the migration does
+TABLE = 'apps_product_search'
+
+
+def product_document(product):
+    text = re.sub(r"&[a-zA-Z]+;|&#\d+;", " ", strip_tags(product.description or ""))
+    return product.title or "", product.category.name if product.category_id else "", " ".join(text.split())
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return  # searched without an index (apps.search.ContainsSearchBackend)
+    Product = apps.get_model('apps', 'Product')
+    rows = [(product.pk, *product_document(product))
+            for product in Product.objects.using(connection.alias).select_related('category')]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+                           "title, category, body, tokenize = 'unicode61 remove_diacritics 2')")
+            cursor.executemany(f"INSERT INTO {TABLE} (rowid, title, category, body) VALUES (%s, %s, %s, %s)", rows)
+        else:
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+                           "product_id bigint PRIMARY KEY REFERENCES apps_product (id) ON DELETE CASCADE, "
+                           "document tsvector NOT NULL)")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {TABLE}_document_idx ON {TABLE} USING GIN (document)")
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (product_id, document) VALUES (%s, "
+                "setweight(to_tsvector('simple', %s), 'A') || "
+                "setweight(to_tsvector('simple', %s), 'B') || "
+                "setweight(to_tsvector('simple', %s), 'D'))", rows)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def backfill_thread_stats(apps, schema_editor):
+    Order = apps.get_model('apps', 'Order')
+    ThreadDailyStat = apps.get_model('apps', 'ThreadDailyStat')
+    db = schema_editor.connection.alias
+    rows = Order.objects.using(db).filter(thread__isnull=False).values(
+        'thread_id', 'status', date=TruncDate('updated_at')).annotate(count=Count('id')).order_by()
+    ThreadDailyStat.objects.using(db).bulk_create([ThreadDailyStat(**row) for row in rows], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0003_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThreadDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('new', 'New'), ('ready to delivery', 'Ready To Delivery'), ('delivering', 'Delivering'), ('delivered', 'Delivered'), ('not call', 'Not Call'), ('canceled', 'Canceled'), ('archived', 'Archived')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('thread', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='apps.thread')),
+            ],
+            options={
+                'unique_together': {('thread', 'date', 'status')},
+            },
+        ),
+        migrations.RunPython(backfill_thread_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Q
+
+
+def backfill_scores(apps, schema_editor):
+    Order = apps.get_model('apps', 'Order')
+    User = apps.get_model('apps', 'User')
+    SiteSettings = apps.get_model('apps', 'SiteSettings')
+    CompetitionScore = apps.get_model('apps', 'CompetitionScore')
+    db = schema_editor.connection.alias
+    Order.objects.using(db).filter(status='delivered').update(delivered_at=F('updated_at'))
+
+    site = SiteSettings.objects.using(db).first()
+    delivered = Q(threads__orders__status='delivered')
+    if site and site.competition_start:
+        delivered &= Q(threads__orders__delivered_at__date__gte=site.competition_start)
+    if site and site.competition_finish:
+        delivered &= Q(threads__orders__delivered_at__date__lte=site.competition_finish)
+    rows = User.objects.using(db).annotate(delivered_count=Count('threads__orders', filter=delivered)).filter(
+        delivered_count__gt=0).values_list('pk', 'delivered_count')
+    CompetitionScore.objects.using(db).bulk_create(
+        [CompetitionScore(user_id=user_id, delivered_count=count) for user_id, count in rows], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0004_thread_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='delivered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='CompetitionScore',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='competition_score', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('delivered_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-delivered_count'], name='competition_score_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_scores, migrations.RunPython.noop),
+    ]
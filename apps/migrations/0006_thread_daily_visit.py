@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0005_competition_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThreadDailyVisit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('visits', models.IntegerField(default=0)),
+                ('unique_visits', models.IntegerField(default=0)),
+                ('thread', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_visits', to='apps.thread')),
+            ],
+            options={
+                'unique_together': {('thread', 'date')},
+            },
+        ),
+    ]
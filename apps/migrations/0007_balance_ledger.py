@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_balances(apps, schema_editor):
+    User = apps.get_model('apps', 'User')
+    BalanceTransaction = apps.get_model('apps', 'BalanceTransaction')
+    db = schema_editor.connection.alias
+    BalanceTransaction.objects.using(db).bulk_create([
+        BalanceTransaction(user_id=pk, amount=balance, kind='opening', idempotency_key=f'user:{pk}:opening')
+        for pk, balance in User.objects.using(db).exclude(balance=0).values_list('pk', 'balance')
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0006_thread_daily_visit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=11)),
+                ('kind', models.CharField(choices=[('opening', 'Opening'), ('order delivered', 'Order Delivered'), ('payment', 'Payment'), ('payment refund', 'Payment Refund'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('idempotency_key', models.CharField(max_length=64, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transactions', to='apps.order')),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transactions', to='apps.payment')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(open_balances, migrations.RunPython.noop),
+    ]
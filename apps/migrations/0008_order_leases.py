@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0007_balance_ledger'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='order',
+            name='hold',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='held_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='held_orders', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='hold_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['operator', 'status'], name='order_operator_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['district', 'status'], name='order_district_status_idx'),
+        ),
+    ]
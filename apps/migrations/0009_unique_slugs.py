@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:46
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def dedupe_slugs(apps, schema_editor):
+    db = schema_editor.connection.alias
+    for model_name in ('Category', 'Product'):
+        model = apps.get_model('apps', model_name)
+        rows = list(model.objects.using(db).exclude(slug=None).order_by('pk').values_list('pk', 'slug'))
+        taken = {slug for _, slug in rows}
+        seen = Counter()
+        for pk, slug in rows:
+            seen[slug] += 1
+            if seen[slug] == 1 and slug:
+                continue
+            base = slug or model_name.lower()
+            suffix = 2
+            while f'{base}-{suffix}' in taken:
+                suffix += 1
+            taken.add(f'{base}-{suffix}')
+            model.objects.using(db).filter(pk=pk).update(slug=f'{base}-{suffix}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0008_order_leases'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='category',
+            name='slug',
+            field=models.SlugField(null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='slug',
+            field=models.SlugField(null=True, unique=True),
+        ),
+    ]
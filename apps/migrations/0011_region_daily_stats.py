@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def backfill_region_stats(apps, schema_editor):
+    Order = apps.get_model('apps', 'Order')
+    District = apps.get_model('apps', 'District')
+    RegionDailyStat = apps.get_model('apps', 'RegionDailyStat')
+    db = schema_editor.connection.alias
+    district_region = dict(District.objects.using(db).values_list('pk', 'region_id'))
+    totals = {}
+    rows = Order.objects.using(db).values('district_id', 'status', date=TruncDate('created_at')).annotate(
+        count=Count('id')).order_by()
+    for row in rows:
+        key = district_region.get(row['district_id']), row['date'], row['status']
+        totals[key] = totals.get(key, 0) + row['count']
+    RegionDailyStat.objects.using(db).bulk_create([
+        RegionDailyStat(region_id=region_id, date=date, status=status, count=count)
+        for (region_id, date, status), count in totals.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0010_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegionDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(choices=[('new', 'New'), ('ready to delivery', 'Ready To Delivery'), ('delivering', 'Delivering'), ('delivered', 'Delivered'), ('not call', 'Not Call'), ('canceled', 'Canceled'), ('archived', 'Archived')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('region', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='apps.region')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'status'], name='region_stat_date_status_idx')],
+                'unique_together': {('region', 'date', 'status')},
+            },
+        ),
+        migrations.RunPython(backfill_region_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:07
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+from django.utils import timezone
+
+HOLDING = 'ready to delivery', 'delivering'
+
+
+def backfill_reservations(apps, schema_editor):
+    # orders already on their way hold their stock from now on
+    Order = apps.get_model('apps', 'Order')
+    Product = apps.get_model('apps', 'Product')
+    StockReservation = apps.get_model('apps', 'StockReservation')
+    expires_at = timezone.now() + timedelta(days=7)
+    reservations = [
+        StockReservation(order_id=pk, product_id=product_id, quantity=quantity, expires_at=expires_at)
+        for pk, product_id, quantity in Order.objects.filter(status__in=HOLDING, product__isnull=False).values_list(
+            'pk', 'product_id', 'quantity').iterator(chunk_size=1000)
+    ]
+    StockReservation.objects.bulk_create(reservations, batch_size=1000)
+    totals = StockReservation.objects.values('product_id').annotate(total=Sum('quantity')).order_by()
+    for row in totals.iterator(chunk_size=1000):
+        Product.objects.filter(pk=row['product_id']).update(reserved=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0011_region_daily_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reservation', serialize=False, to='apps.order')),
+                ('quantity', models.IntegerField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='reserved',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.CheckConstraint(condition=models.Q(('reserved__gte', 0)), name='product_reserved_gte_0'),
+        ),
+        migrations.AddField(
+            model_name='stockreservation',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='apps.product'),
+        ),
+        migrations.RunPython(backfill_reservations, migrations.RunPython.noop),
+    ]
@@ -1,24 +1,139 @@
+import re
+from uuid import uuid4
+
 from ckeditor_uploader.fields import RichTextUploadingField
-from django.contrib.auth.hashers import make_password
+from django.contrib.auth.hashers import make_password, check_password
 from django.contrib.auth.models import AbstractUser, UserManager
+from django.core.cache import cache
 from django.db.models import Model, CharField, ForeignKey, CASCADE, DecimalField, TextField, DateTimeField, \
-    IntegerField, ImageField, URLField, SlugField, SET_NULL, SmallIntegerField, TextChoices, DateField
-from django.db.models import BooleanField
+    IntegerField, ImageField, URLField, SlugField, SET_NULL, SmallIntegerField, TextChoices, DateField, Index, \
+    OneToOneField, CheckConstraint
+from django.db.models import BooleanField, JSONField, DEFERRED, Q
 from django.utils.text import slugify
-from django.db import models
+from django.db import models, transaction, IntegrityError
+
+from apps import passwords
+
+SLUG_SUFFIX = re.compile(r'^(.+)-([0-9]+)$')
+SLUG_ATTEMPTS = 5  # saves that lose a just-allocated slug to a concurrent one allocate again this often
+SLUG_BASES_PER_QUERY = 100  # one OR-ed prefix match per base, kept well under SQLite's expression depth
+
+
+def take_slug(counters, slug, bases=None):
+    taken = [(slug, 1)]
+    match = SLUG_SUFFIX.match(slug)
+    if match:
+        taken.append((match[1], int(match[2])))
+    for base, suffix in taken:
+        if bases is None or base in bases:
+            counters[base] = max(counters.get(base, 1), suffix)
+
+
+class SlugCounters(dict):
+    """Highest taken suffix per slug base, and the bases read from the table so far (None: all of them)."""
+
+    def __init__(self):
+        super().__init__()
+        self.read = set()
+
 
 class BaseSlug(Model):
-    slug = SlugField(null=True)
+    """
+    Allocates ``slug`` from ``slug_source`` as ``base``, ``base-2``, ``base-3``...
+
+    The next free suffix comes from a single prefix lookup of ``base`` and
+    ``base-<n>``, and the slug is only rebuilt when the source text changes.
+    A save that loses its slug to a concurrent one allocates again, up to
+    SLUG_ATTEMPTS times.
+    """
+    slug = SlugField(null=True, unique=True)
+    slug_source = 'title'
+
     class Meta:
         abstract = True
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_slug_source = instance.__dict__.get(cls.slug_source)
+        return instance
+
+    @classmethod
+    def slug_base(cls, source):
+        max_length = cls._meta.get_field('slug').max_length
+        return slugify(source)[:max_length - 8].strip('-') or cls._meta.model_name
+
+    @classmethod
+    def allocate_slug(cls, source, exclude_pk=None):
+        base = cls.slug_base(source)
+        # a prefix match stays on the slug index; the numeric suffix is checked here
+        query = cls.objects.filter(Q(slug=base) | Q(slug__startswith=f'{base}-'))
+        if exclude_pk is not None:
+            query = query.exclude(pk=exclude_pk)
+        counters = {}
+        for slug in query.values_list('slug', flat=True).iterator():
+            take_slug(counters, slug, {base})
+        top = counters.get(base)
+        return base if top is None else f'{base}-{top + 1}'
+
+    @classmethod
+    def slug_counters(cls, bases=None, counters=None):
+        """
+        Highest taken suffix per base. Without ``bases`` the whole column is
+        read; with them only the slugs of the bases not read into ``counters``
+        yet, matched by prefix.
+        """
+        if counters is None:
+            counters = SlugCounters()
+        if bases is None:
+            counters.read = None
+            for slug in cls.objects.exclude(slug=None).values_list('slug', flat=True).iterator():
+                take_slug(counters, slug)
+            return counters
+        if counters.read is None:
+            return counters
+        bases = sorted(set(bases) - counters.read)
+        for start in range(0, len(bases), SLUG_BASES_PER_QUERY):
+            chunk = set(bases[start:start + SLUG_BASES_PER_QUERY])
+            match = Q(slug__in=chunk)
+            for base in chunk:
+                match |= Q(slug__startswith=f'{base}-')
+            for slug in cls.objects.filter(match).values_list('slug', flat=True).iterator():
+                take_slug(counters, slug, chunk)
+            counters.read |= chunk
+        return counters
+
+    @classmethod
+    def assign_slugs(cls, objs, counters=None):
+        """
+        Fills ``slug`` on unsaved instances for ``bulk_create``. Pass the same
+        ``SlugCounters`` to allocate across several batches; each batch reads
+        only the bases it has not seen before.
+        """
+        bases = [cls.slug_base(getattr(obj, cls.slug_source)) for obj in objs]
+        counters = cls.slug_counters(bases, counters)
+        for obj, base in zip(objs, bases):
+            obj.slug = f'{base}-{counters[base] + 1}' if base in counters else base
+            take_slug(counters, obj.slug)
+        return objs
+
     def save(self, *args, **kwargs):
-        slug = slugify(self.title)
-        query = self.__class__.objects.filter(slug=slug)
-        while query.exists():
-            slug += "-1"
-        self.slug = slug
-        return super().save(*args, **kwargs)
+        source = getattr(self, self.slug_source)
+        if self.slug and source == getattr(self, '_loaded_slug_source', None):
+            super().save(*args, **kwargs)
+        else:
+            for attempt in range(1, SLUG_ATTEMPTS + 1):
+                self.slug = self.allocate_slug(source, exclude_pk=self.pk)
+                try:
+                    with transaction.atomic():
+                        super().save(*args, **kwargs)
+                    break
+                except IntegrityError:
+                    # only a slug taken meanwhile is worth another allocation
+                    taken = type(self)._default_manager.filter(slug=self.slug).exclude(pk=self.pk).exists()
+                    if attempt == SLUG_ATTEMPTS or not taken:
+                        raise
+        self._loaded_slug_source = source
 
 class CustomUserManager(UserManager):
     use_in_migrations = True
@@ -105,7 +220,24 @@ class User(AbstractUser):
     district = ForeignKey('apps.District', SET_NULL, null=True, blank=True, related_name='users')
     balance = DecimalField(max_digits=11, decimal_places=2, default=0)
     def wishlist_products(self):
-        return list(self.wishlist.all().values_list("product__pk", flat=True))
+        if not hasattr(self, '_wishlist_products'):
+            self._wishlist_products = set(self.wishlist.values_list("product_id", flat=True))
+        return self._wishlist_products
+
+    def toggle_wishlist(self, product_id):
+        """Adds or removes the product in one transaction; whether it is in the wishlist now, and its size."""
+        with transaction.atomic():
+            deleted, _ = self.wishlist.filter(product_id=product_id).delete()
+            if not deleted:
+                # a concurrent click already added it; unique_together keeps a single row
+                WishList.objects.bulk_create([WishList(user=self, product_id=product_id)], ignore_conflicts=True)
+            count = self.wishlist.count()
+        self.__dict__.pop('_wishlist_products', None)
+        return not deleted, count
+
+    def check_password(self, raw_password):
+        # a hash made with outdated hasher settings is upgraded off the request path
+        return check_password(raw_password, self.password, lambda raw: passwords.schedule_rehash(self, raw))
 
 class Region(Model):
     name = CharField(max_length=255)
@@ -117,6 +249,7 @@ class District(Model):
 class Category(BaseSlug):
     icon = URLField()
     name = CharField(max_length=255)
+    slug_source = 'name'
 
     def __str__(self):
         return self.name
@@ -130,8 +263,32 @@ class Product(BaseSlug):
     created_at = DateTimeField(auto_now_add=True)
     updated_at = DateTimeField(auto_now=True)
     quantity = IntegerField(default=1)
+    # units held by reservations of orders on their way to the customer; written only by apps.inventory
+    reserved = IntegerField(default=0, editable=False)
     seller_price = DecimalField(default=0, decimal_places=2, max_digits=9)
     message_id = CharField(max_length=255 , null=True, blank=True)
+    image_variants = JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            Index(fields=['-created_at', '-id'], name='product_created_idx'),
+            Index(fields=['category', '-created_at', '-id'], name='product_category_created_idx'),
+        ]
+        constraints = [
+            CheckConstraint(condition=Q(reserved__gte=0), name='product_reserved_gte_0'),
+        ]
+
+    @property
+    def available(self):
+        return self.quantity - self.reserved
+
+    def save(self, *args, **kwargs):
+        # a full save of a loaded copy must not write back a stale ``reserved``; name it to write it
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name != 'reserved']
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.title
 
@@ -149,21 +306,97 @@ class Order(Model):
         CANCELED = 'canceled', 'Canceled'
         ARCHIVED = 'archived', 'Archived'
     delivery_date = DateField(null=True, blank=True)
-    customer = ForeignKey('apps.User', SET_NULL, blank=True, null=True, related_name='orders')
+    customer = ForeignKey('apps.User', SET_NULL, blank=True, null=True, related_name='orders', db_index=False)
     product = ForeignKey('apps.Product', SET_NULL, blank=True, null=True, related_name='orders')
     fullname = CharField(max_length=255)
     phone_number = CharField(max_length=20)
     quantity = SmallIntegerField(default=1)
     total = DecimalField(max_digits=9, decimal_places=2)
     created_at = DateTimeField(auto_now_add=True)
-    operator = ForeignKey('apps.User', SET_NULL, null=True, blank=True, related_name='operator_orders')
+    operator = ForeignKey('apps.User', SET_NULL, null=True, blank=True, related_name='operator_orders',
+                          db_index=False)
     deliver = ForeignKey('apps.User', SET_NULL, null=True, blank=True, related_name='deliver_orders')
     updated_at = DateTimeField(auto_now=True)
-    thread = ForeignKey('apps.Thread', SET_NULL, null=True, blank=True, related_name='orders')
+    thread = ForeignKey('apps.Thread', SET_NULL, null=True, blank=True, related_name='orders', db_index=False)
     status = CharField(choices=StatusType, default=StatusType.NEW)
     comment = TextField(null=True, blank=True)
     district = ForeignKey('apps.District', SET_NULL, blank=True, null=True, related_name='orders')
-    hold = BooleanField(default=False)
+    held_by = ForeignKey('apps.User', SET_NULL, null=True, blank=True, related_name='held_orders')
+    hold_until = DateTimeField(null=True, blank=True)
+    delivered_at = DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # customer, operator and thread lead a composite index here, so they get no index of their own
+        indexes = [
+            Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+            Index(fields=['operator', 'status', '-created_at', '-id'], name='order_operator_queue_idx'),
+            Index(fields=['district', 'status'], name='order_district_status_idx'),
+            Index(fields=['customer', '-created_at', '-id'], name='order_customer_created_idx'),
+            Index(fields=['thread', 'status'], name='order_thread_status_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def loaded_value(self, field_name):
+        """Value of the field as it was last read from / written to the database."""
+        value = getattr(self, '_loaded_values', {}).get(field_name, DEFERRED)
+        if value is DEFERRED and not self._state.adding:
+            value = Order.objects.filter(pk=self.pk).values_list(field_name, flat=True).first()
+        return None if value is DEFERRED else value
+
+    def save(self, *args, **kwargs):
+        # the post_save handlers (stock holds, rollups) fail or succeed together with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def refresh_loaded_values(self):
+        self._loaded_values = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields}
+
+class StockReservation(Model):
+    """Stock held for one order; the row disappears when the hold is committed or released."""
+    order = OneToOneField('apps.Order', CASCADE, primary_key=True, related_name='reservation')
+    product = ForeignKey('apps.Product', CASCADE, related_name='reservations')
+    quantity = IntegerField()
+    expires_at = DateTimeField(db_index=True)
+
+
+class ThreadDailyStat(Model):
+    thread = ForeignKey('apps.Thread', CASCADE, related_name='daily_stats')
+    date = DateField()
+    status = CharField(max_length=20, choices=Order.StatusType)
+    count = IntegerField(default=0)
+
+    class Meta:
+        unique_together = 'thread', 'date', 'status'
+
+
+class RegionDailyStat(Model):
+    # region is empty for orders without a district
+    region = ForeignKey('apps.Region', CASCADE, null=True, blank=True, related_name='daily_stats')
+    date = DateField()
+    status = CharField(max_length=20, choices=Order.StatusType)
+    count = IntegerField(default=0)
+
+    class Meta:
+        unique_together = 'region', 'date', 'status'
+        indexes = [
+            Index(fields=['date', 'status'], name='region_stat_date_status_idx'),
+        ]
+
+
+class ThreadDailyVisit(Model):
+    thread = ForeignKey('apps.Thread', CASCADE, related_name='daily_visits')
+    date = DateField()
+    visits = IntegerField(default=0)
+    unique_visits = IntegerField(default=0)
+
+    class Meta:
+        unique_together = 'thread', 'date'
+
 
 class WishList(Model):
     user = ForeignKey('apps.User', CASCADE, related_name="wishlist")
@@ -185,13 +418,51 @@ class Thread(Model):
     def discount_price(self):
         return self.product.price - self.discount
 
+class CompetitionScore(Model):
+    user = OneToOneField('apps.User', CASCADE, primary_key=True, related_name='competition_score')
+    delivered_count = IntegerField(default=0)
+
+    class Meta:
+        indexes = [Index(fields=['-delivered_count'], name='competition_score_idx')]
+
+
 class SiteSettings(Model):
     delivery_price = DecimalField(max_digits=9, decimal_places=2)
     competition_thumbnail = ImageField(upload_to="site/", default='site/')
+    competition_thumbnail_variants = JSONField(default=dict, blank=True, editable=False)
     competition_start = DateField(null=True)
     competition_finish = DateField(null=True)
     competition_description =RichTextUploadingField(null=True)
 
+    VERSION_KEY = 'site-settings:version'
+    _local = None
+
+    @classmethod
+    def load(cls):
+        """
+        The single settings row, served from a process-local copy that is
+        checked against a version key in the shared cache.
+        """
+        version = cache.get(cls.VERSION_KEY)
+        if version is None:
+            version = uuid4().hex
+            cache.add(cls.VERSION_KEY, version, None)
+            version = cache.get(cls.VERSION_KEY, version)
+        if cls._local is not None and cls._local[0] == version:
+            return cls._local[1]
+        key = f'site-settings:{version}'
+        site = cache.get(key, cls)
+        if site is cls:
+            site = cls.objects.first()
+            cache.set(key, site, None)
+        cls._local = version, site
+        return site
+
+    @classmethod
+    def invalidate(cls):
+        cls._local = None
+        cache.set(cls.VERSION_KEY, uuid4().hex, None)
+
 
 class Payment(Model):
     class PaymentStatus(TextChoices):
@@ -202,6 +473,28 @@ class Payment(Model):
     pay_at = DateTimeField(auto_now_add=True, null=True, blank=True)
     user = ForeignKey('apps.User', SET_NULL, null=True, blank=True, related_name="payments")
     receipt = ImageField(upload_to="payments/", null=True, blank=True)
+    receipt_variants = JSONField(default=dict, blank=True, editable=False)
     comment = TextField(null=True, blank=True)
     status = CharField(choices=PaymentStatus, max_length=255, default=PaymentStatus.REVIEW)
     card_number = CharField(max_length=20)
+
+
+class BalanceTransaction(Model):
+    class Kind(TextChoices):
+        OPENING = 'opening', 'Opening'
+        ORDER_DELIVERED = 'order delivered', 'Order Delivered'
+        PAYMENT = 'payment', 'Payment'
+        PAYMENT_REFUND = 'payment refund', 'Payment Refund'
+        ADJUSTMENT = 'adjustment', 'Adjustment'
+    user = ForeignKey('apps.User', CASCADE, related_name='transactions')
+    amount = DecimalField(max_digits=11, decimal_places=2)
+    kind = CharField(max_length=20, choices=Kind)
+    order = ForeignKey('apps.Order', SET_NULL, null=True, blank=True, related_name='transactions')
+    payment = ForeignKey('apps.Payment', SET_NULL, null=True, blank=True, related_name='transactions')
+    idempotency_key = CharField(max_length=64, unique=True)
+    created_at = DateTimeField(auto_now_add=True)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Balance transactions are append-only")
+        return super().save(*args, **kwargs)
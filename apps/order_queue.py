@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Case, When, BooleanField
+from django.utils import timezone
+
+from apps.models import Order
+
+LEASE = timedelta(seconds=getattr(settings, 'ORDER_LEASE_SECONDS', 15 * 60))
+
+
+def claimable(now, user=None):
+    condition = Q(hold_until__isnull=True) | Q(hold_until__lt=now)
+    if user is not None:
+        condition |= Q(held_by=user)
+    return condition
+
+
+def filter_orders(queryset, params):
+    category_id = params.get('category_id')
+    district_id = params.get('district_id')
+    if category_id:
+        queryset = queryset.filter(product__category_id=category_id)
+    if district_id:
+        queryset = queryset.filter(district_id=district_id)
+    return queryset
+
+
+def annotate_held(queryset, user):
+    """``held`` is True while another operator's lease on the order is live."""
+    now = timezone.now()
+    return queryset.annotate(held=Case(
+        When(Q(hold_until__gte=now) & ~Q(held_by=user), then=True),
+        default=False, output_field=BooleanField()))
+
+
+def claim_orders(user, count, queryset=None):
+    """
+    Lease up to ``count`` unclaimed orders (oldest first) to ``user``.
+
+    Candidate rows are locked with ``FOR UPDATE SKIP LOCKED`` so concurrent
+    operators get disjoint batches; the conditional UPDATE keeps this safe on
+    backends without row locks too.
+    """
+    now = timezone.now()
+    queryset = Order.objects.all() if queryset is None else queryset
+    with transaction.atomic():
+        order_ids = list(queryset.select_for_update(skip_locked=True).filter(claimable(now)).order_by(
+            'created_at', 'id').values_list('pk', flat=True)[:count])
+        Order.objects.filter(claimable(now), pk__in=order_ids).update(held_by=user, hold_until=now + LEASE)
+    return Order.objects.filter(pk__in=order_ids, held_by=user, hold_until=now + LEASE)
+
+
+def claim_order(user, order_id):
+    """Take or renew the lease on one order; False if someone else holds it."""
+    now = timezone.now()
+    return bool(Order.objects.filter(claimable(now, user), pk=order_id).update(held_by=user, hold_until=now + LEASE))
+
+
+def holds_lease(user, order_id):
+    return Order.objects.filter(pk=order_id, held_by=user, hold_until__gte=timezone.now()).exists()
+
+
+def release_order(user, order_id):
+    Order.objects.filter(pk=order_id, held_by=user).update(held_by=None, hold_until=None)
@@ -0,0 +1,83 @@
+import hashlib
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.utils.http import urlencode
+
+VERSION_KEY = 'catalog:version'
+TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 300)
+tracked = set()
+
+
+def catalog_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate():
+    """Moves every cached catalog page and fragment to a fresh key space."""
+    cache.set(VERSION_KEY, uuid4().hex, None)
+
+
+def count(name, outcome):
+    key = f'page-cache:{name}:{outcome}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def counters():
+    keys = {f'page-cache:{name}:{outcome}': (name, outcome) for name in tracked for outcome in ('hits', 'misses')}
+    result = {name: {'hits': 0, 'misses': 0} for name in tracked}
+    for key, value in cache.get_many(keys).items():
+        name, outcome = keys[key]
+        result[name][outcome] = value
+    return result
+
+
+class AnonymousPageCacheMixin:
+    """
+    Serves the whole rendered page to anonymous visitors from the cache,
+    keyed by the catalog version and the ``cache_params`` of the query string.
+    """
+    cache_name = None
+    cache_params = 'category_slug', 'cursor', 'format'
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.cache_name:
+            tracked.add(cls.cache_name)
+
+    def get_page_cache_key(self):
+        params = urlencode(sorted((name, self.request.GET[name]) for name in self.cache_params
+                                  if name in self.request.GET))
+        digest = hashlib.md5(params.encode()).hexdigest()
+        return f'page:{catalog_version()}:{self.cache_name}:{digest}'
+
+    def is_cacheable(self, request):
+        return (request.method in ('GET', 'HEAD') and not request.user.is_authenticated
+                and not len(messages.get_messages(request)))
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+        key = self.get_page_cache_key()
+        response = cache.get(key)
+        if response is not None:
+            count(self.cache_name, 'hits')
+            return response
+        count(self.cache_name, 'misses')
+        response = super().dispatch(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        # a page that hands out a CSRF token or sets cookies belongs to one visitor
+        if response.status_code == 200 and not response.cookies and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+            cache.set(key, response, TIMEOUT)
+        return response
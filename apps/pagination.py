@@ -0,0 +1,126 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import Http404, JsonResponse
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder truncates to milliseconds, which would skip rows
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, next_url):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.next_url = next_url
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginationMixin:
+    """
+    Cursor pagination for ListView on a unique, indexed ordering.
+
+    The cursor carries the keyset values of the last row on the page, so the
+    next page is a range scan (``WHERE (created_at, id) < (...)``) instead of
+    an OFFSET. Add ``?format=json`` to get the same page as JSON.
+    """
+    paginate_by = 24
+    keyset = ('-created_at', '-id')
+    cursor_kwarg = 'cursor'
+
+    def get_keyset(self):
+        return self.keyset
+
+    def encode_cursor(self, obj):
+        values = [getattr(obj, name.lstrip('-')) for name in self.get_keyset()]
+        raw = json.dumps(values, cls=CursorEncoder).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, model, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        except (ValueError, binascii.Error):
+            raise Http404("Invalid cursor")
+        keyset = self.get_keyset()
+        if not isinstance(values, list) or len(values) != len(keyset):
+            raise Http404("Invalid cursor")
+        decoded = []
+        for name, value in zip(keyset, values):
+            name = name.lstrip('-')
+            try:
+                field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+                value = field.to_python(value)
+            except FieldDoesNotExist:
+                pass
+            except ValidationError:
+                raise Http404("Invalid cursor")
+            decoded.append(value)
+        return decoded
+
+    def keyset_filter(self, values):
+        condition = Q()
+        equal = {}
+        for name, value in zip(self.get_keyset(), values):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        return condition
+
+    def paginate_queryset(self, queryset, page_size):
+        queryset = queryset.order_by(*self.get_keyset())
+        cursor = self.request.GET.get(self.cursor_kwarg)
+        if cursor:
+            queryset = queryset.filter(self.keyset_filter(self.decode_cursor(queryset.model, cursor)))
+        object_list = list(queryset[:page_size + 1])
+        next_cursor = next_url = None
+        if len(object_list) > page_size:
+            object_list = object_list[:page_size]
+            next_cursor = self.encode_cursor(object_list[-1])
+            params = self.request.GET.copy()
+            params[self.cursor_kwarg] = next_cursor
+            next_url = '?' + params.urlencode()
+        page = KeysetPage(object_list, next_cursor, next_url)
+        return None, page, object_list, page.has_next()
+
+    def get_json_item(self, obj):
+        raise NotImplementedError
+
+    def render_to_response(self, context, **response_kwargs):
+        if self.request.GET.get('format') == 'json':
+            page = context['page_obj']
+            return JsonResponse({
+                'results': [self.get_json_item(obj) for obj in page.object_list],
+                'next': page.next_cursor,
+            })
+        return super().render_to_response(context, **response_kwargs)
+
+
+class CatalogPaginationMixin(KeysetPaginationMixin):
+    def get_json_item(self, product):
+        return {
+            'id': product.pk,
+            'title': product.title,
+            'slug': product.slug,
+            'price': product.price,
+            'image': product.image.url if product.image else None,
+            'category': product.category.name,
+            'category_slug': product.category.slug,
+        }
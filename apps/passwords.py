@@ -0,0 +1,25 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='password-rehash')
+
+
+def rehash(pk, old_hash, raw_password):
+    try:
+        # skip the write if the password was changed in the meantime
+        get_user_model().objects.filter(pk=pk, password=old_hash).update(password=make_password(raw_password))
+    except Exception:
+        logger.exception("Rehashing the password of user %s failed", pk)
+    finally:
+        close_old_connections()
+
+
+def schedule_rehash(user, raw_password):
+    """Upgrades a hash made with outdated hasher settings without making the login wait for it."""
+    executor.submit(rehash, user.pk, user.password, raw_password)
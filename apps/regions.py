@@ -0,0 +1,108 @@
+from collections import namedtuple
+from uuid import uuid4
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from apps.models import Region, District
+
+VERSION_KEY = 'regions:version'
+
+
+class RegionEntry(namedtuple('RegionEntry', 'id name districts')):
+    @property
+    def pk(self):
+        return self.id
+
+
+class DistrictEntry(namedtuple('DistrictEntry', 'id name region_id')):
+    @property
+    def pk(self):
+        return self.id
+
+
+class RegionTree:
+    def __init__(self, version, regions):
+        self.version = version
+        self.regions = regions
+        self.by_id = {region.id: region for region in regions}
+        self.districts_by_id = {district.id: district for region in regions for district in region.districts}
+
+    def region(self, region_id):
+        return self.by_id.get(region_id)
+
+    def district(self, district_id):
+        return self.districts_by_id.get(district_id)
+
+    def region_of(self, district_id):
+        district = self.districts_by_id.get(district_id)
+        return district and district.region_id
+
+    def districts(self, region_id):
+        region = self.by_id.get(region_id)
+        return region.districts if region else ()
+
+    def as_json(self):
+        return {
+            'version': self.version,
+            'regions': [{
+                'id': region.id,
+                'name': region.name,
+                'districts': [{'id': district.id, 'name': district.name} for district in region.districts],
+            } for region in self.regions],
+        }
+
+
+def build(version):
+    districts = {}
+    for pk, name, region_id in District.objects.order_by('pk').values_list('pk', 'name', 'region_id'):
+        districts.setdefault(region_id, []).append(DistrictEntry(pk, name, region_id))
+    return RegionTree(version, [RegionEntry(pk, name, tuple(districts.get(pk, ())))
+                                for pk, name in Region.objects.order_by('pk').values_list('pk', 'name')])
+
+
+_local = None
+
+
+def get_tree():
+    """
+    The region -> district map, kept per process and in the shared cache
+    under a version key that changes whenever a Region or District does.
+    """
+    global _local
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    if _local is not None and _local.version == version:
+        return _local
+    key = f'regions:{version}'
+    tree = cache.get(key)
+    if tree is None:
+        tree = build(version)
+        cache.set(key, tree, None)
+    _local = tree
+    return tree
+
+
+async def aget_tree():
+    global _local
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, uuid4().hex, None)
+        version = await cache.aget(VERSION_KEY)
+    if _local is not None and _local.version == version:
+        return _local
+    key = f'regions:{version}'
+    tree = await cache.aget(key)
+    if tree is None:
+        tree = await sync_to_async(build)(version)
+        await cache.aset(key, tree, None)
+    _local = tree
+    return tree
+
+
+def invalidate():
+    global _local
+    _local = None
+    cache.set(VERSION_KEY, uuid4().hex, None)
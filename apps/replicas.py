@@ -0,0 +1,98 @@
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+config = {'ALIAS': 'replica', 'VIEWS': [], 'PIN_SECONDS': 5, **getattr(settings, 'REPLICA_ROUTING', {})}
+PIN_COOKIE = 'db_pin'
+
+current = ContextVar('replica_routing', default=None)
+
+
+class Routing:
+    """What the router needs to know about the request being served."""
+
+    def __init__(self, request, pinned=False):
+        self.request = request
+        self.pinned = pinned
+        self.wrote = False
+
+
+def replica_alias():
+    return config['ALIAS'] if config['ALIAS'] in settings.DATABASES else None
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of the views in REPLICA_ROUTING['VIEWS'] to the replica and
+    everything else to the primary. After the first write a request reads from
+    the primary only, and so does its client for PIN_SECONDS (see
+    ReplicaMiddleware). Commands, signals outside requests and atomic blocks
+    always use the primary.
+    """
+
+    def __init__(self):
+        self.replica = replica_alias()
+        self.views = set(config['VIEWS'])
+
+    def db_for_read(self, model, **hints):
+        routing = current.get()
+        if self.replica is None or routing is None or routing.pinned:
+            return DEFAULT_DB_ALIAS
+        match = routing.request.resolver_match
+        if match is None or match.url_name not in self.views or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return self.replica
+
+    def db_for_write(self, model, **hints):
+        routing = current.get()
+        if routing is not None:
+            routing.pinned = routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replica gets its schema from the primary
+        return db != self.replica
+
+
+class ReplicaMiddleware:
+    """Keeps the routing state of the request, and the pin cookie of clients that wrote recently."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if replica_alias() is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        routing = Routing(request, pinned=PIN_COOKIE in request.COOKIES)
+        token = current.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(routing, response)
+
+    async def __acall__(self, request):
+        routing = Routing(request, pinned=PIN_COOKIE in request.COOKIES)
+        token = current.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(routing, response)
+
+    def finish(self, routing, response):
+        if routing.wrote:
+            response.set_cookie(PIN_COOKIE, '1', max_age=config['PIN_SECONDS'], httponly=True, samesite='Lax')
+        return response
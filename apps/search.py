@@ -0,0 +1,200 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q, Case, When, Value, IntegerField
+from django.utils.html import strip_tags
+from django.utils.module_loading import import_string
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def clean_text(value):
+    """CKEditor HTML -> plain text suitable for indexing."""
+    text = strip_tags(value or "")
+    text = re.sub(r"&[a-zA-Z]+;|&#\d+;", " ", text)
+    return " ".join(text.split())
+
+
+def product_document(product):
+    category = product.category.name if product.category_id else ""
+    return product.title or "", category, clean_text(product.description)
+
+
+class BaseSearchBackend:
+    table = "apps_product_search"
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def create_index(self):
+        raise NotImplementedError
+
+    def drop_index(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def index(self, products):
+        raise NotImplementedError
+
+    def remove(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        placeholders = ", ".join(["%s"] * len(product_ids))
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE {self.key} IN ({placeholders})", product_ids)
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def search(self, query, limit=None):
+        """Return product ids ordered by relevance."""
+        raise NotImplementedError
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """FTS5 virtual table, ranked with bm25 (title > category > description)."""
+    key = "rowid"
+
+    def create_index(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                "title, category, body, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+
+    def index(self, products):
+        rows = [(product.pk, *product_document(product)) for product in products]
+        if not rows:
+            return
+        self.remove(row[0] for row in rows)
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, title, category, body) VALUES (%s, %s, %s, %s)", rows
+            )
+
+    def build_query(self, query):
+        words = WORD_RE.findall(query or "")
+        return " ".join(f'"{word}"*' for word in words)
+
+    def search(self, query, limit=None):
+        match = self.build_query(query)
+        if not match:
+            return []
+        sql = (f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+               f"ORDER BY bm25({self.table}, 10.0, 5.0, 1.0)")
+        params = [match]
+        if limit:
+            sql += " LIMIT %s"
+            params.append(limit)
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """tsvector column with a GIN index, ranked with ts_rank_cd."""
+    key = "product_id"
+    config = "simple"
+
+    def create_index(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "product_id bigint PRIMARY KEY REFERENCES apps_product (id) ON DELETE CASCADE, "
+                "document tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_document_idx ON {self.table} USING GIN (document)"
+            )
+
+    def index(self, products):
+        rows = [(product.pk, *product_document(product)) for product in products]
+        if not rows:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table} (product_id, document) VALUES (%s, "
+                f"setweight(to_tsvector('{self.config}', %s), 'A') || "
+                f"setweight(to_tsvector('{self.config}', %s), 'B') || "
+                f"setweight(to_tsvector('{self.config}', %s), 'D')) "
+                "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                rows,
+            )
+
+    def search(self, query, limit=None):
+        words = WORD_RE.findall(query or "")
+        if not words:
+            return []
+        tsquery = " & ".join(f"{word}:*" for word in words)
+        sql = (f"SELECT product_id FROM {self.table}, to_tsquery('{self.config}', %s) query "
+               "WHERE document @@ query ORDER BY ts_rank_cd(document, query) DESC, product_id DESC")
+        params = [tsquery]
+        if limit:
+            sql += " LIMIT %s"
+            params.append(limit)
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+
+class ContainsSearchBackend(BaseSearchBackend):
+    """No index: every word must occur in the title, category or description; title matches first."""
+
+    def create_index(self):
+        pass
+
+    def drop_index(self):
+        pass
+
+    def index(self, products):
+        pass
+
+    def remove(self, product_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, query, limit=None):
+        from apps.models import Product
+
+        words = WORD_RE.findall(query or "")
+        if not words:
+            return []
+        products = Product.objects.using(self.connection.alias)
+        in_title = Q()
+        for word in words:
+            products = products.filter(
+                Q(title__icontains=word) | Q(category__name__icontains=word) | Q(description__icontains=word))
+            in_title &= Q(title__icontains=word)
+        rank = Case(When(in_title, then=Value(0)), default=Value(1), output_field=IntegerField())
+        product_ids = products.annotate(rank=rank).order_by("rank", "-pk").values_list("pk", flat=True)
+        return list(product_ids[:limit] if limit else product_ids)
+
+
+BACKENDS = {
+    "sqlite": SQLiteSearchBackend,
+    "postgresql": PostgresSearchBackend,
+}
+
+
+def get_backend(using=None):
+    conn = using or connection
+    backend = getattr(settings, "SEARCH_BACKEND", None)
+    backend_class = import_string(backend) if backend else BACKENDS.get(conn.vendor, ContainsSearchBackend)
+    return backend_class(conn)
+
+
+def search_products(query, limit=None):
+    return get_backend().search(query, limit=limit)
+
+
+def index_products(products):
+    get_backend().index(products)
+
+
+def remove_products(product_ids):
+    get_backend().remove(product_ids)
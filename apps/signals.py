@@ -0,0 +1,101 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete
+from django.dispatch import receiver
+
+from apps import stats, leaderboard, images, page_cache, regions, inventory, categories
+from apps.models import Product, Category, Order, SiteSettings, Payment, Region, District
+from apps.search import index_products, remove_products
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    index_products([instance])
+    images.schedule(instance)
+    transaction.on_commit(page_cache.invalidate)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    remove_products([instance.pk])
+    transaction.on_commit(page_cache.invalidate)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    transaction.on_commit(page_cache.invalidate)
+    transaction.on_commit(categories.invalidate)
+    if not created:
+        index_products(instance.products.select_related('category'))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    transaction.on_commit(page_cache.invalidate)
+    transaction.on_commit(categories.invalidate)
+
+
+@receiver(pre_save, sender=Order)
+@receiver(pre_delete, sender=Order)
+def order_pre_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    stats.remember_order(instance)
+    leaderboard.remember_order(instance)
+    inventory.remember_order(instance)
+
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    stats.order_saved(instance)
+    leaderboard.order_saved(instance)
+    inventory.order_saved(instance)
+    instance.refresh_loaded_values()
+
+
+@receiver(pre_delete, sender=Order)
+def order_pre_delete(sender, instance, **kwargs):
+    # the reservation row goes with the order; its units must go back first
+    inventory.release(instance)
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    stats.order_deleted(instance)
+    leaderboard.order_deleted(instance)
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    images.schedule(instance)
+
+
+@receiver(post_save, sender=SiteSettings)
+def site_settings_saved(sender, instance, raw=False, **kwargs):
+    # after commit, so a concurrent load() can't cache the old row under the new version
+    transaction.on_commit(SiteSettings.invalidate)
+    if raw:
+        return
+    images.schedule(instance)
+    # the competition window may have moved; the cached settings still hold the old one until commit
+    leaderboard.rebuild(window=(instance.competition_start, instance.competition_finish))
+
+
+@receiver(post_delete, sender=SiteSettings)
+def site_settings_deleted(sender, instance, **kwargs):
+    transaction.on_commit(SiteSettings.invalidate)
+
+
+@receiver(post_save, sender=Region)
+@receiver(post_delete, sender=Region)
+@receiver(post_save, sender=District)
+@receiver(post_delete, sender=District)
+def region_changed(sender, **kwargs):
+    transaction.on_commit(regions.invalidate)
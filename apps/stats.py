@@ -0,0 +1,171 @@
+from django.db import transaction, IntegrityError
+from django.db.models import F, Sum, Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from apps import regions
+from apps.models import Order, ThreadDailyStat, ThreadDailyVisit, RegionDailyStat
+
+STATUS_COUNT_KEYS = {
+    Order.StatusType.NEW: 'new',
+    Order.StatusType.READY_TO_DELIVERY: 'ready',
+    Order.StatusType.DELIVERING: 'delivering',
+    Order.StatusType.DELIVERED: 'delivered',
+    Order.StatusType.NOT_CALL: 'not_call',
+    Order.StatusType.CANCELED: 'canceled',
+    Order.StatusType.ARCHIVED: 'archived',
+}
+
+
+def order_stat_key(thread_id, status, updated_at):
+    if thread_id is None or updated_at is None:
+        return None
+    return thread_id, timezone.localdate(updated_at), status
+
+
+def bump(key, delta):
+    thread_id, date, status = key
+    query = ThreadDailyStat.objects.filter(thread_id=thread_id, date=date, status=status)
+    if query.update(count=F('count') + delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            ThreadDailyStat.objects.create(thread_id=thread_id, date=date, status=status, count=delta)
+    except IntegrityError:
+        query.update(count=F('count') + delta)
+
+
+def region_stat_key(district_id, status, created_at):
+    if created_at is None:
+        return None
+    return regions.get_tree().region_of(district_id), timezone.localdate(created_at), status
+
+
+def bump_region(key, delta):
+    region_id, date, status = key
+    # rows for orders without a region are not covered by the unique index; totals are summed anyway
+    query = RegionDailyStat.objects.filter(region_id=region_id, date=date, status=status)
+    if query.update(count=F('count') + delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            RegionDailyStat.objects.create(region_id=region_id, date=date, status=status, count=delta)
+    except IntegrityError:
+        query.update(count=F('count') + delta)
+
+
+def remember_order(order):
+    """Called before an order is saved; keeps the keys it is currently counted under."""
+    order._stat_key = order_stat_key(order.loaded_value('thread_id'), order.loaded_value('status'),
+                                     order.loaded_value('updated_at'))
+    order._region_stat_key = region_stat_key(order.loaded_value('district_id'), order.loaded_value('status'),
+                                             order.loaded_value('created_at'))
+
+
+def order_saved(order):
+    old_key = getattr(order, '_stat_key', None)
+    new_key = order_stat_key(order.thread_id, order.status, order.updated_at)
+    if old_key != new_key:
+        if old_key:
+            bump(old_key, -1)
+        if new_key:
+            bump(new_key, 1)
+    old_key = getattr(order, '_region_stat_key', None)
+    new_key = region_stat_key(order.district_id, order.status, order.created_at)
+    if old_key != new_key:
+        if old_key:
+            bump_region(old_key, -1)
+        if new_key:
+            bump_region(new_key, 1)
+
+
+def order_deleted(order):
+    key = getattr(order, '_stat_key', None)
+    if key:
+        bump(key, -1)
+    key = getattr(order, '_region_stat_key', None)
+    if key:
+        bump_region(key, -1)
+
+
+def thread_statistics(threads, start=None, end=None):
+    """
+    Per-thread order counts by status for ``start <= date <= end`` read from
+    the daily rollup, plus the column totals.
+    """
+    threads = list(threads.values('id', 'name', 'visit_count', 'product__title'))
+    rows = {thread['id']: thread for thread in threads}
+    for thread in threads:
+        for key in STATUS_COUNT_KEYS.values():
+            thread[f'{key}_count'] = 0
+
+    stats = ThreadDailyStat.objects.filter(thread_id__in=list(rows))
+    if start:
+        stats = stats.filter(date__gte=start)
+    if end:
+        stats = stats.filter(date__lte=end)
+    for item in stats.values('thread_id', 'status').annotate(total=Sum('count')):
+        key = STATUS_COUNT_KEYS.get(item['status'])
+        if key:
+            rows[item['thread_id']][f'{key}_count'] = item['total']
+
+    for thread in threads:
+        thread['unique_visits'] = 0
+    daily_visits = ThreadDailyVisit.objects.filter(thread_id__in=list(rows))
+    if start:
+        daily_visits = daily_visits.filter(date__gte=start)
+    if end:
+        daily_visits = daily_visits.filter(date__lte=end)
+    for item in daily_visits.values('thread_id').annotate(total=Sum('unique_visits')):
+        rows[item['thread_id']]['unique_visits'] = item['total']
+
+    totals = {
+        'visit_total': sum(thread['visit_count'] for thread in threads),
+        'unique_visit_total': sum(thread['unique_visits'] for thread in threads),
+    }
+    for key in STATUS_COUNT_KEYS.values():
+        totals[f'{key}_total'] = sum(thread[f'{key}_count'] for thread in threads)
+    return threads, totals
+
+
+def region_statistics_query(start=None, end=None, statuses=None):
+    """Order counts per region for ``start <= created date <= end``, largest first."""
+    query = RegionDailyStat.objects.all()
+    if start:
+        query = query.filter(date__gte=start)
+    if end:
+        query = query.filter(date__lte=end)
+    if statuses:
+        query = query.filter(status__in=statuses)
+    return query.values_list('region_id').annotate(total=Sum('count')).filter(total__gt=0).order_by('-total')
+
+
+def region_statistics(start=None, end=None, statuses=None):
+    return list(region_statistics_query(start, end, statuses))
+
+
+async def aregion_statistics(start=None, end=None, statuses=None):
+    return [row async for row in region_statistics_query(start, end, statuses)]
+
+
+def region_rollup_rows():
+    tree = regions.get_tree()
+    totals = {}
+    rows = Order.objects.values('district_id', 'status', date=TruncDate('created_at')).annotate(
+        count=Count('id')).order_by()
+    for row in rows:
+        key = tree.region_of(row['district_id']), row['date'], row['status']
+        totals[key] = totals.get(key, 0) + row['count']
+    return [RegionDailyStat(region_id=region_id, date=date, status=status, count=count)
+            for (region_id, date, status), count in totals.items()]
+
+
+def rebuild(batch_size=1000):
+    rows = Order.objects.filter(thread__isnull=False).values(
+        'thread_id', 'status', date=TruncDate('updated_at')).annotate(count=Count('id')).order_by()
+    with transaction.atomic():
+        ThreadDailyStat.objects.all().delete()
+        ThreadDailyStat.objects.bulk_create((ThreadDailyStat(**row) for row in rows), batch_size=batch_size)
+        RegionDailyStat.objects.all().delete()
+        RegionDailyStat.objects.bulk_create(region_rollup_rows(), batch_size=batch_size)
+    return ThreadDailyStat.objects.count() + RegionDailyStat.objects.count()
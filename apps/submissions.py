@@ -0,0 +1,112 @@
+import re
+import secrets
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+
+from apps.checkout import place_order
+from apps.models import Order
+from apps.throttle import Throttle
+
+SALT = 'apps.order-form'
+PENDING = 0  # cached while the order of a claimed key is being inserted
+
+
+def config():
+    return {
+        'TOKEN_MAX_AGE': 24 * 60 * 60,
+        'WINDOW': 10 * 60,
+        'PHONE': (5, 60 * 60),
+        'IP': (30, 60 * 60),
+        **getattr(settings, 'ORDER_SUBMISSIONS', {}),
+    }
+
+
+def normalize_phone(phone):
+    # the last nine digits, so "+998 90 123-45-67" and "901234567" are the same buyer
+    return re.sub(r'\D', '', phone or '')[-9:]
+
+
+def issue_token(product):
+    return signing.dumps([product.pk, secrets.token_urlsafe(9)], salt=SALT)
+
+
+def check_token(token, product):
+    """The nonce of a token issued for ``product`` within TOKEN_MAX_AGE, or None."""
+    try:
+        product_id, nonce = signing.loads(token or '', salt=SALT, max_age=config()['TOKEN_MAX_AGE'])
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    return nonce if product_id == product.pk else None
+
+
+def throttles():
+    conf = config()
+    return Throttle('order-phone', *conf['PHONE']), Throttle('order-ip', *conf['IP'])
+
+
+def throttled(phone, ip):
+    """Checked before anything else; every submission counts against its IP, placed orders against the phone."""
+    phone_throttle, ip_throttle = throttles()
+    if ip_throttle.is_blocked(ip) or phone_throttle.is_blocked(normalize_phone(phone)):
+        return True
+    ip_throttle.fail(ip)
+    return False
+
+
+athrottled = sync_to_async(throttled)
+
+
+def claim(key, timeout):
+    """
+    None once this submission holds ``key``, else the pk of the order placed
+    under it, or PENDING while that insert is still running. Never waits: this
+    runs on the shared sync thread under ASGI.
+    """
+    while not cache.add(key, PENDING, timeout):
+        pk = cache.get(key)
+        if pk is not None:
+            return pk
+        # released meanwhile; try to take it again
+    return None
+
+
+def place(order, nonce):
+    """
+    Inserts ``order`` unless its form token was used already, or the same phone
+    ordered the same product through the same thread within the window. Returns
+    the order standing for this submission, and whether it was created now; the
+    order is None while a concurrent duplicate is still being inserted, and the
+    view answers that right away.
+    """
+    conf = config()
+    phone = normalize_phone(order.phone_number)
+    keys = {
+        f'order-submit:token:{nonce}': conf['TOKEN_MAX_AGE'],
+        f'order-submit:{phone}:{order.product_id}:{order.thread_id or 0}': conf['WINDOW'],
+    }
+    claimed = []
+    try:
+        for key, timeout in keys.items():
+            pk = claim(key, timeout)
+            if pk is not None:
+                existing = Order.objects.select_related('product', 'thread').filter(pk=pk).first() if pk else None
+                if existing is not None or pk == PENDING:
+                    cache.delete_many(claimed)
+                    return existing, False
+                # the order was deleted since; this submission takes the key over
+                cache.set(key, PENDING, timeout)
+            claimed.append(key)
+        place_order(order)
+    except BaseException:
+        cache.delete_many(claimed)
+        raise
+    for key, timeout in keys.items():
+        cache.set(key, order.pk, timeout)
+    throttles()[0].fail(phone)
+    return order, True
+
+
+aplace = sync_to_async(place)
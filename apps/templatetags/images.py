@@ -0,0 +1,31 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.forms.utils import flatatt
+from django.utils.html import format_html, format_html_join
+
+register = template.Library()
+
+
+def srcset(paths):
+    items = sorted(paths.items(), key=lambda item: int(item[0]))
+    return format_html_join(', ', '{} {}w', ((default_storage.url(path), width) for width, path in items))
+
+
+@register.simple_tag
+def responsive_image(image, variants=None, sizes='100vw', alt='', **attrs):
+    """
+    ``<picture>`` with WebP and JPEG ``srcset`` from the generated variants,
+    or a plain ``<img>`` of the original until they exist.
+
+        {% responsive_image product.image product.image_variants sizes="320px" class="img-fluid" %}
+    """
+    if not image:
+        return ''
+    attrs = flatatt({'alt': alt, 'loading': 'lazy', **attrs})
+    if not variants or not variants.get('jpeg'):
+        return format_html('<img src="{}"{}>', image.url, attrs)
+    jpeg = variants['jpeg']
+    largest = default_storage.url(jpeg[max(jpeg, key=int)])
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}"><img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        srcset(variants['webp']), sizes, largest, srcset(jpeg), sizes, attrs)
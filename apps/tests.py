@@ -1,3 +1,1074 @@
-from django.test import TestCase
+import os
+import re
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO, BytesIO
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction, connection, IntegrityError, DatabaseError
+from django.forms import modelform_factory
+from django.http import HttpResponse
+from django.template import Template, Context
+from django.test import TestCase, SimpleTestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse, resolve
+from django.utils import timezone
+
+from apps import page_cache, regions, metrics, inventory, submissions, replicas, order_queue, visits, throttle, \
+    search, ledger, categories, leaderboard, images
+from apps.forms import AuthForm, OrderAdminForm
+from apps.models import Category, Product, User, Region, District, Order, WishList, Thread, Payment, SiteSettings, \
+    StockReservation, SlugCounters, BalanceTransaction, ThreadDailyStat, RegionDailyStat
+from apps.search import index_products, search_products
+
+
+class QueryBudgetTests(TestCase):
+    """Every list view must run the same number of queries at 10, 100 and 1000 rows."""
+    sizes = 10, 100, 1000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(phone_number='998901234567', password='1', role=User.RoleType.OPERATOR)
+        cls.category = Category.objects.create(name='Kitoblar', icon='https://example.com/i.png')
+        cls.region = Region.objects.create(name='Toshkent')
+        cls.district = District.objects.create(name='Chilonzor', region=cls.region)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def fill_products(self, size):
+        count = Product.objects.count()
+        products = Product.objects.bulk_create([
+            Product(title=f'Kitob {i}', slug=f'kitob-{i}', category=self.category, price=1000,
+                    description='<p>Kitob</p>', image='products/kitob.png')
+            for i in range(count, size)
+        ])
+        index_products(Product.objects.select_related('category').filter(pk__in=[p.pk for p in products]))
+        return Product.objects.first()
+
+    def fill_orders(self, size, **extra):
+        product = self.fill_products(1)
+        thread = Thread.objects.get_or_create(owner=self.user, product=product,
+                                              defaults={'discount': 0, 'name': 'Oqim'})[0]
+        count = Order.objects.count()
+        Order.objects.bulk_create([
+            Order(product=product, thread=thread, customer=self.user, operator=self.user, district=self.district,
+                  fullname='Ali', phone_number='901234567', total=1000, **extra)
+            for _ in range(count, size)
+        ])
+
+    def fill_wishlist(self, size):
+        self.fill_products(size)
+        WishList.objects.bulk_create([WishList(user=self.user, product=product) for product in
+                                      Product.objects.exclude(wishlist__user=self.user)[:size]])
+
+    def fill_threads(self, size):
+        self.fill_products(size)
+        Thread.objects.bulk_create([Thread(owner=self.user, product=product, discount=0, name='Oqim') for product in
+                                    Product.objects.exclude(threads__owner=self.user)[:size]])
+
+    def fill_payments(self, size):
+        count = Payment.objects.count()
+        Payment.objects.bulk_create([Payment(user=self.user, amount=1000, card_number='8600123412341234')
+                                     for _ in range(count, size)])
+
+    def assertQueryBudget(self, url, budget, fill):
+        for size in self.sizes:
+            fill(size)
+            cache.clear()
+            # reference data is served warm in production
+            regions.get_tree()
+            with self.subTest(url=url, size=size), self.assertNumQueries(budget):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+    # product grids add one query for the wishlist hearts of the logged-in user
+    def test_home(self):
+        self.assertQueryBudget(reverse('home'), 5, self.fill_products)
+
+    def test_product_list(self):
+        self.assertQueryBudget(reverse('product-list') + '?category_slug=kitoblar', 5, self.fill_products)
+
+    def test_market_list(self):
+        self.assertQueryBudget(reverse('market-list'), 5, self.fill_products)
+        self.assertQueryBudget(reverse('market-list') + '?category_slug=top', 5, self.fill_products)
+
+    def test_search(self):
+        self.assertQueryBudget(reverse('search') + '?search=kitob', 4, self.fill_products)
+
+    def test_order_list(self):
+        self.assertQueryBudget(reverse('order-list'), 3, self.fill_orders)
+
+    def test_wishlist(self):
+        self.assertQueryBudget(reverse('wish'), 4, self.fill_wishlist)
+
+    def test_thread_list(self):
+        self.assertQueryBudget(reverse('thread-list'), 3, self.fill_threads)
+
+    def test_statistics(self):
+        self.assertQueryBudget(reverse('thread-statistic') + '?period=all', 5, self.fill_threads)
+
+    def test_competition(self):
+        self.assertQueryBudget(reverse('thread-competition'), 4,
+                               lambda size: self.fill_orders(size, status=Order.StatusType.DELIVERED))
+
+    def test_payments(self):
+        self.assertQueryBudget(reverse('pay-form'), 3, self.fill_payments)
+
+    def test_operator_orders(self):
+        self.assertQueryBudget(reverse('operator-orders'), 4, self.fill_orders)
+
+    def test_wishlist_toggle(self):
+        self.fill_wishlist(10)
+        product = Product.objects.create(title='Kitob', slug='kitob', category=self.category, price=1000,
+                                         description='<p>Kitob</p>', image='products/kitob.png')
+        url = reverse('wishlist', args=[product.pk])
+        # session, user, then delete, insert and count in one transaction
+        with self.assertNumQueries(7):
+            self.assertEqual(self.client.get(url).json(), {'clicked': True, 'count': 11})
+        with self.assertNumQueries(6):
+            self.assertEqual(self.client.get(url).json(), {'clicked': False, 'count': 10})
+        heart = re.compile(rf'like-button ?(bg-danger)?"[^>]*data-product-id="{product.pk}"')
+        self.assertIsNone(heart.search(self.client.get(reverse('market-list')).text)[1])
+        self.client.get(url)
+        self.assertIsNotNone(heart.search(self.client.get(reverse('market-list')).text)[1])
+        self.assertContains(self.client.get(reverse('wish')), '<span class="wishlist-count">11</span>')
+
+
+class SlugTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Kitoblar', icon='https://example.com/i.png')
+
+    def create_product(self, title):
+        return Product.objects.create(title=title, category=self.category, price=1000, description='Kitob')
+
+    def test_allocate(self):
+        self.assertEqual(self.category.slug, 'kitoblar')
+        slugs = [self.create_product('Kitob').slug for _ in range(3)]
+        self.assertEqual(slugs, ['kitob', 'kitob-2', 'kitob-3'])
+        self.assertEqual(self.create_product('Kitob 2').slug, 'kitob-2-2')
+        # slug lookup, savepoint, insert, two statements for the search index, release
+        with self.assertNumQueries(6):
+            self.create_product('Kitob')
+
+    def test_allocation_matches_by_prefix(self):
+        for slug in ('kitob', 'kitob-7', 'kitob-bola', 'kitob-9-2'):
+            Product.objects.bulk_create([Product(title='Kitob', slug=slug, category=self.category, price=1000,
+                                                 description='Kitob')])
+        with self.assertNumQueries(1) as queries:
+            self.assertEqual(Product.allocate_slug('Kitob'), 'kitob-8')
+        self.assertNotIn('REGEXP', queries.captured_queries[0]['sql'].upper())
+
+    def test_slug_taken_meanwhile_is_allocated_again(self):
+        self.create_product('Kitob')
+        stale = Product.allocate_slug
+        # the first lookup misses the slug a concurrent save just took
+        with mock.patch.object(Product, 'allocate_slug', side_effect=['kitob', stale('Kitob')]):
+            product = self.create_product('Kitob')
+        self.assertEqual(product.slug, 'kitob-2')
+        with mock.patch.object(Product, 'allocate_slug', return_value='kitob'), \
+                self.assertRaises(IntegrityError), transaction.atomic():
+            self.create_product('Kitob')
+
+    def test_unchanged_title_keeps_slug(self):
+        self.create_product('Kitob')
+        product = self.create_product('Kitob')
+        product = Product.objects.select_related('category').get(pk=product.pk)
+        # update, then two statements for the search index
+        with self.assertNumQueries(3):
+            product.save()
+        self.assertEqual(product.slug, 'kitob-2')
+        product.title = 'Daftar'
+        product.save()
+        self.assertEqual(product.slug, 'daftar')
+
+    def test_assign_slugs(self):
+        self.create_product('Kitob')
+        products = [Product(title=title, category=self.category, price=1000, description='Kitob')
+                    for title in ('Kitob', 'Kitob', 'Kitob 2', 'Daftar')]
+        with self.assertNumQueries(1):
+            Product.assign_slugs(products)
+        self.assertEqual([product.slug for product in products], ['kitob-2', 'kitob-3', 'kitob-2-2', 'daftar'])
+
+    def test_assign_slugs_reads_only_new_bases(self):
+        self.create_product('Kitob')
+        self.create_product('Kitob')
+        self.create_product('Daftar')
+        counters = SlugCounters()
+        with self.assertNumQueries(1) as queries:
+            Product.assign_slugs([Product(title='Kitob')], counters)
+        self.assertNotIn('daftar', queries.captured_queries[0]['sql'])
+        self.assertEqual(dict(counters), {'kitob': 3, 'kitob-3': 1})
+        with self.assertNumQueries(0):
+            batch = Product.assign_slugs([Product(title='Kitob')], counters)
+        self.assertEqual(batch[0].slug, 'kitob-4')
+        # kitob-3 was only assigned in memory, so its base is still read once
+        with self.assertNumQueries(1):
+            batch = Product.assign_slugs([Product(title='Kitob 3')], counters)
+        self.assertEqual(batch[0].slug, 'kitob-3-2')
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Adabiyot', icon='https://example.com/i.png')
+
+    def create_product(self, title, description='<p>Sifatli</p>'):
+        return Product.objects.create(title=title, category=self.category, price=1000, description=description)
+
+    def test_title_matches_rank_first(self):
+        in_body = self.create_product('Daftar', '<p>Bolalar uchun <b>ertak</b> kitobi</p>')
+        in_title = self.create_product('Ertak kitobi')
+        self.assertEqual(search_products('ertak'), [in_title.pk, in_body.pk])
+        self.assertEqual(search_products('ertak', limit=1), [in_title.pk])
+        self.assertEqual(search_products('  '), [])
+
+    def test_prefix_and_scripts(self):
+        latin = self.create_product("O'zbekcha lug'at")
+        cyrillic = self.create_product('Ўзбекча луғат')
+        accented = self.create_product('Café menyusi')
+        self.assertEqual(search_products('lug'), [latin.pk])
+        self.assertEqual(search_products('ЛУҒ'), [cyrillic.pk])
+        self.assertEqual(search_products('cafe'), [accented.pk])
+        # every word has to match
+        self.assertEqual(search_products('ўзбекча lug'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        product = self.create_product('Kitob')
+        self.assertEqual(search_products('kitob'), [product.pk])
+        product.title = 'Daftar'
+        product.save()
+        self.assertEqual(search_products('kitob'), [])
+        self.assertEqual(search_products('daftar'), [product.pk])
+        self.category.name = 'Jurnallar'
+        self.category.save()
+        self.assertEqual(search_products('jurnal'), [product.pk])
+        product.delete()
+        self.assertEqual(search_products('daftar'), [])
+
+    def test_other_databases_fall_back_to_contains(self):
+        in_body = self.create_product('Daftar', '<p>Ertak kitobi</p>')
+        in_title = self.create_product('Ertak')
+        with mock.patch.dict(search.BACKENDS, clear=True):
+            backend = search.get_backend()
+            self.assertIsInstance(backend, search.ContainsSearchBackend)
+            backend.index([in_title])
+            self.assertEqual(search_products('ertak'), [in_title.pk, in_body.pk])
+            self.assertEqual(search_products('kitob ertak'), [in_body.pk])
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Kitoblar', icon='https://example.com/i.png')
+        Product.objects.create(title='Kitob', category=self.category, price=1000, description='Kitob',
+                               image='products/kitob.png')
+
+    def test_anonymous_pages_are_cached_until_the_catalog_changes(self):
+        url = reverse('product-list') + '?category_slug=kitoblar'
+        self.assertContains(self.client.get(url), 'Kitob')
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(url), 'Kitob')
+        self.assertEqual(page_cache.counters()['product-list'], {'hits': 1, 'misses': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(title='Daftar', category=self.category, price=1000, description='Daftar')
+        self.assertContains(self.client.get(url), 'Daftar')
+
+    def test_market_cards_show_current_free_stock(self):
+        self.client.force_login(User.objects.create_user(phone_number='998901234567', password='1'))
+        product = Product.objects.get()
+        Product.objects.filter(pk=product.pk).update(quantity=5)
+        self.assertContains(self.client.get(reverse('market-list')), '<strong> 5 ta </strong>')
+        order = Order.objects.create(product=product, fullname='Ali', phone_number='901234567', total=1000,
+                                     quantity=2)
+        order.status = Order.StatusType.READY_TO_DELIVERY
+        order.save()
+        self.assertContains(self.client.get(reverse('market-list')), '<strong> 3 ta </strong>')
+
+    def test_market_list_is_cached_for_anonymous_visitors(self):
+        url = reverse('market-list')
+        self.assertNotIn('csrftoken', self.client.get(url).cookies)
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(url), 'Kitob')
+        self.assertEqual(page_cache.counters()['market-list'], {'hits': 1, 'misses': 1})
+
+    def test_logged_in_pages_are_not_cached(self):
+        user = User.objects.create_user(phone_number='998901234567', password='1')
+        self.client.force_login(user)
+        self.client.get(reverse('home'))
+        self.assertEqual(page_cache.counters()['home'], {'hits': 0, 'misses': 0})
+
+
+class SubmissionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        SiteSettings.objects.create(delivery_price=500)
+        category = Category.objects.create(name='Kitoblar', icon='https://example.com/i.png')
+        self.product = Product.objects.create(title='Kitob', category=category, price=10000, description='Kitob')
+        self.url = reverse('order-submit', args=[self.product.slug])
+
+    def submit(self, phone_number='901234567', token=None):
+        return self.client.post(self.url, {'fullname': 'Ali', 'phone_number': phone_number, 'product': self.product.pk,
+                                           'token': token or submissions.issue_token(self.product)})
+
+    def test_form_carries_a_token(self):
+        response = self.client.get(reverse('order-form', args=[self.product.slug]))
+        self.assertIsNotNone(submissions.check_token(response.context['order_token'], self.product))
+
+    def test_repeated_submission_returns_the_existing_order(self):
+        first = self.submit().context['order']
+        self.assertEqual(self.submit(phone_number='+998 90 123-45-67').context['order'], first)
+        token = submissions.issue_token(self.product)
+        self.submit(phone_number='907654321', token=token)
+        self.assertEqual(self.submit(phone_number='901111111', token=token).context['order'].phone_number, '907654321')
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_duplicate_of_an_insert_in_flight_is_answered_right_away(self):
+        cache.set(f'order-submit:901234567:{self.product.pk}:0', submissions.PENDING, 60)
+        self.assertEqual(self.submit().status_code, 302)
+        self.assertFalse(Order.objects.exists())
+
+    def test_order_form_does_not_take_posts(self):
+        response = self.client.post(reverse('order-form', args=[self.product.slug]),
+                                    {'fullname': 'Ali', 'phone_number': '901234567', 'product': self.product.pk})
+        self.assertEqual(response.status_code, 405)
+        self.assertFalse(Order.objects.exists())
+
+    def test_missing_or_foreign_token_is_refused(self):
+        other = Product.objects.create(title='Daftar', category=self.product.category, price=100, description='D')
+        self.assertEqual(self.submit(token='forged').status_code, 302)
+        self.assertEqual(self.submit(token=submissions.issue_token(other)).status_code, 302)
+        self.assertFalse(Order.objects.exists())
+
+    def test_floods_are_dropped_before_the_database(self):
+        with self.settings(ORDER_SUBMISSIONS={'WINDOW': 0, 'PHONE': (2, 60), 'IP': (3, 60)}):
+            self.submit()
+            self.submit()
+            with self.assertNumQueries(0):
+                self.assertEqual(self.submit().status_code, 302)
+            self.submit(phone_number='907654321')
+            with self.assertNumQueries(0):
+                self.submit(phone_number='905555555')
+        self.assertEqual(Order.objects.count(), 3)
+
+
+class AuthTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('auth')
+
+    def test_signup_then_login(self):
+        self.client.post(self.url, {'phone_number': '998901234567', 'password': 'secret'})
+        user = User.objects.get(phone_number='998901234567')
+        self.assertTrue(user.check_password('secret'))
+        self.client.logout()
+        with self.assertNumQueries(1):
+            self.assertTrue(AuthForm({'phone_number': '998901234567', 'password': 'secret'}).is_valid())
+
+    def test_failed_attempts_are_throttled(self):
+        User.objects.create_user(phone_number='998901234567', password='secret')
+        for i in range(5):
+            self.assertFalse(AuthForm({'phone_number': '998901234567', 'password': f'guess{i}'}).is_valid())
+        # refused without touching the database, even with the right password
+        with self.assertNumQueries(0):
+            self.assertFalse(AuthForm({'phone_number': '998901234567', 'password': 'secret'}).is_valid())
+
+    @mock.patch.object(throttle.ip_throttle, 'limit', 3)
+    def test_signups_are_throttled_per_ip(self):
+        request = RequestFactory().post(self.url, REMOTE_ADDR='192.0.2.1')
+        for i in range(3):
+            self.assertTrue(AuthForm({'phone_number': f'99890123456{i}', 'password': 'secret'}, request=request).is_valid())
+        self.assertFalse(AuthForm({'phone_number': '998909999999', 'password': 'secret'}, request=request).is_valid())
+        self.assertFalse(User.objects.filter(phone_number='998909999999').exists())
+
+    def test_client_ip_takes_the_entry_added_by_the_trusted_proxies(self):
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='10.9.9.9, 198.51.100.7, 10.0.0.2',
+                                       REMOTE_ADDR='10.0.0.3')
+        for hops, ip in ((0, '10.0.0.3'), (True, '10.0.0.2'), (2, '198.51.100.7'), (4, '10.0.0.3')):
+            with mock.patch.dict(throttle.config, TRUST_X_FORWARDED_FOR=hops):
+                self.assertEqual(throttle.client_ip(request), ip)
+
+
+class SiteSettingsTests(TestCase):
+    def test_cached_settings_move_on_commit(self):
+        cache.clear()
+        site = SiteSettings.objects.create(delivery_price=500)
+        self.assertEqual(SiteSettings.load().delivery_price, 500)
+        site.delivery_price = 700
+        with self.captureOnCommitCallbacks(execute=True):
+            site.save()
+            # still the committed row until the transaction ends
+            self.assertEqual(SiteSettings.load().delivery_price, 500)
+        self.assertEqual(SiteSettings.load().delivery_price, 700)
+
+    def test_moved_competition_window_rebuilds_the_board(self):
+        cache.clear()
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        site = SiteSettings.objects.create(delivery_price=500, competition_start=tomorrow)
+        seller = User.objects.create_user(phone_number='998901234567', password='1')
+        category = Category.objects.create(name='Kitoblar', icon='https://example.com/i.png')
+        product = Product.objects.create(title='Kitob', category=category, price=1000, description='Kitob')
+        thread = Thread.objects.create(owner=seller, product=product, discount=0, name='Oqim')
+        Order.objects.create(product=product, thread=thread, fullname='Ali', phone_number='901234567', total=1000,
+                             status=Order.StatusType.DELIVERED)
+        self.assertEqual(leaderboard.get_leaderboard().top(), [])
+
+        site.competition_start = None
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            site.save()
+        self.assertEqual(leaderboard.get_leaderboard().count(seller.pk), 1)
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.site = SiteSettings.objects.create(delivery_price=500)
+        category = Category.objects.create(name='Kitoblar', icon='https://example.com/i.png')
+        self.product = Product.objects.create(title='Kitob', category=category, price=1000, description='Kitob',
+                                              quantity=100)
+        self.sellers = [User.objects.create(phone_number=f'99890123456{i}', username=f'seller{i}') for i in range(3)]
+        self.threads = [Thread.objects.create(owner=seller, product=self.product, discount=0, name='Oqim')
+                        for seller in self.sellers]
+
+    def deliver(self, thread, **extra):
+        return Order.objects.create(product=self.product, thread=thread, fullname='Ali', phone_number='901234567',
+                                    total=1000, status=Order.StatusType.DELIVERED, **extra)
+
+    def counts(self):
+        board = leaderboard.get_leaderboard()
+        return [board.count(seller.pk) for seller in self.sellers]
+
+    def test_delivery_counts_and_reversal_uncounts(self):
+        order = Order.objects.create(product=self.product, thread=self.threads[0], fullname='Ali',
+                                     phone_number='901234567', total=1000)
+        self.assertEqual(self.counts(), [0, 0, 0])
+        order.status = Order.StatusType.DELIVERED
+        order.save()
+        self.assertIsNotNone(order.delivered_at)
+        self.assertEqual(self.counts(), [1, 0, 0])
+        order.save()
+        self.assertEqual(self.counts(), [1, 0, 0])
+
+        order.thread = self.threads[1]
+        order.save()
+        self.assertEqual(self.counts(), [0, 1, 0])
+        order.status = Order.StatusType.CANCELED
+        order.save()
+        self.assertIsNone(order.delivered_at)
+        self.assertEqual(self.counts(), [0, 0, 0])
+
+    def test_deleting_a_delivered_order_uncounts(self):
+        order = self.deliver(self.threads[0])
+        self.deliver(self.threads[0])
+        self.assertEqual(self.counts(), [2, 0, 0])
+        order.delete()
+        self.assertEqual(self.counts(), [1, 0, 0])
+
+    def test_orders_outside_the_window_are_ignored(self):
+        today = timezone.localdate()
+        self.site.competition_start = today + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.site.save()
+        order = self.deliver(self.threads[0])
+        self.assertEqual(self.counts(), [0, 0, 0])
+        # reverting an order that was never counted does not go below zero
+        order.status = Order.StatusType.CANCELED
+        order.save()
+        self.assertEqual(self.counts(), [0, 0, 0])
+
+        self.site.competition_start, self.site.competition_finish = today, today
+        with self.captureOnCommitCallbacks(execute=True):
+            self.site.save()
+        self.deliver(self.threads[1])
+        self.assertEqual(self.counts(), [0, 1, 0])
+
+    def test_ties_share_a_rank(self):
+        for thread, delivered in zip(self.threads, (2, 1, 2)):
+            for _ in range(delivered):
+                self.deliver(thread)
+        board = leaderboard.get_leaderboard()
+        self.assertEqual([entry['user_id'] for entry in board.top()], [self.sellers[0].pk, self.sellers[2].pk,
+                                                                        self.sellers[1].pk])
+        self.assertEqual([board.rank(seller.pk) for seller in self.sellers], [1, 3, 1])
+        self.assertIsNone(board.rank(0))
+        self.assertEqual(leaderboard.rebuild(), 3)
+        self.assertEqual(self.counts(), [2, 1, 2])
+
+
+class VisitTests(TestCase):
+    def setUp(self):
+        self.buffer = visits.VisitBuffer(max_attempts=2)
+        self.buffer.worker = mock.Mock()  # flushed by the test, not in the background
+
+    def test_failing_visits_are_dropped_after_max_attempts(self):
+        self.buffer.add(1)
+        with mock.patch('apps.visits.add_daily_visits', side_effect=DatabaseError), \
+                self.assertLogs('apps.visits', 'ERROR'):
+            with self.assertRaises(DatabaseError):
+                self.buffer.flush()
+            self.assertEqual(self.buffer.pending(1), 1)
+            with self.assertRaises(DatabaseError):
+                self.buffer.flush()
+        self.assertEqual(self.buffer.pending(1), 0)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_visitor_key_ignores_untrusted_forwarded_for(self):
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='10.0.0.1', REMOTE_ADDR='192.0.2.1',
+                                       HTTP_USER_AGENT='Firefox')
+        self.assertEqual(visits.visitor_key(request, AnonymousUser()), '192.0.2.1:Firefox')
+
+
+class MetricsTests(TestCase):
+    def test_views_are_recorded_and_exported(self):
+        Category.objects.create(name='Kitoblar', icon='https://example.com/i.png')
+        metrics.recent.clear()
+        self.client.get(reverse('product-list'))
+        record = metrics.recent[-1]
+        self.assertEqual(record['view'], 'product-list')
+        self.assertEqual(record['queries'], len(record['statements']))
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['template_time'], 0)
+        response = self.client.get(reverse('metrics'))
+        self.assertContains(response, 'django_view_duration_seconds_count{view="product-list",method="GET",status="200"}')
+
+
+class GenerateDataTests(TestCase):
+    def test_small_run(self):
+        call_command('generate_data', users=200, products=50, threads=20, orders=500, payments=10, stdout=StringIO())
+        self.assertEqual(Order.objects.count(), 500)
+        self.assertEqual(set(Order.objects.values_list('status', flat=True)), set(Order.StatusType.values))
+        self.assertEqual(Product.objects.filter(slug__isnull=True).count(), 0)
+        # created_at is spread over the past instead of all being "now"
+        self.assertGreater(Order.objects.dates('created_at', 'day').count(), 100)
+
+
+class CatalogTests(TestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        category = Category.objects.create(name='Kitoblar', icon='https://example.com/i.png')
+        Product.objects.create(title='Kitob', category=category, price=Decimal('1500.50'), seller_price=100,
+                               quantity=7, description='<p>Ertak, "qo\'shtirnoq"</p>')
+        Product.objects.create(title='Ўзбекча луғат', category=category, price=2000, description='Lug\'at')
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def command(self, name, *args, **options):
+        output = StringIO()
+        call_command(name, *args, stdout=output, stderr=StringIO(), **options)
+        return output.getvalue()
+
+    def rows(self):
+        return (list(Category.objects.order_by('slug').values_list('slug', 'name', 'icon')),
+                list(Product.objects.order_by('slug').values_list(
+                    'slug', 'title', 'category__slug', 'price', 'seller_price', 'quantity', 'description')))
+
+    def test_export_then_import_into_an_empty_database(self):
+        before = self.rows()
+        self.command('export_catalog', 'category', self.path('categories.csv'))
+        self.command('export_catalog', 'product', self.path('products.jsonl'))
+        Product.objects.all().delete()
+        Category.objects.all().delete()
+
+        self.command('import_catalog', 'category', self.path('categories.csv'))
+        self.assertIn('2 new', self.command('import_catalog', 'product', self.path('products.jsonl')))
+        self.assertEqual(self.rows(), before)
+        self.assertEqual(search_products('ertak'), [Product.objects.get(title='Kitob').pk])
+        # importing the same file again changes nothing
+        self.assertIn('0 new, 0 updated', self.command('import_catalog', 'product', self.path('products.jsonl')))
+
+    def test_dry_run_writes_nothing(self):
+        before = self.rows()
+        with open(self.path('products.csv'), 'w') as file:
+            file.write('slug,title,category,price,description\nkitob,Kitob 2,kitoblar,900,\n,Daftar,kitoblar,500,Daftar\n')
+        with CaptureQueriesContext(connection) as queries:
+            output = self.command('import_catalog', 'product', self.path('products.csv'), dry_run=True)
+        self.assertIn('Validated 2 product rows (1 new, 1 updated, 0 errors)', output)
+        self.assertEqual(self.rows(), before)
+        self.assertEqual([query['sql'] for query in queries if not query['sql'].startswith('SELECT')], [])
+
+    def test_rows_with_a_known_slug_update_that_product(self):
+        product = Product.objects.get(slug='kitob')
+        with open(self.path('products.jsonl'), 'w') as file:
+            file.write('{"slug": "kitob", "title": "Kitob 2", "category": "Kitoblar", "price": "900"}\n')
+            file.write('{"slug": "kitob", "price": "-"}\n')
+        output = self.command('import_catalog', 'product', self.path('products.jsonl'))
+        self.assertIn('0 new, 1 updated, 1 errors', output)
+        product.refresh_from_db()
+        self.assertEqual((product.title, product.price, product.quantity), ('Kitob 2', 900, 7))
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(search_products('kitob 2'), [product.pk])
+
+
+class ExplainQueriesTests(TestCase):
+    def test_order_queries_use_an_index(self):
+        call_command('generate_data', users=50, products=10, threads=10, orders=300, payments=5, stdout=StringIO())
+        User.objects.create_user(phone_number='998900000001', password='1', role=User.RoleType.OPERATOR)
+        out = StringIO()
+        call_command('explain_queries', only=['order', 'operator', 'claim'], strict=True, stdout=out,
+                     stderr=StringIO())
+        self.assertIn('operator queue', out.getvalue())
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.router = replicas.ReplicaRouter()
+        self.router.replica = 'replica'
+
+    def read_in(self, url_name, cookies=None):
+        request = RequestFactory().get(reverse(url_name))
+        request.COOKIES.update(cookies or {})
+        request.resolver_match = resolve(request.path)
+        routing = replicas.Routing(request, pinned=replicas.PIN_COOKIE in request.COOKIES)
+        token = replicas.current.set(routing)
+        try:
+            return self.router.db_for_read(Product), routing
+        finally:
+            replicas.current.reset(token)
+
+    def test_read_heavy_views_read_from_the_replica(self):
+        self.assertEqual(self.read_in('home')[0], 'replica')
+        self.assertEqual(self.read_in('auth')[0], 'default')
+        # outside a request, and for clients that just wrote something
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+        self.assertEqual(self.read_in('home', {replicas.PIN_COOKIE: '1'})[0], 'default')
+
+    def test_a_write_pins_the_rest_of_the_request_to_the_primary(self):
+        _, routing = self.read_in('home')
+        token = replicas.current.set(routing)
+        try:
+            self.assertEqual(self.router.db_for_write(Product), 'default')
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+        finally:
+            replicas.current.reset(token)
+        self.assertTrue(routing.wrote)
+
+
+class ReplicaMiddlewareTests(TestCase):
+    def setUp(self):
+        def view(request):
+            if request.method == 'POST':
+                Region.objects.create(name='Toshkent')
+            self.pinned = replicas.current.get().pinned
+            return HttpResponse()
+
+        with mock.patch('apps.replicas.replica_alias', return_value='replica'):
+            self.middleware = replicas.ReplicaMiddleware(view)
+
+    def test_a_write_pins_the_client_to_the_primary(self):
+        response = self.middleware(RequestFactory().get('/'))
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+        self.assertFalse(self.pinned)
+        response = self.middleware(RequestFactory().post('/'))
+        cookie = response.cookies[replicas.PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], replicas.config['PIN_SECONDS'])
+        # the next request of the same client starts out pinned
+        request = RequestFactory().get('/')
+        request.COOKIES[replicas.PIN_COOKIE] = cookie.value
+        self.middleware(request)
+        self.assertTrue(self.pinned)
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = self.settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        # generate in the test's transaction instead of the worker pool
+        submit = mock.patch.object(images.executor, 'submit', lambda run, model, pk: images.update_variants(model, pk))
+        submit.start()
+        self.addCleanup(submit.stop)
+        self.category = Category.objects.create(name='Kitoblar', icon='https://example.com/i.png')
+
+    def upload(self, size=(800, 400), mode='RGBA'):
+        buffer = BytesIO()
+        Image.new(mode, size, 'red').save(buffer, 'PNG')
+        return SimpleUploadedFile('kitob.png', buffer.getvalue(), content_type='image/png')
+
+    def test_variants_are_generated_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(title='Kitob', category=self.category, price=1000, description='Kitob',
+                                             image=self.upload())
+        product.refresh_from_db()
+        variants = product.image_variants
+        self.assertEqual((variants['source'], variants['width'], variants['height']), (product.image.name, 800, 400))
+        self.assertEqual(sorted(variants['webp'], key=int), ['320', '640', '800'])
+        for path in [*variants['webp'].values(), *variants['jpeg'].values()]:
+            self.assertTrue(default_storage.exists(path))
+        with default_storage.open(variants['jpeg']['320']) as file:
+            self.assertEqual(Image.open(file).size, (320, 160))
+
+        html = Template('{% load images %}{% responsive_image product.image product.image_variants sizes="50vw" %}'
+                        ).render(Context({'product': product}))
+        self.assertIn('<source type="image/webp" srcset="/media/variants/', html)
+        self.assertIn('320w, /media/variants/', html)
+        self.assertIn('sizes="50vw"', html)
+
+        # until another image is uploaded
+        self.assertFalse(images.needs_variants(product))
+        product.image = 'products/other.png'
+        self.assertTrue(images.needs_variants(product))
+
+    def test_missing_variants_fall_back_to_the_original(self):
+        product = Product.objects.create(title='Kitob', category=self.category, price=1000, description='Kitob',
+                                         image='products/missing.png')
+        with self.assertLogs('apps.images', 'WARNING'):
+            self.assertIsNone(images.update_variants(Product, product.pk))
+        product.refresh_from_db()
+        self.assertEqual(product.image_variants, {})
+        html = Template('{% load images %}{% responsive_image product.image product.image_variants %}').render(
+            Context({'product': product}))
+        self.assertEqual(html, '<img src="/media/products/missing.png" alt="" loading="lazy">')
+        self.assertEqual(Template('{% load images %}{% responsive_image payment.receipt %}').render(
+            Context({'payment': Payment(amount=1)})), '')
+
+
+class RegionTreeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.region = Region.objects.create(name='Toshkent')
+        District.objects.create(name='Chilonzor', region=self.region)
+
+    def test_tree_is_versioned(self):
+        response = self.client.get(reverse('region-tree'))
+        version = response.json()['version']
+        self.assertEqual(response.json()['regions'][0]['districts'][0]['name'], 'Chilonzor')
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('region-tree'), {'v': version}, HTTP_IF_NONE_MATCH=f'"{version}"')
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('immutable', response['Cache-Control'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            District.objects.create(name='Yunusobod', region=self.region)
+        response = self.client.get(reverse('district-list'), {'region_id': self.region.pk})
+        self.assertEqual([district['name'] for district in response.json()], ['Chilonzor', 'Yunusobod'])
+        self.assertNotEqual(response['ETag'], f'"{version}"')
+
+
+class CategoryListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Kitoblar', icon='https://example.com/i.png')
+
+    def test_categories_are_cached_until_one_changes(self):
+        self.assertEqual([category.name for category in categories.get_categories()], ['Kitoblar'])
+        with self.assertNumQueries(0):
+            self.assertEqual(categories.get_categories()[0].slug, 'kitoblar')
+        categories._local = None  # another process still finds them in the shared cache
+        with self.assertNumQueries(0):
+            self.assertEqual(categories.get_categories()[0].pk, self.category.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Daftarlar', icon='https://example.com/d.png')
+        self.assertEqual([category.name for category in categories.get_categories()], ['Kitoblar', 'Daftarlar'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.delete()
+        self.assertEqual([category.name for category in categories.get_categories()], ['Daftarlar'])
+
+    def test_imported_categories_are_listed(self):
+        categories.get_categories()
+        with NamedTemporaryFile('w', suffix='.csv') as file:
+            file.write('name,icon\nDaftarlar,https://example.com/d.png\n')
+            file.flush()
+            call_command('import_catalog', 'category', file.name, stdout=StringIO())
+        self.assertEqual([category.name for category in categories.get_categories()], ['Kitoblar', 'Daftarlar'])
+
+
+class OrderStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.region = Region.objects.create(name='Toshkent')
+        self.other_region = Region.objects.create(name='Samarqand')
+        self.district = District.objects.create(name='Chilonzor', region=self.region)
+        self.other_district = District.objects.create(name='Urgut', region=self.other_region)
+        category = Category.objects.create(name='Kitoblar', icon='https://example.com/i.png')
+        self.product = Product.objects.create(title='Kitob', category=category, price=1000, description='Kitob',
+                                              quantity=100)
+        seller = User.objects.create(phone_number='998901234567', username='seller')
+        self.thread, self.other_thread = [Thread.objects.create(owner=seller, product=self.product, discount=0,
+                                                                name=name) for name in ('Oqim', 'Oqim 2')]
+        self.today = timezone.localdate()
+
+    def create_order(self, **extra):
+        return Order.objects.create(product=self.product, thread=self.thread, district=self.district,
+                                    fullname='Ali', phone_number='901234567', total=1000, **extra)
+
+    def thread_rows(self):
+        return {(row.thread_id, row.date, row.status): row.count
+                for row in ThreadDailyStat.objects.filter(count__gt=0)}
+
+    def region_rows(self):
+        return {(row.region_id, row.date, row.status): row.count
+                for row in RegionDailyStat.objects.filter(count__gt=0)}
+
+    def assertMatchesRebuild(self):
+        rows = self.thread_rows(), self.region_rows()
+        call_command('rebuild_order_stats', stdout=StringIO())
+        self.assertEqual((self.thread_rows(), self.region_rows()), rows)
+
+    def test_status_moves(self):
+        order = self.create_order()
+        self.create_order()
+        self.assertEqual(self.thread_rows(), {(self.thread.pk, self.today, 'new'): 2})
+        self.assertEqual(self.region_rows(), {(self.region.pk, self.today, 'new'): 2})
+
+        order.status = Order.StatusType.DELIVERED
+        order.save()
+        self.assertEqual(self.thread_rows(), {(self.thread.pk, self.today, 'new'): 1,
+                                              (self.thread.pk, self.today, 'delivered'): 1})
+        order.status = Order.StatusType.CANCELED
+        order.save()
+        self.assertEqual(self.thread_rows(), {(self.thread.pk, self.today, 'new'): 1,
+                                              (self.thread.pk, self.today, 'canceled'): 1})
+        self.assertEqual(self.region_rows(), {(self.region.pk, self.today, 'new'): 1,
+                                              (self.region.pk, self.today, 'canceled'): 1})
+        self.assertMatchesRebuild()
+
+    def test_thread_district_and_date_moves(self):
+        order = self.create_order()
+        order.thread = self.other_thread
+        order.district = self.other_district
+        order.save()
+        self.assertEqual(self.thread_rows(), {(self.other_thread.pk, self.today, 'new'): 1})
+        self.assertEqual(self.region_rows(), {(self.other_region.pk, self.today, 'new'): 1})
+
+        # threads count an order on the day of its last change, regions on the day it was placed
+        later = timezone.now() + timedelta(days=2)
+        order.created_at -= timedelta(days=3)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            order.save()
+        self.assertEqual(self.thread_rows(), {(self.other_thread.pk, timezone.localdate(later), 'new'): 1})
+        self.assertEqual(self.region_rows(),
+                         {(self.other_region.pk, self.today - timedelta(days=3), 'new'): 1})
+        self.assertMatchesRebuild()
+
+        order.delete()
+        self.assertEqual((self.thread_rows(), self.region_rows()), ({}, {}))
+
+
+class RegionStatisticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.region = Region.objects.create(name='Toshkent')
+        self.district = District.objects.create(name='Chilonzor', region=self.region)
+        category = Category.objects.create(name='Kitoblar', icon='https://example.com/i.png')
+        self.product = Product.objects.create(title='Kitob', category=category, price=1000, description='Kitob')
+
+    def create_order(self, **extra):
+        return Order.objects.create(product=self.product, fullname='Ali', phone_number='901234567', total=1000,
+                                    **extra)
+
+    def counts(self, **params):
+        data = self.client.get(reverse('region-orders-data'), params).json()
+        return dict(zip(data['regions'], data['numbers']))
+
+    def test_rollup_follows_orders(self):
+        order = self.create_order(district=self.district)
+        self.create_order()
+        self.assertEqual(self.counts(), {'Toshkent': 1, 'Nomaʼlum': 1})
+
+        order.status = Order.StatusType.DELIVERED
+        order.save()
+        self.assertEqual(self.counts(status='delivered'), {'Toshkent': 1})
+        self.assertEqual(self.counts(start='2000-01-01', end='2000-12-31'), {})
+
+        order.delete()
+        self.assertEqual(self.counts(), {'Nomaʼlum': 1})
+        self.assertEqual(self.client.get(reverse('region-orders-data'), {'start': 'yesterday'}).status_code, 400)
+
+
+class OrderQueueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        SiteSettings.objects.create(delivery_price=500)
+        category = Category.objects.create(name='Kitoblar', icon='https://example.com/i.png')
+        product = Product.objects.create(title='Kitob', category=category, price=1000, description='Kitob')
+        self.order = Order.objects.create(product=product, fullname='Ali', phone_number='901234567', total=1000)
+        self.operator = User.objects.create_user(phone_number='998900000001', password='1',
+                                                 role=User.RoleType.OPERATOR)
+        self.other = User.objects.create_user(phone_number='998900000002', password='1', role=User.RoleType.OPERATOR)
+
+    def test_claim_count_is_clamped(self):
+        self.client.force_login(self.operator)
+        response = self.client.post(reverse('operator-claim') + '?format=json', {'count': -3})
+        self.assertEqual(response.json(), {'claimed': [self.order.pk]})
+
+    def test_only_the_lease_holder_can_update(self):
+        order_queue.claim_order(self.operator, self.order.pk)
+        self.client.force_login(self.other)
+        response = self.client.post(reverse('order-detail', args=[self.order.pk]),
+                                    {'status': Order.StatusType.CANCELED, 'comment': 'x'})
+        self.assertRedirects(response, reverse('operator-orders'), fetch_redirect_response=False)
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.comment), (Order.StatusType.NEW, None))
+        self.client.force_login(self.operator)
+        self.client.post(reverse('order-detail', args=[self.order.pk]), {'status': Order.StatusType.CANCELED})
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.StatusType.CANCELED)
+
+
+class InventoryTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Kitoblar', icon='https://example.com/i.png')
+        self.product = Product.objects.create(title='Kitob', category=category, price=1000, description='Kitob',
+                                              quantity=3)
+
+    def create_order(self, quantity=2):
+        return Order.objects.create(product=self.product, fullname='Ali', phone_number='901234567', total=1000,
+                                    quantity=quantity)
+
+    def stock(self):
+        self.product.refresh_from_db()
+        return self.product.quantity, self.product.reserved
+
+    def test_reservation_follows_order_status(self):
+        first, second = self.create_order(), self.create_order()
+        first.status = Order.StatusType.READY_TO_DELIVERY
+        first.save()
+        self.assertEqual(self.stock(), (3, 2))
+
+        second.status = Order.StatusType.READY_TO_DELIVERY
+        with self.assertRaises(inventory.InsufficientStock), transaction.atomic():
+            second.save()
+        self.assertEqual(self.stock(), (3, 2))
+
+        first.status = Order.StatusType.DELIVERED
+        first.save()
+        self.assertEqual(self.stock(), (1, 0))
+        self.assertFalse(StockReservation.objects.exists())
+
+        third = self.create_order(quantity=1)
+        third.status = Order.StatusType.READY_TO_DELIVERY
+        third.save()
+        third.status = Order.StatusType.CANCELED
+        third.save()
+        self.assertEqual(self.stock(), (1, 0))
+
+    def test_expired_holds_are_released(self):
+        order = self.create_order()
+        order.status = Order.StatusType.READY_TO_DELIVERY
+        order.save()
+        self.assertEqual(inventory.expire(), 0)
+        self.assertEqual(inventory.expire(now=timezone.now() + inventory.HOLD + timedelta(minutes=1)), 1)
+        self.assertEqual(self.stock(), (3, 0))
+
+    def test_stale_product_save_keeps_reserved(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        order = self.create_order()
+        order.status = Order.StatusType.READY_TO_DELIVERY
+        order.save()
+        stale.title = 'Kitob 2'
+        stale.save()
+        self.assertEqual(self.stock(), (3, 2))
+        second = self.create_order()
+        second.status = Order.StatusType.READY_TO_DELIVERY
+        with self.assertRaises(inventory.InsufficientStock), transaction.atomic():
+            second.save()
+        # so neither the admin nor any other model form can set it
+        self.assertNotIn('reserved', modelform_factory(Product, fields='__all__').base_fields)
+
+    def test_admin_checks_stock_before_saving(self):
+        first, second = self.create_order(), self.create_order()
+        first.status = Order.StatusType.READY_TO_DELIVERY
+        first.save()
+        data = {**OrderAdminForm(instance=second).initial, 'status': Order.StatusType.READY_TO_DELIVERY}
+        form = OrderAdminForm(data, instance=second)
+        self.assertFalse(form.is_valid())
+        self.assertIn("Product soni yetarli emas!", form.non_field_errors())
+        self.assertTrue(OrderAdminForm({**data, 'status': Order.StatusType.CANCELED}, instance=second).is_valid())
+
+        # without an outer transaction the failed save leaves nothing behind
+        second.status = Order.StatusType.READY_TO_DELIVERY
+        with self.assertRaises(inventory.InsufficientStock):
+            second.save()
+        self.assertEqual(Order.objects.get(pk=second.pk).status, Order.StatusType.NEW)
+        self.assertEqual(self.stock(), (3, 2))
+
+    def test_admin_rejects_orders_the_stock_cannot_cover(self):
+        admin_user = User.objects.create_superuser(phone_number='998900000000', password='1')
+        self.client.force_login(admin_user)
+        data = {'product': self.product.pk, 'fullname': 'Ali', 'phone_number': '901234567', 'quantity': 4,
+                'total': 1000, 'status': Order.StatusType.READY_TO_DELIVERY}
+        response = self.client.post(reverse('admin:apps_order_add'), data)
+        self.assertContains(response, "Product soni yetarli emas!")
+        self.assertFalse(Order.objects.exists())
+
+        order = self.create_order(quantity=3)
+        response = self.client.post(reverse('admin:apps_order_change', args=[order.pk]), {**data, 'quantity': 3})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.stock(), (3, 3))
+        response = self.client.post(reverse('admin:apps_order_add'), {**data, 'quantity': 1})
+        self.assertContains(response, "Product soni yetarli emas!")
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(phone_number='998901234567', password='1')
+
+    def test_repeated_key_is_a_no_op(self):
+        entry = ledger.post(self.user.pk, 1000, BalanceTransaction.Kind.ORDER_DELIVERED, 'order:1:delivered')
+        self.assertIsNotNone(entry)
+        self.assertIsNone(ledger.post(self.user.pk, 1000, BalanceTransaction.Kind.ORDER_DELIVERED, 'order:1:delivered'))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 1000)
+
+    def test_other_integrity_errors_are_raised(self):
+        with mock.patch.object(BalanceTransaction.objects, 'create', side_effect=IntegrityError), \
+                self.assertRaises(IntegrityError):
+            ledger.post(self.user.pk, 1000, BalanceTransaction.Kind.ORDER_DELIVERED, 'order:1:delivered')
+
+    def test_refund_returns_only_what_was_debited(self):
+        ledger.post(self.user.pk, 5000, BalanceTransaction.Kind.ORDER_DELIVERED, 'order:1:delivered')
+        payment = Payment.objects.create(user=self.user, amount=2000, card_number='8600123412341234')
+        self.assertIsNone(ledger.refund_payment(payment))
+        ledger.debit_payment(payment)
+        payment.amount = 4000
+        payment.save()
+        self.assertEqual(ledger.refund_payment(payment).amount, 2000)
+        self.assertIsNone(ledger.refund_payment(payment))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, 5000)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        SiteSettings.objects.create(delivery_price=500)
+        category = Category.objects.create(name='Kitoblar', icon='https://example.com/i.png')
+        self.product = Product.objects.create(title='Kitob', category=category, price=10000, description='Kitob')
+        owner = User.objects.create_user(phone_number='998901234567', password='1')
+        self.thread = Thread.objects.create(owner=owner, product=self.product, discount=1000, name='Telegram')
+        self.url = reverse('order-submit', args=[self.product.slug])
+
+    def submit(self, **extra):
+        return self.client.post(self.url, {'fullname': 'Ali', 'phone_number': '901234567', 'product': self.product.pk,
+                                           'token': submissions.issue_token(self.product), **extra})
+
+    def test_total_is_computed_once_from_the_resolved_thread(self):
+        self.submit(thread=self.thread.pk)
+        # thread (with its product), savepoint, insert, the two rollup counters, release
+        with self.assertNumQueries(6):
+            self.assertEqual(self.submit(thread=self.thread.pk, phone_number='907654321').status_code, 200)
+        order = Order.objects.latest('pk')
+        self.assertEqual((order.thread, order.total), (self.thread, 9500))
+
+    def test_thread_of_another_product_is_ignored(self):
+        other = Product.objects.create(title='Daftar', category=self.product.category, price=100, description='D')
+        thread = Thread.objects.create(owner=self.thread.owner, product=other, discount=50, name='Instagram')
+        self.submit(thread=thread.pk)
+        order = Order.objects.latest('pk')
+        self.assertEqual((order.thread, order.total), (None, 10500))
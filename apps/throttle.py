@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.cache import cache
+
+config = getattr(settings, 'LOGIN_THROTTLE', {})
+
+
+class Throttle:
+    """
+    Counts failures per identifier in the shared cache over a fixed window;
+    once ``limit`` is reached further attempts are refused until it expires.
+    """
+
+    def __init__(self, scope, limit, window):
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+
+    def key(self, ident):
+        return f'throttle:{self.scope}:{ident}'
+
+    def failures(self, ident):
+        return cache.get(self.key(ident), 0)
+
+    def is_blocked(self, ident):
+        return bool(ident) and self.failures(ident) >= self.limit
+
+    def fail(self, ident):
+        if not ident:
+            return
+        key = self.key(ident)
+        # the window starts with the first failure and is not extended by later ones
+        if not cache.add(key, 1, self.window):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, 1, self.window)
+
+    def reset(self, ident):
+        cache.delete(self.key(ident))
+
+
+phone_throttle = Throttle('login-phone', *config.get('PHONE', (5, 15 * 60)))
+ip_throttle = Throttle('login-ip', *config.get('IP', (20, 15 * 60)))
+
+
+def client_ip(request):
+    # each trusted proxy appends the address it got the request from, so the client is that many
+    # entries from the right; whatever is further left was sent by the client itself
+    hops = int(config.get('TRUST_X_FORWARDED_FOR') or 0)
+    if hops:
+        forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+        if len(forwarded) >= hops and forwarded[-hops]:
+            return forwarded[-hops]
+    return request.META.get('REMOTE_ADDR', '')
@@ -5,12 +5,14 @@ from apps.views import HomeListView, AuthFormView, LogoutView, OrderFormView, wi
     ProfileUpdateView, OrderListView, district_view, UserChangePasswordView, SearchProductListView, WishListView, \
     MarketListView, ThreadCreateView, ThreadListView, ThreadDetailView, StatisticListView, CompetitionListView, \
     PaymentCreateView, \
-    OperatorOrderListView, OrderUpdateView, DiagramView, region_orders_data
+    OperatorOrderListView, OrderUpdateView, OrderClaimView, DiagramView, region_orders_data, \
+    page_cache_stats_view, region_tree_view, order_submit_view, metrics_view
 
 urlpatterns = [
     path('', HomeListView.as_view(), name="home"),
     path('product-list', ProductListView.as_view(), name="product-list"),
     path('district_list', district_view, name='district-list'),
+    path('api/regions/', region_tree_view, name='region-tree'),
     path('search', SearchProductListView.as_view(), name='search'),
 ]
 
@@ -26,6 +28,7 @@ urlpatterns += [
 urlpatterns += [
     path('order-list', OrderListView.as_view(), name="order-list"),
     path('order-form/<str:slug>', OrderFormView.as_view(), name='order-form'),
+    path('order-form/<str:slug>/submit', order_submit_view, name='order-submit'),
 ]
 # ---------------------- WishList --------------------------------------------------------
 urlpatterns += [
@@ -50,6 +53,7 @@ urlpatterns += [
 # --------------------------------------- Operator --------------------------------------------
 urlpatterns += [
     path('operator/order/list',  OperatorOrderListView.as_view(), name='operator-orders'),
+    path('operator/order/claim',  OrderClaimView.as_view(), name='operator-claim'),
     path('operator/order/update/<int:pk>',  OrderUpdateView.as_view(), name='order-detail')
 ]
 
@@ -57,4 +61,6 @@ urlpatterns += [
 urlpatterns += [
     path('diagram', DiagramView.as_view(), name='diagram'),
     path('api/region-orders/', region_orders_data, name='region-orders-data'),
+    path('api/page-cache/', page_cache_stats_view, name='page-cache-stats'),
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -2,33 +2,49 @@ from datetime import datetime, timedelta
 from itertools import product
 from os import eventfd_write
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login, logout
 from django.contrib.auth.hashers import check_password
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import ValidationError
-from django.db.models import Q, F
+from django.db import transaction
+from django.db.models import Q, F, Case, When, IntegerField, Value
 from django.db.models.aggregates import Count, Sum
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404, HttpResponse
 from django.shortcuts import redirect, render
-from django.urls import reverse_lazy
+from django.urls import reverse_lazy, reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.utils import timezone
 from django.views import View
 from django.views.generic import TemplateView, ListView, FormView, UpdateView, DetailView, CreateView
 
+from apps import stats, leaderboard, visits, ledger, order_queue, page_cache, regions, metrics, inventory, \
+    submissions, categories
 from apps.forms import AuthForm, ProfileModelForm, ChangePasswordForm, OrderModelForm, ThreadModelForm, \
     PaymentModelForm, OrderUpdateModelForm
-from apps.models import Category, Product, User, Region, District, Order, WishList, Thread, SiteSettings, Payment
+from apps.models import Product, User, Order, WishList, Thread, SiteSettings, Payment
+from apps.checkout import aresolve
+from apps.page_cache import AnonymousPageCacheMixin
+from apps.pagination import CatalogPaginationMixin, KeysetPaginationMixin
+from apps.search import search_products
+from apps.throttle import client_ip
 
 
 # Create your views here.
-class HomeListView(ListView):
-    queryset = Category.objects.all()
+class HomeListView(AnonymousPageCacheMixin, CatalogPaginationMixin, ListView):
+    cache_name = 'home'
+    queryset = Product.objects.select_related('category')
     template_name = 'apps/home.html'
-    context_object_name = "categories"
+    context_object_name = "products"
 
     def get_context_data(self, *args, **kwargs):
         data = super().get_context_data(*args, **kwargs)
-        data['products'] = Product.objects.all()
+        data['categories'] = categories.get_categories()
         return data
 
 
@@ -37,9 +53,12 @@ class AuthFormView(FormView):
     success_url = reverse_lazy("home")
     template_name = "apps/auth/auth-page.html"
 
+    def get_form_kwargs(self):
+        return {**super().get_form_kwargs(), 'request': self.request}
+
     def form_valid(self, form):
         user = form.user
-        login(self.request, user)
+        login(self.request, user, backend='django.contrib.auth.backends.ModelBackend')
         return super().form_valid(form)
 
     def form_invalid(self, form):
@@ -54,8 +73,9 @@ class LogoutView(View):
         return redirect('auth')
 
 
-class ProductListView(ListView):
-    queryset = Product.objects.select_related('category').all().filter()
+class ProductListView(AnonymousPageCacheMixin, CatalogPaginationMixin, ListView):
+    cache_name = 'product-list'
+    queryset = Product.objects.select_related('category')
     template_name = 'apps/product-list.html'
     context_object_name = 'products'
 
@@ -68,7 +88,7 @@ class ProductListView(ListView):
 
     def get_context_data(self, *args, **kwargs):
         data = super().get_context_data(*args, **kwargs)
-        data['categories'] = Category.objects.all()
+        data['categories'] = categories.get_categories()
         data['c_slug'] = self.request.GET.get('category_slug')
 
         return data
@@ -87,7 +107,10 @@ class ProfileUpdateView(LoginRequiredMixin, UpdateView):
 
     def get_context_data(self, **kwargs):
         data = super().get_context_data(**kwargs)
-        data['regions'] = Region.objects.all()
+        tree = regions.get_tree()
+        data['regions'] = tree.regions
+        data['regions_version'] = tree.version
+        data['user_district'] = tree.district(self.request.user.district_id)
         return data
 
     def form_invalid(self, form):
@@ -96,11 +119,34 @@ class ProfileUpdateView(LoginRequiredMixin, UpdateView):
         return super().form_invalid(form)
 
 
-def district_view(request):
-    region_id = request.GET.get("region_id")
-    districts = District.objects.filter(region_id=region_id).values("id", "name")
-    data = [{"id": district.get("id"), "name": district.get("name")} for district in districts]
-    return JsonResponse(data, safe=False)
+def reference_response(request, data, version):
+    """
+    JSON for the region tree: revalidated by ETag, or cached for good when
+    the client asks for the current version with ``?v=``.
+    """
+    etag = f'"{version}"'
+    response = get_conditional_response(request, etag=etag) or JsonResponse(data, safe=False)
+    response['ETag'] = etag
+    if request.GET.get('v') == version:
+        patch_cache_control(response, public=True, max_age=60 * 60 * 24 * 365, immutable=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+async def district_view(request):
+    tree = await regions.aget_tree()
+    try:
+        region_id = int(request.GET.get("region_id"))
+    except (TypeError, ValueError):
+        region_id = None
+    data = [{"id": district.id, "name": district.name} for district in tree.districts(region_id)]
+    return reference_response(request, data, tree.version)
+
+
+async def region_tree_view(request):
+    tree = await regions.aget_tree()
+    return reference_response(request, tree.as_json(), tree.version)
 
 
 class UserChangePasswordView(LoginRequiredMixin, FormView):
@@ -123,46 +169,76 @@ class UserChangePasswordView(LoginRequiredMixin, FormView):
         return super().form_invalid(form)
 
 
-class SearchProductListView(ListView):
-    queryset = Product.objects.all()
+class SearchProductListView(CatalogPaginationMixin, ListView):
+    queryset = Product.objects.select_related('category')
     template_name = 'apps/search-product-list.html'
     context_object_name = 'products'
+    keyset = ('search_rank',)
+    search_limit = 200
 
     def get_queryset(self):
         search = self.request.GET.get('search')
-        query = Product.objects.filter(
-            Q(title__icontains=search) | Q(description__icontains=search) | Q(category__name__icontains=search))
-        return query.distinct()
+        product_ids = search_products(search, limit=self.search_limit)
+        if not product_ids:
+            return super().get_queryset().none().annotate(search_rank=Value(0, IntegerField()))
+        ranking = Case(*[When(pk=pk, then=position) for position, pk in enumerate(product_ids)],
+                       output_field=IntegerField())
+        return super().get_queryset().filter(pk__in=product_ids).annotate(search_rank=ranking)
 
 
-class OrderFormView(CreateView):
+class OrderFormView(DetailView):
+    # GET only: the form posts to order_submit_view
     queryset = Product.objects.all()
-    form_class = OrderModelForm
     template_name = 'apps/order/order-form.html'
     context_object_name = 'product'
     slug_url_kwarg = 'slug'
 
-    def form_valid(self, form):
-        order = form.save(commit=False)
-        order.customer = self.request.user
-        order.save()
-        site = SiteSettings.objects.first()
-        return render(self.request, "apps/order/order-receive.html", context={"order": order, "site": site})
-
-    def form_invalid(self, form):
-        for error in form.errors.values():
-            messages.error(self.request, error)
-        return super().form_invalid(form)
-
     def get_context_data(self, **kwargs):
-        product_slug = self.kwargs.get('slug')
         data = super().get_context_data(**kwargs)
-        data['product'] = Product.objects.get(slug=product_slug)
+        data['order_token'] = submissions.issue_token(self.object)
         return data
 
 
+def back_to_form(request, slug):
+    referer = request.META.get('HTTP_REFERER')
+    if not url_has_allowed_host_and_scheme(referer, {request.get_host()}):
+        referer = reverse('order-form', args=[slug])
+    return redirect(referer)
+
+
+async def order_submit_view(request, slug):
+    if request.method != 'POST':
+        return redirect('order-form', slug=slug)
+    # floods are dropped on the cache alone, before any query
+    if await submissions.athrottled(request.POST.get('phone_number'), client_ip(request)):
+        messages.error(request, "Juda ko'p buyurtma yuborildi, birozdan keyin qayta urinib ko'ring")
+        return back_to_form(request, slug)
+    user = await request.auser()
+    checkout = await aresolve(slug, request.POST.get('thread'))
+    if checkout.product is None:
+        raise Http404("Product not found")
+    nonce = submissions.check_token(request.POST.get('token'), checkout.product)
+    if nonce is None:
+        messages.error(request, "Sahifa eskirgan, buyurtmani qaytadan yuboring")
+        return back_to_form(request, slug)
+    # everything the form needs is resolved, so validating it touches no database
+    form = OrderModelForm(data=request.POST, checkout=checkout)
+    if not form.is_valid():
+        for error in form.errors.values():
+            messages.error(request, error)
+        return back_to_form(request, slug)
+    order = form.save(commit=False)
+    order.customer = user if user.is_authenticated else None
+    # a repeated submission gets the order it already placed
+    order, _ = await submissions.aplace(order, nonce)
+    if order is None:
+        messages.error(request, "Buyurtmangiz qabul qilinmoqda")
+        return back_to_form(request, slug)
+    return await sync_to_async(render)(request, "apps/order/order-receive.html", {"order": order})
+
+
 class OrderListView(LoginRequiredMixin, ListView):
-    queryset = Order.objects.all().order_by("-created_at")
+    queryset = Order.objects.select_related('district__region').order_by("-created_at")
     template_name = 'apps/order/order-list.html'
     context_object_name = 'orders'
 
@@ -171,19 +247,16 @@ class OrderListView(LoginRequiredMixin, ListView):
         return query
 
 
-def wishlist_view(request, pk):
-    query = WishList.objects.filter(product_id=pk, user=request.user)
-    clicked = False
-    if not query.exists():
-        clicked = True
-        WishList.objects.create(user=request.user, product_id=pk)
-    else:
-        query.delete()
-    return JsonResponse({"clicked": clicked})
+async def wishlist_view(request, pk):
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({"error": "login required"}, status=401)
+    clicked, count = await sync_to_async(user.toggle_wishlist)(pk)
+    return JsonResponse({"clicked": clicked, "count": count})
 
 
-class WishListView(ListView):
-    queryset = WishList.objects.all()
+class WishListView(LoginRequiredMixin, ListView):
+    queryset = WishList.objects.select_related('product__category')
     template_name = 'apps/auth/wishlist.html'
     context_object_name = 'wishlist'
 
@@ -192,23 +265,29 @@ class WishListView(ListView):
         return query
 
 
-class MarketListView(ListView):
-    queryset = Product.objects.all()
+class MarketListView(AnonymousPageCacheMixin, CatalogPaginationMixin, ListView):
+    cache_name = 'market-list'
+    queryset = Product.objects.select_related('category')
     template_name = 'apps/market/market-list.html'
     context_object_name = 'products'
 
+    def get_keyset(self):
+        if self.request.GET.get("category_slug") == "top":
+            return '-order_count', '-id'
+        return super().get_keyset()
+
     def get_queryset(self):
         category_slug = self.request.GET.get("category_slug")
         query = super().get_queryset()
         if category_slug == "top":
-            query = query.annotate(order_count=Count("orders")).order_by('-order_count')
+            query = query.annotate(order_count=Count("orders"))
         elif category_slug:
             query = query.filter(category__slug=category_slug)
         return query
 
     def get_context_data(self, *args, **kwargs):
         data = super().get_context_data(*args, **kwargs)
-        data['categories'] = Category.objects.all()
+        data['categories'] = categories.get_categories()
         data['c_slug'] = self.request.GET.get('category_slug')
         return data
 
@@ -223,7 +302,7 @@ class ThreadCreateView(CreateView):
     def get_context_data(self, **kwargs):
         data = super().get_context_data(**kwargs)
         data['products'] = Product.objects.all()
-        data['categories'] = Category.objects.all()
+        data['categories'] = categories.get_categories()
         return data
 
     def form_valid(self, form):
@@ -248,19 +327,19 @@ class ThreadListView(LoginRequiredMixin, ListView):
         return query
 
 
-class ThreadDetailView(DetailView):
-    pk_url_kwarg = 'pk'
-    queryset = Thread.objects.all()
+class ThreadDetailView(View):
     template_name = 'apps/order/order-form.html'
-    context_object_name = 'thread'
 
-    def get_context_data(self, **kwargs):
-        data = super().get_context_data(**kwargs)
-        thread = data.get("thread")
-        thread.visit_count += 1
-        thread.save()
-        data['product'] = self.object.product
-        return data
+    async def get(self, request, pk):
+        try:
+            thread = await Thread.objects.select_related('product').aget(pk=pk)
+        except Thread.DoesNotExist:
+            raise Http404("Thread not found")
+        await visits.arecord_visit(request, thread)
+        context = {'thread': thread, 'product': thread.product,
+                   'order_token': submissions.issue_token(thread.product)}
+        # context processors and the base template touch request.user and the ORM
+        return await sync_to_async(render)(request, self.template_name, context)
 
 
 class StatisticListView(LoginRequiredMixin, ListView):
@@ -268,95 +347,44 @@ class StatisticListView(LoginRequiredMixin, ListView):
     template_name = 'apps/market/statistics.html'
     context_object_name = 'threads'
 
-    def get_queryset(self):
+    def get_period(self):
         period = self.request.GET.get('period')
-        now = datetime.now()
-        today_start = datetime(now.year, now.month, now.day, 0, 0, 0)
-        today_end = datetime(now.year, now.month, now.day, 23, 59, 59)
-
-        # Yesterday
-        yesterday_start = today_start - timedelta(days=1)
-        yesterday_end = today_end - timedelta(days=1)
-
-        # Weekly
-        week_start = today_start - timedelta(days=6)
-        week_end = today_end
-
-        # Monthly
-        month_start = today_start - timedelta(days=29)
-        month_end = today_end
-
-        # All time
-        all_start = datetime(2000, 1, 1, 0, 0, 0)
-        all_end = today_end
-
-        datetime_map = {
-            "today": [today_start, today_end],
-            "last_day": [yesterday_start, yesterday_end],
-            "wekly": [week_start, week_end],
-            "monthly": [month_start, month_end],
-            "all": [all_start, all_end]
+        today = timezone.localdate()
+        period_map = {
+            "today": (today, today),
+            "last_day": (today - timedelta(days=1), today - timedelta(days=1)),
+            "wekly": (today - timedelta(days=6), today),
+            "monthly": (today - timedelta(days=29), today),
+            "all": (None, today),
         }
-        filter_time = datetime_map.get(period)
-
-        query = Thread.objects.all().filter(owner=self.request.user).annotate(
-            new_count=Count('orders',
-                            filter=Q(orders__status=Order.StatusType.NEW) & Q(orders__updated_at__range=filter_time)),
-            ready_count=Count('orders', filter=Q(orders__status=Order.StatusType.READY_TO_DELIVERY) & Q(
-                orders__updated_at__range=filter_time)),
-            delivering_count=Count('orders', filter=Q(orders__status=Order.StatusType.DELIVERING) & Q(
-                orders__updated_at__range=filter_time)),
-            delivered_count=Count('orders', filter=Q(orders__status=Order.StatusType.DELIVERED) & Q(
-                orders__updated_at__range=filter_time)),
-            not_call_count=Count('orders', filter=Q(orders__status=Order.StatusType.NOT_CALL) & Q(
-                orders__updated_at__range=filter_time)),
-            canceled_count=Count('orders', filter=Q(orders__status=Order.StatusType.CANCELED) & Q(
-                orders__updated_at__range=filter_time)),
-            archived_count=Count('orders', filter=Q(orders__status=Order.StatusType.ARCHIVED) & Q(
-                orders__updated_at__range=filter_time)),
-        ).values("visit_count",
-                 "product__title",
-                 "name",
-                 "new_count",
-                 "ready_count",
-                 "delivering_count",
-                 "delivered_count",
-                 "not_call_count",
-                 "canceled_count",
-                 "archived_count",
-                 )
-        return query
+        return period_map.get(period, period_map['all'])
+
+    def get_queryset(self):
+        start, end = self.get_period()
+        threads, self.totals = stats.thread_statistics(
+            super().get_queryset().filter(owner=self.request.user), start, end)
+        return threads
 
     def get_context_data(self, *args, **kwargs):
-        tmp = self.get_queryset().aggregate(
-            visit_total=Sum('visit_count'),
-            new_total=Sum('new_count'),
-            ready_total=Sum('ready_count'),
-            delivering_total=Sum('delivering_count'),
-            not_call_total=Sum('not_call_count'),
-            delivered_total=Sum('delivered_count'),
-            canceled_total=Sum('canceled_count'),
-            archived_total=Sum('archived_count')
-        )
-        data = super().get_context_data()
-        data.update(tmp)
+        data = super().get_context_data(*args, **kwargs)
+        data.update(self.totals)
         return data
 
 
 class CompetitionListView(ListView):
-    queryset = User.objects.all()
     template_name = 'apps/market/competition.html'
     context_object_name = 'sellers'
+    top_limit = 100
 
     def get_queryset(self):
-        query = super().get_queryset().annotate(order_count=Count('threads__orders', filter=Q(
-            threads__orders__status=Order.StatusType.DELIVERED))).filter(order_count__gte=1).values(
-            "order_count", "first_name", "last_name")
-        return query
+        self.leaderboard = leaderboard.get_leaderboard()
+        return self.leaderboard.top(self.top_limit)
 
     def get_context_data(self, *args, **kwargs):
         data = super().get_context_data(*args, **kwargs)
-        data['site'] = SiteSettings.objects.first()
+        if self.request.user.is_authenticated:
+            data['my_rank'] = self.leaderboard.rank(self.request.user.pk)
+            data['my_count'] = self.leaderboard.count(self.request.user.pk)
         return data
 
 
@@ -376,10 +404,14 @@ class PaymentCreateView(LoginRequiredMixin, CreateView):
         return kwargs
 
     def form_valid(self, form):
-        user = self.request.user
-        user.balance -= form.instance.amount
-        user.save()
-        return super().form_valid(form)
+        try:
+            with transaction.atomic():
+                response = super().form_valid(form)
+                ledger.debit_payment(self.object)
+        except ledger.InsufficientBalance:
+            form.add_error('amount', "Mablag' yetarli emas !")
+            return self.form_invalid(form)
+        return response
 
     def form_invalid(self, form):
         for error in form.errors.values():
@@ -387,16 +419,19 @@ class PaymentCreateView(LoginRequiredMixin, CreateView):
         return super().form_invalid(form)
 
 
-class OperatorOrderListView(ListView):
-    queryset = Order.objects.all()
+class OperatorOrderListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
+    queryset = Order.objects.select_related('product', 'thread', 'district__region')
     template_name = 'apps/operator/operator-page.html'
     context_object_name = 'orders'
+    paginate_by = 20
 
     def get_context_data(self, *args, **kwargs):
         data = super().get_context_data(*args, **kwargs)
         data['status'] = Order.StatusType.values
-        data['categories'] = Category.objects.all()
-        data['regions'] = Region.objects.all()
+        data['categories'] = categories.get_categories()
+        tree = regions.get_tree()
+        data['regions'] = tree.regions
+        data['regions_version'] = tree.version
         data['operator_status'] = [Order.StatusType.NEW, Order.StatusType.CANCELED, Order.StatusType.ARCHIVED,
                                    Order.StatusType.NOT_CALL]
         data['deliver_status'] = [Order.StatusType.DELIVERING, Order.StatusType.READY_TO_DELIVERY,
@@ -407,26 +442,42 @@ class OperatorOrderListView(ListView):
             data['category_id'] = int(category_id)
         if district_id:
             data['district_id'] = int(district_id)
+            data['district'] = tree.district(data['district_id'])
+            data['district_region'] = tree.region_of(data['district_id'])
         return data
 
     def get_queryset(self):
         status = self.request.GET.get('status', 'new')
-        category_id = self.request.GET.get('category_id')
-        district_id = self.request.GET.get('district_id')
-        Order.objects.filter(operator=self.request.user).update(hold=False)
-        query = super().get_queryset()
-        if category_id:
-            query = Order.objects.filter(product__category_id=category_id)
-        if district_id:
-            query = Order.objects.filter(district_id=district_id)
-        if status != 'new' and self.request.user.role != User.RoleType.DELIVER:
+        query = order_queue.filter_orders(super().get_queryset(), self.request.GET)
+        if self.request.GET.get('held') == 'me':
+            query = query.filter(held_by=self.request.user, hold_until__gte=timezone.now())
+        elif status != 'new' and self.request.user.role != User.RoleType.DELIVER:
             query = query.filter(operator=self.request.user, status=status)
         else:
             query = query.filter(status=status)
-        return query
+        return order_queue.annotate_held(query, self.request.user)
+
+    def get_json_item(self, order):
+        return {'id': order.pk, 'status': order.status, 'total': order.total, 'held': order.held}
+
+
+class OrderClaimView(LoginRequiredMixin, View):
+    default_count = 5
+    max_count = 50
 
+    def post(self, request):
+        try:
+            count = max(1, min(int(request.POST.get('count', self.default_count)), self.max_count))
+        except ValueError:
+            count = self.default_count
+        query = order_queue.filter_orders(Order.objects.filter(status=Order.StatusType.NEW), request.POST)
+        orders = order_queue.claim_orders(request.user, count, query)
+        if request.GET.get('format') == 'json':
+            return JsonResponse({'claimed': list(orders.values_list('pk', flat=True))})
+        return redirect(f"{reverse('operator-orders')}?held=me")
 
-class OrderUpdateView(UpdateView):
+
+class OrderUpdateView(LoginRequiredMixin, UpdateView):
     queryset = Order.objects.all()
     template_name = 'apps/operator/order-change.html'
     context_object_name = 'order'
@@ -436,24 +487,38 @@ class OrderUpdateView(UpdateView):
 
     def form_valid(self, form):
         status = form.cleaned_data.get('status')
-        obj = self.get_object(self.queryset)
-        if obj.thread and status == Order.StatusType.DELIVERED:
-            seller = obj.thread.owner
-            seller.balance += (obj.thread.product.seller_price - obj.thread.discount) * obj.quantity
-            seller.save()
-        return super().form_valid(form)
+        try:
+            with transaction.atomic():
+                response = super().form_valid(form)
+                if self.object.thread and status == Order.StatusType.DELIVERED:
+                    ledger.credit_delivered_order(self.object)
+        except inventory.InsufficientStock:
+            form.add_error(None, "Product soni yetarli emas!")
+            return self.form_invalid(form)
+        order_queue.release_order(self.request.user, self.object.pk)
+        return response
 
     def get_context_data(self, **kwargs):
         data = super().get_context_data(**kwargs)
-        data['regions'] = Region.objects.all()
+        tree = regions.get_tree()
+        data['regions'] = tree.regions
+        data['regions_version'] = tree.version
+        data['order_district'] = tree.district(self.object.district_id)
+        data['order_region'] = tree.region(tree.region_of(self.object.district_id))
         data['operator'] = self.request.user
         return data
 
     def get(self, request, *args, **kwargs):
-        return_data = super().get(request, *args, **kwargs)
-        self.object.hold = True
-        self.object.save()
-        return return_data
+        if not order_queue.claim_order(request.user, kwargs.get(self.pk_url_kwarg)):
+            return redirect('operator-orders')
+        return super().get(request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        # only the operator holding the lease (taken when the form was opened) may change the order
+        if not order_queue.holds_lease(request.user, kwargs.get(self.pk_url_kwarg)):
+            messages.error(request, "Buyurtma sizga biriktirilmagan yoki band qilish muddati tugagan")
+            return redirect('operator-orders')
+        return super().post(request, *args, **kwargs)
 
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
@@ -471,18 +536,48 @@ class DiagramView(TemplateView):
     template_name = 'apps/order/diagram.html'  # to‘g‘ri joyini yozing
 
 
-# API JSON response
-def region_orders_data(request):
-    orders = Order.objects.values('district__region__name').annotate(count=Count('id')).order_by('-count')
+def parse_day(value):
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return day
+
 
+# API JSON response
+async def region_orders_data(request):
+    """Order counts per region from the daily rollup; filters: ``start``, ``end`` (YYYY-MM-DD) and ``status``."""
+    try:
+        start = parse_day(request.GET.get('start'))
+        end = parse_day(request.GET.get('end'))
+    except ValueError:
+        return JsonResponse({'error': "Sana YYYY-MM-DD ko'rinishida bo'lishi kerak"}, status=400)
+    statuses = [status for value in request.GET.getlist('status') for status in value.split(',') if status]
+    if set(statuses) - set(Order.StatusType.values):
+        return JsonResponse({'error': "Noma'lum status"}, status=400)
+
+    tree = await regions.aget_tree()
     response = {
         'regions': [],
         'numbers': []
     }
 
-    for item in orders:
-        region_name = item['district__region__name'] or "Nomaʼlum"
-        response['regions'].append(region_name)
-        response['numbers'].append(item['count'])
+    for region_id, count in await stats.aregion_statistics(start, end, statuses):
+        region = tree.region(region_id)
+        response['regions'].append(region.name if region else "Nomaʼlum")
+        response['numbers'].append(count)
 
     return JsonResponse(response)
+
+
+@staff_member_required
+def page_cache_stats_view(request):
+    return JsonResponse(page_cache.counters())
+
+
+def metrics_view(request):
+    allowed = getattr(settings, 'METRICS', {}).get('ALLOWED_IPS', ())
+    if not (request.user.is_staff or request.META.get('REMOTE_ADDR') in allowed):
+        raise Http404
+    return HttpResponse(metrics.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
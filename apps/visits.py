@@ -0,0 +1,144 @@
+import atexit
+import hashlib
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction, IntegrityError, close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from apps.models import Thread, ThreadDailyVisit
+from apps.throttle import client_ip
+
+logger = logging.getLogger(__name__)
+
+
+class VisitBuffer:
+    """
+    Collects thread visits in memory and writes them in batches from a
+    background thread, so a visit never waits on the database.
+
+    A flush issues one ``UPDATE ... SET visit_count = visit_count + n`` per
+    distinct ``n`` instead of one read-modify-write per click. Visits whose
+    writes failed are retried with the next flush, and dropped once
+    ``max_attempts`` flushes in a row have failed.
+    """
+
+    def __init__(self, flush_interval=5, flush_size=200, max_attempts=5):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_attempts = max_attempts
+        self.failures = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.worker = None
+        self.size = 0
+        self.visits = Counter()
+        self.daily = Counter()
+
+    def add(self, thread_id, unique=False):
+        day = timezone.localdate()
+        with self.lock:
+            self.visits[thread_id] += 1
+            self.daily[(thread_id, day, 'visits')] += 1
+            if unique:
+                self.daily[(thread_id, day, 'unique_visits')] += 1
+            self.size += 1
+            if self.size >= self.flush_size:
+                self.wakeup.set()
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run, name='visit-flusher', daemon=True)
+                self.worker.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing thread visits failed")
+            finally:
+                close_old_connections()
+
+    def pending(self, thread_id):
+        with self.lock:
+            return self.visits.get(thread_id, 0)
+
+    def drain(self):
+        with self.lock:
+            visits, daily = self.visits, self.daily
+            self.visits, self.daily = Counter(), Counter()
+            self.size = 0
+        return visits, daily
+
+    def flush(self):
+        visits, daily = self.drain()
+        if not visits:
+            return 0
+        by_increment = defaultdict(list)
+        for thread_id, count in visits.items():
+            by_increment[count].append(thread_id)
+        try:
+            with transaction.atomic():
+                for count, thread_ids in by_increment.items():
+                    Thread.objects.filter(pk__in=thread_ids).update(visit_count=F('visit_count') + count)
+                for (thread_id, day, field), count in daily.items():
+                    add_daily_visits(thread_id, day, field, count)
+        except Exception:
+            self.failures += 1
+            if self.failures >= self.max_attempts:
+                logger.error("Dropping %d thread visits after %d failed flushes", sum(visits.values()), self.failures)
+                self.failures = 0
+            else:
+                with self.lock:
+                    self.visits.update(visits)
+                    self.daily.update(daily)
+                    self.size += sum(visits.values())
+            raise
+        self.failures = 0
+        return sum(visits.values())
+
+
+def add_daily_visits(thread_id, day, field, count):
+    query = ThreadDailyVisit.objects.filter(thread_id=thread_id, date=day)
+    if query.update(**{field: F(field) + count}):
+        return
+    try:
+        with transaction.atomic():
+            ThreadDailyVisit.objects.create(thread_id=thread_id, date=day, **{field: count})
+    except IntegrityError:
+        query.update(**{field: F(field) + count})
+
+
+def visitor_key(request, user):
+    if user.is_authenticated:
+        return f'user:{user.pk}'
+    return f"{client_ip(request)}:{request.META.get('HTTP_USER_AGENT', '')}"
+
+
+def unique_visit_key(request, user, thread_id):
+    digest = hashlib.blake2b(visitor_key(request, user).encode(), digest_size=12).hexdigest()
+    return f'thread-visit:{thread_id}:{timezone.localdate().isoformat()}:{digest}'
+
+
+async def ais_unique_visit(request, thread_id):
+    key = unique_visit_key(request, await request.auser(), thread_id)
+    return await cache.aadd(key, 1, 60 * 60 * 24)
+
+
+config = getattr(settings, 'VISIT_COUNTER', {})
+buffer = VisitBuffer(
+    flush_interval=config.get('FLUSH_INTERVAL', 5),
+    flush_size=config.get('FLUSH_SIZE', 200),
+    max_attempts=config.get('MAX_ATTEMPTS', 5),
+)
+atexit.register(buffer.flush)
+
+
+async def arecord_visit(request, thread):
+    # buffer.add only touches memory, so it is safe to call from the event loop
+    buffer.add(thread.pk, unique=await ais_unique_visit(request, thread.pk))
@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/5.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
+import os
 from os.path import join
 from pathlib import Path
 
@@ -46,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'apps.metrics.MetricsMiddleware',
+    'apps.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -86,7 +89,7 @@ ROOT_URLCONF = 'root.urls'
 AUTH_USER_MODEL = "apps.User"
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'apps.metrics.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates']
         ,
         'APP_DIRS': True,
@@ -95,6 +98,9 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'apps.context_processors.site_settings',
+                'apps.context_processors.wishlist',
+                'apps.context_processors.catalog',
             ],
         },
     },
@@ -102,14 +108,63 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'root.wsgi.application'
 
+CACHES = {
+    'default': {
+        'BACKEND': 'apps.metrics.TimedLocMemCache',
+    },
+}
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Configured from the environment; without any DB_* variables this is db.sqlite3 next to manage.py.
+#   DB_ENGINE                  e.g. django.db.backends.postgresql (default: sqlite3)
+#   DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+#   DB_SQLITE_WAL=1            SQLite only: switch the file to WAL mode, so readers don't block the writer
+#                              (persistent: it rewrites the file header and adds -wal/-shm files next to it)
+#   DB_CONN_MAX_AGE            seconds a connection is kept between requests (default 60, 0 closes it)
+#   DB_POOL_MAX_SIZE           PostgreSQL with psycopg 3 only: use a connection pool of this size
+#                              (and DB_POOL_MIN_SIZE) instead of persistent connections
+#   DB_REPLICA_NAME / DB_REPLICA_HOST
+#                              adds the 'replica' alias read-heavy views read from (see REPLICA_ROUTING);
+#                              DB_REPLICA_USER, DB_REPLICA_PASSWORD, DB_REPLICA_PORT default to the primary's
+DB_ENGINE = os.environ.get('DB_ENGINE', 'django.db.backends.sqlite3')
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 0))
+
+
+def env_database(prefix, **defaults):
+    database = {key: os.environ.get(prefix + key, defaults.get(key, '')) for key in (
+        'NAME', 'USER', 'PASSWORD', 'HOST', 'PORT')}
+    database.update(ENGINE=DB_ENGINE, CONN_HEALTH_CHECKS=True,
+                    CONN_MAX_AGE=0 if DB_POOL_MAX_SIZE else int(os.environ.get('DB_CONN_MAX_AGE', 60)))
+    if DB_ENGINE == 'django.db.backends.sqlite3':
+        # writers queue for the lock instead of failing on upgrade
+        database['OPTIONS'] = {'transaction_mode': 'IMMEDIATE', 'timeout': 20}
+        if os.environ.get('DB_SQLITE_WAL'):
+            database['OPTIONS']['init_command'] = 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL'
+    elif DB_POOL_MAX_SIZE:
+        database['OPTIONS'] = {'pool': {'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+                                        'max_size': DB_POOL_MAX_SIZE}}
+    return database
+
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': env_database('DB_', NAME=BASE_DIR / 'db.sqlite3'),
+}
+if os.environ.get('DB_REPLICA_NAME') or os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = env_database('DB_REPLICA_', **DATABASES['default'])
+    # tests read the replica through the primary's connection
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['apps.replicas.ReplicaRouter']
+
+# Which views read from the 'replica' database (by URL name), and for how many seconds a client that
+# wrote something keeps reading from the primary, so it sees its own writes despite replication lag
+REPLICA_ROUTING = {
+    'ALIAS': 'replica',
+    'VIEWS': ['home', 'product-list', 'search', 'market-list', 'thread-statistic', 'thread-competition',
+              'diagram', 'region-orders-data'],
+    'PIN_SECONDS': 5,
 }
 
 # Password validation
@@ -168,3 +223,36 @@ CKEDITOR_CONFIGS = {
 }
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Thread visits are buffered per process and written in batches
+VISIT_COUNTER = {
+    'FLUSH_INTERVAL': 5,  # seconds
+    'FLUSH_SIZE': 200,  # pending visits
+    'MAX_ATTEMPTS': 5,  # failed flushes in a row before the pending visits are dropped
+}
+
+# Stock held for an order in 'ready to delivery' / 'delivering' is released after this (expire_reservations)
+STOCK_RESERVATION_HOURS = 7 * 24
+
+# Failed logins allowed per (limit, window in seconds) before further attempts are refused
+LOGIN_THROTTLE = {
+    'PHONE': (5, 15 * 60),
+    'IP': (20, 15 * 60),
+    'TRUST_X_FORWARDED_FOR': 0,  # proxies in front that append to X-Forwarded-For (True: one); 0 ignores it
+}
+
+# Order form submissions: how long a rendered form's token is accepted, how long a repeated
+# (phone, product, thread) gets the existing order back, and (limit, window in seconds) per phone / IP
+ORDER_SUBMISSIONS = {
+    'TOKEN_MAX_AGE': 24 * 60 * 60,
+    'WINDOW': 10 * 60,
+    'PHONE': (5, 60 * 60),
+    'IP': (30, 60 * 60),
+}
+
+# Per-view latency, SQL, template and cache metrics, scraped from /metrics
+METRICS = {
+    'RING_SIZE': 1000,  # recent requests kept for the metrics_report command
+    'SNAPSHOT_INTERVAL': 60,  # seconds between writes of the ring buffer to SNAPSHOT_DIR
+    'ALLOWED_IPS': ['127.0.0.1'],  # scrapers allowed without a staff login
+}